@@ -3,4 +3,4 @@ Agents package for AI-powered analysis
 """
 
 from .face_scan_agent import FaceScanAgent, face_scan_agent
-from .langgraph_workflow import run_face_analysis_pipeline
+from .langgraph_workflow import run_face_analysis_pipeline, execute_face_analysis
@@ -5,7 +5,8 @@ High-level interface for face analysis
 
 from typing import Optional
 from models.scan import ScanAnalysis
-from agents.langgraph_workflow import run_face_analysis_pipeline
+from agents.langgraph_workflow import execute_face_analysis, pipeline_version
+from services.analysis_cache import analysis_cache
 
 
 class FaceScanAgent:
@@ -19,20 +20,34 @@ class FaceScanAgent:
         self,
         front_image: bytes,
         left_image: bytes,
-        right_image: bytes
+        right_image: bytes,
+        scan_id: Optional[str] = None
     ) -> ScanAnalysis:
         """
-        Analyze face images and return comprehensive results
+        Analyze face images and return comprehensive results.
+        Identical image sets are served from the analysis cache.
         
         Args:
             front_image: Front-facing photo bytes
             left_image: Left profile photo bytes
             right_image: Right profile photo bytes
+            scan_id: Scan being analyzed - enables checkpoint/resume
             
         Returns:
             ScanAnalysis with all metrics, improvements, and recommendations
         """
-        return await run_face_analysis_pipeline(front_image, left_image, right_image)
+        cache_key = analysis_cache.make_key(front_image, left_image, right_image, pipeline_version())
+        cached = await analysis_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        analysis, error = await execute_face_analysis(front_image, left_image, right_image, scan_id=scan_id)
+        
+        # Only cache clean runs - fallbacks should be retried
+        if error is None:
+            await analysis_cache.set(cache_key, analysis)
+        
+        return analysis
 
 
 # Singleton instance
@@ -0,0 +1,116 @@
+"""
+Graph Executor - Minimal dependency-graph runner over GraphState
+Nodes declare the state keys they read and write; a node becomes ready once
+every other node producing one of its inputs has finished. Ready nodes run
+concurrently with asyncio.gather and only their declared outputs are merged
+back into the shared state.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+from services.metrics import metrics
+
+
+class GraphNode:
+    """A pipeline step with declared state inputs and outputs"""
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[dict], Awaitable[dict]],
+        inputs: Iterable[str] = (),
+        outputs: Iterable[str] = ()
+    ):
+        self.name = name
+        self.fn = fn
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+
+    def __repr__(self) -> str:
+        return f"GraphNode({self.name!r})"
+
+
+class GraphExecutor:
+    """Runs GraphNodes in dependency order, independent nodes in parallel"""
+
+    # Keys any node may write without declaring them
+    SHARED_OUTPUTS = ("error",)
+
+    def __init__(self, nodes: List[GraphNode]):
+        self.nodes = list(nodes)
+        self.dependencies = self._resolve_dependencies()
+        self.levels = self._build_levels()
+
+    def _resolve_dependencies(self) -> Dict[str, Set[str]]:
+        """Map each node name to the names of the nodes producing its inputs"""
+        names = [node.name for node in self.nodes]
+        if len(set(names)) != len(names):
+            raise ValueError("Duplicate node names in graph")
+
+        dependencies = {}
+        for node in self.nodes:
+            dependencies[node.name] = {
+                other.name for other in self.nodes
+                if other is not node and set(node.inputs) & set(other.outputs)
+            }
+        return dependencies
+
+    def _build_levels(self) -> List[List[GraphNode]]:
+        """Group nodes into levels that can run concurrently"""
+        done: Set[str] = set()
+        remaining = list(self.nodes)
+        levels = []
+        while remaining:
+            ready = [node for node in remaining if self.dependencies[node.name] <= done]
+            if not ready:
+                raise ValueError(f"Cycle in graph between: {[node.name for node in remaining]}")
+            levels.append(ready)
+            done.update(node.name for node in ready)
+            remaining = [node for node in remaining if node.name not in done]
+        return levels
+
+    async def _run_node(self, node: GraphNode, state: dict) -> dict:
+        """Run one node inside a timing span"""
+        with metrics.span(f"pipeline/{node.name}"):
+            return await node.fn(state)
+
+    async def run(
+        self,
+        state: dict,
+        completed: Iterable[str] = (),
+        on_level_complete: Optional[Callable[[dict, Set[str]], Awaitable[None]]] = None,
+        on_node_complete: Optional[Callable[[str, dict], None]] = None
+    ) -> dict:
+        """
+        Execute the graph and return the final state.
+
+        Nodes named in `completed` are skipped (their outputs must already be in
+        state). A node counts as completed when it returned no error and every
+        node it depends on completed too; `on_level_complete(state, completed)`
+        is awaited after each level so progress can be checkpointed, and
+        `on_node_complete(name, state)` is called as each node's outputs merge.
+        """
+        state = dict(state)
+        completed = set(completed)
+        for level in self.levels:
+            pending = [node for node in level if node.name not in completed]
+            if not pending:
+                continue
+
+            # Each node sees error=None so any error it returns is its own
+            results = await asyncio.gather(*(self._run_node(node, {**state, "error": None}) for node in pending))
+            for node, result in zip(pending, results):
+                for key in node.outputs:
+                    if key in result:
+                        state[key] = result[key]
+                for key in self.SHARED_OUTPUTS:
+                    if result.get(key) is not None:
+                        state[key] = result[key]
+                if result.get("error") is None and self.dependencies[node.name] <= completed:
+                    completed.add(node.name)
+                if on_node_complete is not None:
+                    on_node_complete(node.name, state)
+
+            if on_level_complete is not None:
+                await on_level_complete(state, set(completed))
+        return state
@@ -0,0 +1,97 @@
+"""
+Image Preprocessing - Normalize scan photos before they are sent to Gemini
+Decodes, applies EXIF orientation, strips metadata, downsizes to a
+configurable long edge and re-encodes once as JPEG. Runs in a process pool
+so decoding large phone photos never blocks the event loop. The same pool
+renders the smaller display renditions (derivatives) of uploaded photos.
+"""
+
+import asyncio
+import io
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+from PIL import Image, ImageOps
+from config import settings
+
+
+NORMALIZED_MIME_TYPE = "image/jpeg"
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def normalize_image(image_data: bytes, max_edge: int, quality: int) -> bytes:
+    """
+    Decode, orient, downsize and re-encode one image as metadata-free JPEG.
+    Returns the original bytes if the payload cannot be decoded.
+    """
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            if max(image.size) > max_edge:
+                image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+            # Saving a fresh RGB image without exif/icc drops all metadata
+            output = io.BytesIO()
+            image.save(output, format="JPEG", quality=quality, optimize=True)
+            return output.getvalue()
+    except Exception as e:
+        print(f"Image normalization failed, using original bytes: {e}")
+        return image_data
+
+
+def render_derivatives(image_data: bytes, sizes: Dict[str, int], webp_quality: int, jpeg_quality: int) -> Dict[str, dict]:
+    """
+    Decode once, then produce a WebP and a JPEG rendition per size.
+    Returns {size_name: {"width", "height", "webp": bytes, "jpeg": bytes}}, largest
+    size first; sizes at or above the original's long edge are rendered at
+    the original size.
+    """
+    renditions = {}
+    with Image.open(io.BytesIO(image_data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        # Each size is resized from the previous, larger one - cheaper than from the original
+        for name, max_edge in sorted(sizes.items(), key=lambda item: -item[1]):
+            if max(image.size) > max_edge:
+                image = image.copy()
+                image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            webp, jpeg = io.BytesIO(), io.BytesIO()
+            image.save(webp, format="WEBP", quality=webp_quality, method=4)
+            image.save(jpeg, format="JPEG", quality=jpeg_quality, optimize=True, progressive=True)
+            renditions[name] = {
+                "width": image.width,
+                "height": image.height,
+                "webp": webp.getvalue(),
+                "jpeg": jpeg.getvalue()
+            }
+    return renditions
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Lazily create the shared preprocessing process pool"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.image_preprocess_workers)
+    return _pool
+
+
+def shutdown_pool() -> None:
+    """Shut down the preprocessing pool (application shutdown)"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def normalize_images(front_image: bytes, left_image: bytes, right_image: bytes) -> Tuple[bytes, bytes, bytes]:
+    """Normalize the three scan images concurrently in the process pool"""
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    front, left, right = await asyncio.gather(*(
+        loop.run_in_executor(pool, normalize_image, image, settings.image_max_edge, settings.image_jpeg_quality)
+        for image in (front_image, left_image, right_image)
+    ))
+    return front, left, right
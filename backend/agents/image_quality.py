@@ -0,0 +1,134 @@
+"""
+Image Quality - Deterministic local quality gate for scan photos
+Scores blur (Laplacian variance), exposure, contrast and resolution with
+vectorized NumPy ops on a downscaled copy, plus a basic skin-tone check on
+the face region. Bad scans are rejected before any paid LLM call.
+"""
+
+import io
+from typing import List, Tuple
+import numpy as np
+from PIL import Image
+from config import settings
+
+
+# Analysis is done on a small copy - plenty for global quality statistics
+ANALYSIS_EDGE = 512
+
+# Component weights for the 0-10 quality score
+WEIGHTS = {"sharpness": 0.35, "exposure": 0.25, "contrast": 0.15, "resolution": 0.25}
+
+
+class ImageQualityError(ValueError):
+    """Raised when scan photos fail the quality gate - not retryable"""
+    retryable = False
+
+    def __init__(self, issues: List[str]):
+        self.issues = issues
+        super().__init__("Image quality check failed: " + "; ".join(issues))
+
+
+def _load(image_data: bytes) -> Tuple[np.ndarray, np.ndarray, Tuple[int, int]]:
+    """Decode to downscaled luma and chroma arrays; returns (y, cbcr, original_size)"""
+    with Image.open(io.BytesIO(image_data)) as image:
+        original_size = image.size
+        # JPEG draft mode decodes at reduced DCT scale directly - much cheaper
+        # than a full decode; other formats fall back to an integer box reduce
+        image.draft("YCbCr", (ANALYSIS_EDGE // 2, ANALYSIS_EDGE // 2))
+        image = image.convert("YCbCr")
+        factor = max(image.size) // ANALYSIS_EDGE
+        if factor > 1:
+            image = image.reduce(factor)
+        ycbcr = np.asarray(image, dtype=np.float32)
+    return ycbcr[..., 0], ycbcr[..., 1:], original_size
+
+
+def _laplacian_variance(gray: np.ndarray) -> float:
+    """Variance of the 4-neighbour Laplacian - low values mean blur"""
+    lap = (
+        gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+        - 4.0 * gray[1:-1, 1:-1]
+    )
+    return float(lap.var())
+
+
+def _skin_fraction(cbcr: np.ndarray) -> float:
+    """Fraction of skin-tone pixels in the central face region (YCbCr box rule)"""
+    h, w = cbcr.shape[:2]
+    region = cbcr[h // 5: h - h // 5, w // 4: w - w // 4]
+    cb, cr = region[..., 0], region[..., 1]
+    skin = (cb >= 77) & (cb <= 127) & (cr >= 133) & (cr <= 173)
+    return float(skin.mean()) if skin.size else 0.0
+
+
+def assess_image(image_data: bytes, label: str = "image") -> dict:
+    """
+    Score one image.
+    Returns dict with quality (0-10), face_detected, component scores and issues.
+    """
+    try:
+        gray, cbcr, (width, height) = _load(image_data)
+    except Exception:
+        return {"quality": 0.0, "face_detected": False, "issues": [f"{label}: could not decode image"]}
+
+    sharpness_raw = _laplacian_variance(gray)
+    brightness = float(gray.mean())
+    contrast_raw = float(gray.std())
+    clipped = float(((gray < 8) | (gray > 247)).mean())
+    skin = _skin_fraction(cbcr)
+
+    scores = np.clip(np.array([
+        (sharpness_raw - 20.0) / 280.0 * 10.0,
+        10.0 - abs(brightness - 128.0) / 128.0 * 15.0 - clipped * 20.0,
+        contrast_raw / 60.0 * 10.0,
+        min(width, height) / settings.image_min_edge * 10.0,
+    ]), 0.0, 10.0)
+    components = dict(zip(WEIGHTS, scores.tolist()))
+    quality = float(np.dot(scores, np.array(list(WEIGHTS.values()))))
+
+    face_detected = skin >= settings.image_min_skin_fraction
+    issues = []
+    if components["sharpness"] < 4:
+        issues.append(f"{label}: image is blurry")
+    if brightness < 60:
+        issues.append(f"{label}: image is too dark")
+    elif brightness > 200:
+        issues.append(f"{label}: image is overexposed")
+    if components["contrast"] < 3:
+        issues.append(f"{label}: low contrast")
+    if components["resolution"] < 5:
+        issues.append(f"{label}: resolution too low ({width}x{height})")
+    if not face_detected:
+        issues.append(f"{label}: no face found in frame")
+        quality = min(quality, 4.0)
+
+    return {
+        "quality": round(quality, 1),
+        "face_detected": face_detected,
+        "components": {k: round(v, 1) for k, v in components.items()},
+        "issues": issues
+    }
+
+
+def assess_images(front_image: bytes, left_image: bytes, right_image: bytes) -> dict:
+    """Assess all three scan photos - shaped like ImageValidationResult"""
+    front = assess_image(front_image, "front")
+    left = assess_image(left_image, "left")
+    right = assess_image(right_image, "right")
+
+    results = (front, left, right)
+    is_valid = all(
+        r["face_detected"] and r["quality"] >= settings.image_min_quality
+        for r in results
+    )
+
+    return {
+        "is_valid": is_valid,
+        "front_quality": front["quality"],
+        "left_quality": left["quality"],
+        "right_quality": right["quality"],
+        "face_detected_front": front["face_detected"],
+        "face_detected_left": left["face_detected"],
+        "face_detected_right": right["face_detected"],
+        "issues": [issue for r in results for issue in r["issues"]]
+    }
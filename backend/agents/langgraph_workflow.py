@@ -4,21 +4,27 @@ Multi-step agent pipeline with structured outputs and fallbacks
 Compatible with langgraph 0.0.26
 """
 
-from typing import TypedDict, Optional, List
-import google.generativeai as genai
+from typing import TypedDict, Optional, List, Tuple
 from pydantic import BaseModel, Field
 from config import settings
-from models.scan import (
-    ScanAnalysis, FaceMetrics, ImprovementSuggestion, ImprovementPriority,
-    JawlineMetrics, CheekbonesMetrics, EyeAreaMetrics, NoseMetrics,
-    LipsMetrics, ForeheadMetrics, SkinMetrics, FacialProportions,
-    ProfileMetrics, HairMetrics, BodyFatIndicators
-)
-import json
+from models.scan import ScanAnalysis, FaceMetrics, ImprovementSuggestion, ImprovementPriority
+from models.fast_construct import build_face_metrics
+import google.generativeai as genai
+from services.llm_client import llm_client, response_schema_for
+from services.llm_resilience import LLMUnavailableError
+from services.pipeline_checkpoints import checkpoint_store
+from services.metrics import metrics
+from services.scan_events import scan_events
+from services.json_extraction import extract_json_checked
+from services.course_index import course_index
+from agents.graph_executor import GraphNode, GraphExecutor
+from agents.image_preprocessing import normalize_images, NORMALIZED_MIME_TYPE
+from agents.image_quality import assess_images, ImageQualityError
+import asyncio
 
 
-# Configure Gemini
-genai.configure(api_key=settings.gemini_api_key)
+# Bump whenever prompts or pipeline output change - invalidates cached results
+PROMPT_VERSION = "3"
 
 
 # ============================================
@@ -46,52 +52,45 @@ class GraphState(TypedDict):
     face_metrics: Optional[dict]
     improvements: Optional[list]
     course_mappings: Optional[list]
+    summary: Optional[dict]
     analysis: Optional[dict]
     error: Optional[str]
-    retry_count: int
+
+
+class SingleShotAnalysis(BaseModel):
+    """Response schema for the single-shot analysis mode"""
+    metrics: FaceMetrics
+    improvements: List[ImprovementSuggestion] = Field(default_factory=list)
+    top_strengths: List[str] = Field(default_factory=list)
+    focus_areas: List[str] = Field(default_factory=list)
+    personalized_summary: str = ""
+    estimated_potential: float = Field(ge=0, le=10)
 
 
 # ============================================
 # ANALYSIS FUNCTIONS
 # ============================================
 
-async def validate_images(state: GraphState) -> GraphState:
-    """Step 1: Validate image quality and detect faces"""
-    try:
-        model = genai.GenerativeModel(settings.gemini_model)
-        
-        validation_prompt = """Analyze these three face photos and validate them.
-For each image assess: face visibility and image quality (0-10).
+def repaired_error(step: str, repaired: bool) -> Optional[str]:
+    """
+    Step error for a reply that only parsed after repair: the result is used,
+    but the run is not clean, so it is neither cached nor checkpointed as done
+    """
+    return f"{step} response was truncated and repaired" if repaired else None
 
-Return JSON:
-{"is_valid": true, "front_quality": 8, "left_quality": 7, "right_quality": 7, "issues": []}
 
-ONLY return JSON, no other text."""
-        
-        response = model.generate_content([
-            validation_prompt,
-            {"mime_type": "image/jpeg", "data": state["front_image"]},
-            {"mime_type": "image/jpeg", "data": state["left_image"]},
-            {"mime_type": "image/jpeg", "data": state["right_image"]},
-        ])
-        
-        text = response.text.strip()
-        if text.startswith("```"):
-            text = text.split("```")[1].replace("json", "").strip()
-        
-        validation_data = json.loads(text)
-        return {**state, "validation_result": validation_data, "error": None}
-        
-    except Exception as e:
-        fallback_result = {"is_valid": True, "front_quality": 7.0, "left_quality": 7.0, "right_quality": 7.0, "issues": []}
-        return {**state, "validation_result": fallback_result, "error": str(e)}
+async def validate_images(state: GraphState) -> GraphState:
+    """Step 1: Validate image quality and detect faces (local, no LLM call)"""
+    validation = await asyncio.to_thread(
+        assess_images, state["front_image"], state["left_image"], state["right_image"]
+    )
+    validation_data = ImageValidationResult(**validation).model_dump()
+    return {**state, "validation_result": validation_data}
 
 
 async def analyze_face_metrics(state: GraphState) -> GraphState:
     """Step 2: Detailed face analysis"""
     try:
-        model = genai.GenerativeModel(settings.gemini_model)
-        
         analysis_prompt = """You are an expert facial aesthetics analyst. Analyze these photos comprehensively.
 
 Provide scores 0-10 for ALL metrics. Return a complete JSON with this structure:
@@ -114,34 +113,41 @@ Provide scores 0-10 for ALL metrics. Return a complete JSON with this structure:
 
 Be thorough and honest. ONLY return JSON, no markdown or explanations."""
 
-        response = model.generate_content([
+        response = await llm_client.generate([
             analysis_prompt,
-            {"mime_type": "image/jpeg", "data": state["front_image"]},
-            {"mime_type": "image/jpeg", "data": state["left_image"]},
-            {"mime_type": "image/jpeg", "data": state["right_image"]},
-        ])
-        
-        text = response.text.strip()
-        if text.startswith("```"):
-            text = text.split("```")[1].replace("json", "").strip()
-        
-        metrics_data = json.loads(text)
+            {"mime_type": NORMALIZED_MIME_TYPE, "data": state["front_image"]},
+            {"mime_type": NORMALIZED_MIME_TYPE, "data": state["left_image"]},
+            {"mime_type": NORMALIZED_MIME_TYPE, "data": state["right_image"]},
+        ], call_name="analyze_face_metrics")
         
-        # Add image quality from validation
-        validation = state.get("validation_result", {})
-        metrics_data["image_quality_front"] = validation.get("front_quality", 7.0)
-        metrics_data["image_quality_left"] = validation.get("left_quality", 7.0)
-        metrics_data["image_quality_right"] = validation.get("right_quality", 7.0)
+        metrics_data, repaired = extract_json_checked(response.text, expect=dict)
         
-        return {**state, "face_metrics": metrics_data, "error": None}
+        return {**state, "face_metrics": metrics_data, "error": repaired_error("analyze_face_metrics", repaired)}
         
+    except LLMUnavailableError:
+        # Upstream is down - fail the run so the job is retried later
+        raise
     except Exception as e:
-        retry_count = state.get("retry_count", 0)
-        if retry_count < 2:
-            return {**state, "error": str(e), "retry_count": retry_count + 1}
+        # Transient errors were already retried by llm_client
         return {**state, "face_metrics": create_default_metrics_dict(), "error": f"Analysis failed: {e}"}
 
 
+async def merge_image_quality(state: GraphState) -> GraphState:
+    """Step 2b: Merge image quality from validation into the face metrics"""
+    metrics = state.get("face_metrics")
+    if not metrics:
+        return state
+    
+    validation = state.get("validation_result") or {}
+    metrics = {
+        **metrics,
+        "image_quality_front": validation.get("front_quality", 7.0),
+        "image_quality_left": validation.get("left_quality", 7.0),
+        "image_quality_right": validation.get("right_quality", 7.0),
+    }
+    return {**state, "face_metrics": metrics}
+
+
 async def generate_improvements(state: GraphState) -> GraphState:
     """Step 3: Generate improvement suggestions"""
     try:
@@ -149,8 +155,6 @@ async def generate_improvements(state: GraphState) -> GraphState:
         if not metrics:
             return {**state, "improvements": [], "error": "No metrics available"}
         
-        model = genai.GenerativeModel(settings.gemini_model)
-        
         improvement_prompt = f"""Based on face analysis with overall score {metrics.get('overall_score', 5)}/10, generate improvement suggestions.
 
 Return JSON array:
@@ -158,45 +162,85 @@ Return JSON array:
 
 Focus on areas with scores below 7. ONLY return JSON array."""
 
-        response = model.generate_content(improvement_prompt)
+        response = await llm_client.generate(improvement_prompt, call_name="generate_improvements")
         
-        text = response.text.strip()
-        if text.startswith("```"):
-            text = text.split("```")[1].replace("json", "").strip()
-        
-        improvements = json.loads(text)
-        return {**state, "improvements": improvements, "error": None}
+        improvements, repaired = extract_json_checked(response.text, expect=list)
+        return {**state, "improvements": improvements, "error": repaired_error("generate_improvements", repaired)}
         
+    except LLMUnavailableError:
+        # Upstream is down - fail the run so the job is retried later
+        raise
     except Exception as e:
         return {**state, "improvements": [], "error": str(e)}
 
 
 async def map_to_courses(state: GraphState) -> GraphState:
-    """Step 4: Map improvements to courses"""
+    """Step 4: Recommend courses from the metrics and improvement areas"""
     try:
-        improvements = state.get("improvements", [])
-        
-        course_map = {
-            "jawline": "jawline-mastery",
-            "jaw": "jawline-mastery",
-            "skin": "skincare-essentials",
-            "fat": "fat-loss-for-face",
-            "body": "fat-loss-for-face",
-            "hair": "hair-optimization",
-            "posture": "posture-correction",
-        }
+        recommended = await course_index.recommend(
+            state.get("face_metrics") or {},
+            state.get("improvements") or []
+        )
+        # Recommendations from a stale or empty index must not be cached as a clean result
+        error = f"Course index refresh failed: {course_index.refresh_error}" if course_index.refresh_error else None
+        return {**state, "course_mappings": recommended, "error": error}
         
-        recommended = set()
-        for imp in improvements:
-            area_lower = imp.get("area", "").lower()
-            for keyword, course in course_map.items():
-                if keyword in area_lower:
-                    recommended.add(course)
+    except Exception as e:
+        return {**state, "course_mappings": [], "error": str(e)}
+
+
+SINGLE_SHOT_PROMPT = """You are an expert facial aesthetics analyst. Analyze these three photos (front, left profile, right profile) comprehensively.
+
+Return one JSON object matching the response schema:
+- metrics: scores 0-10 for ALL facial metrics (confidence_score is 0-1)
+- improvements: suggestions for areas scoring below 7, each with area, priority (high/medium/low), current_score, potential_score, suggestion, exercises, products and timeframe
+- top_strengths and focus_areas: up to 5 short phrases each
+- personalized_summary: 2-3 sentences addressed to the user
+- estimated_potential: realistic score (0-10) reachable with the improvements
+
+Be thorough and honest. Do not make medical claims."""
+
+
+async def analyze_single_shot(state: GraphState) -> GraphState:
+    """Single-shot mode: metrics, improvements and summary in one schema-constrained call"""
+    try:
+        response = await llm_client.generate(
+            [
+                SINGLE_SHOT_PROMPT,
+                {"mime_type": NORMALIZED_MIME_TYPE, "data": state["front_image"]},
+                {"mime_type": NORMALIZED_MIME_TYPE, "data": state["left_image"]},
+                {"mime_type": NORMALIZED_MIME_TYPE, "data": state["right_image"]},
+            ],
+            call_name="analyze_single_shot",
+            generation_config=SINGLE_SHOT_CONFIG
+        )
         
-        return {**state, "course_mappings": list(recommended)}
+        result, repaired = extract_json_checked(response.text, expect=dict)
+        summary = {
+            "top_strengths": result.get("top_strengths", []),
+            "focus_areas": result.get("focus_areas", []),
+            "personalized_summary": result.get("personalized_summary", ""),
+            "estimated_potential": result.get("estimated_potential"),
+        }
+        error = repaired_error("analyze_single_shot", repaired)
+        metrics = result.get("metrics")
+        if not metrics:
+            # Default scores are a fallback, not a result - keep the run out of the cache
+            metrics = create_default_metrics_dict()
+            error = "analyze_single_shot response had no metrics"
+        return {
+            **state,
+            "face_metrics": metrics,
+            "improvements": result.get("improvements", []),
+            "summary": summary,
+            "error": error
+        }
         
+    except LLMUnavailableError:
+        # Upstream is down - fail the run so the job is retried later
+        raise
     except Exception as e:
-        return {**state, "course_mappings": [], "error": str(e)}
+        return {**state, "face_metrics": create_default_metrics_dict(), "improvements": [], "error": f"Analysis failed: {e}"}
 
 
 async def compile_analysis(state: GraphState) -> GraphState:
@@ -225,6 +269,15 @@ async def compile_analysis(state: GraphState) -> GraphState:
         
         overall = metrics.get("overall_score", 5)
         potential = min(10.0, overall + len(focus_areas) * 0.5)
+        personalized_summary = f"Your overall score is {overall}/10. With consistent effort on your focus areas, you could reach {potential:.1f}/10."
+        
+        # Prefer the model's own summary when the single-shot mode produced one
+        summary = state.get("summary") or {}
+        strengths = summary.get("top_strengths") or strengths
+        focus_areas = summary.get("focus_areas") or focus_areas
+        personalized_summary = summary.get("personalized_summary") or personalized_summary
+        if summary.get("estimated_potential") is not None:
+            potential = min(10.0, max(0.0, float(summary["estimated_potential"])))
         
         analysis = {
             "metrics": metrics,
@@ -232,7 +285,7 @@ async def compile_analysis(state: GraphState) -> GraphState:
             "top_strengths": strengths[:5],
             "focus_areas": focus_areas[:5],
             "recommended_courses": courses,
-            "personalized_summary": f"Your overall score is {overall}/10. With consistent effort on your focus areas, you could reach {potential:.1f}/10.",
+            "personalized_summary": personalized_summary,
             "estimated_potential": potential
         }
         
@@ -265,12 +318,90 @@ def create_default_metrics_dict() -> dict:
     }
 
 
+# ============================================
+# PIPELINE GRAPH
+# ============================================
+# validate_images runs before the graph as a local quality gate; quality
+# scores are merged into the LLM metrics once they are available.
+
+IMAGE_KEYS = ("front_image", "left_image", "right_image")
+
+SINGLE_SHOT_CONFIG = genai.GenerationConfig(
+    response_mime_type="application/json",
+    response_schema=response_schema_for(SingleShotAnalysis)
+)
+
+# multi_step: separate metrics and improvements calls
+PIPELINE_GRAPH = GraphExecutor([
+    GraphNode("analyze_face_metrics", analyze_face_metrics, inputs=IMAGE_KEYS, outputs=("face_metrics",)),
+    GraphNode("merge_image_quality", merge_image_quality, inputs=("face_metrics", "validation_result"), outputs=("face_metrics",)),
+    GraphNode("generate_improvements", generate_improvements, inputs=("face_metrics",), outputs=("improvements",)),
+    GraphNode("map_to_courses", map_to_courses, inputs=("face_metrics", "improvements"), outputs=("course_mappings",)),
+    GraphNode("compile_analysis", compile_analysis, inputs=("face_metrics", "improvements", "course_mappings"), outputs=("analysis",)),
+])
+
+# single_shot: one schema-constrained call, course mapping and compilation stay local
+SINGLE_SHOT_GRAPH = GraphExecutor([
+    GraphNode("analyze_single_shot", analyze_single_shot, inputs=IMAGE_KEYS, outputs=("face_metrics", "improvements", "summary")),
+    GraphNode("merge_image_quality", merge_image_quality, inputs=("face_metrics", "validation_result"), outputs=("face_metrics",)),
+    GraphNode("map_to_courses", map_to_courses, inputs=("face_metrics", "improvements"), outputs=("course_mappings",)),
+    GraphNode("compile_analysis", compile_analysis, inputs=("face_metrics", "improvements", "course_mappings", "summary"), outputs=("analysis",)),
+])
+
+PIPELINE_MODES = {
+    "multi_step": PIPELINE_GRAPH,
+    "single_shot": SINGLE_SHOT_GRAPH,
+}
+
+
+def get_pipeline_mode(mode: Optional[str] = None) -> str:
+    """Resolve the pipeline mode, defaulting to settings"""
+    mode = mode or settings.analysis_pipeline_mode
+    if mode not in PIPELINE_MODES:
+        raise ValueError(f"Unknown analysis pipeline mode: {mode}")
+    return mode
+
+
+def pipeline_version(mode: Optional[str] = None) -> str:
+    """Version tag for cached results - prompt version plus pipeline mode"""
+    return f"{PROMPT_VERSION}:{get_pipeline_mode(mode)}"
+
+
+def checkpoint_version(mode: Optional[str] = None) -> str:
+    """Version tag for checkpoints - stale when prompts, mode or model change"""
+    return f"{pipeline_version(mode)}:{settings.gemini_model}"
+
+
 # ============================================
 # SIMPLE PIPELINE (No LangGraph dependency issues)
 # ============================================
 
 async def run_face_analysis_pipeline(front_image: bytes, left_image: bytes, right_image: bytes) -> ScanAnalysis:
     """Run the complete face analysis pipeline"""
+    analysis, _ = await execute_face_analysis(front_image, left_image, right_image)
+    return analysis
+
+
+async def execute_face_analysis(
+    front_image: bytes,
+    left_image: bytes,
+    right_image: bytes,
+    mode: Optional[str] = None,
+    scan_id: Optional[str] = None
+) -> Tuple[ScanAnalysis, Optional[str]]:
+    """
+    Run the pipeline and report whether any step fell back.
+    Returns (analysis, error) - error is None only for a clean run.
+    
+    With a scan_id, progress is checkpointed after every step and a previous
+    incomplete run for the same pipeline version is resumed.
+    """
+    graph = PIPELINE_MODES[get_pipeline_mode(mode)]
+    version = checkpoint_version(mode)
+    
+    # Decode and shrink once; every step reuses the compact JPEG bytes
+    with metrics.span("pipeline/normalize_images"):
+        front_image, left_image, right_image = await normalize_images(front_image, left_image, right_image)
     
     state: GraphState = {
         "front_image": front_image,
@@ -280,23 +411,46 @@ async def run_face_analysis_pipeline(front_image: bytes, left_image: bytes, righ
         "face_metrics": None,
         "improvements": None,
         "course_mappings": None,
+        "summary": None,
         "analysis": None,
-        "error": None,
-        "retry_count": 0
+        "error": None
     }
     
-    # Run pipeline steps
-    state = await validate_images(state)
-    state = await analyze_face_metrics(state)
-    state = await generate_improvements(state)
-    state = await map_to_courses(state)
-    state = await compile_analysis(state)
+    # Reject unusable photos before any paid LLM call
+    with metrics.span("pipeline/validate_images"):
+        state = await validate_images(state)
+    if not state["validation_result"]["is_valid"]:
+        raise ImageQualityError(state["validation_result"]["issues"] or ["Photos did not pass the quality check"])
+    
+    # Resume from the last checkpoint, skipping steps that already succeeded
+    completed = []
+    checkpoint = await checkpoint_store.load(scan_id, version) if scan_id else None
+    if checkpoint:
+        state = {**state, **checkpoint.get("state", {}), "error": None}
+        completed = checkpoint.get("completed_steps", [])
+    
+    async def save_checkpoint(current: dict, done: set) -> None:
+        await checkpoint_store.save(scan_id, version, current, done)
+    
+    def publish_step(name: str, current: dict) -> None:
+        scan_events.publish(scan_id, "step", step_event_data(name, current))
+    
+    # Run pipeline steps - independent steps execute concurrently
+    state = await graph.run(
+        state,
+        completed=completed,
+        on_level_complete=save_checkpoint if scan_id else None,
+        on_node_complete=publish_step if scan_id else None
+    )
+    
+    if scan_id and state.get("error") is None:
+        await checkpoint_store.clear(scan_id)
     
     # Convert to ScanAnalysis
     analysis_data = state.get("analysis", {})
     
     try:
-        return ScanAnalysis(
+        analysis = ScanAnalysis(
             metrics=build_face_metrics(analysis_data.get("metrics", {})),
             improvements=[build_improvement(imp) for imp in analysis_data.get("improvements", [])],
             top_strengths=analysis_data.get("top_strengths", []),
@@ -305,31 +459,19 @@ async def run_face_analysis_pipeline(front_image: bytes, left_image: bytes, righ
             personalized_summary=analysis_data.get("personalized_summary", ""),
             estimated_potential=analysis_data.get("estimated_potential", 5.0)
         )
+        return analysis, state.get("error")
     except Exception as e:
-        return create_fallback_analysis(str(e))
-
-
-def build_face_metrics(data: dict) -> FaceMetrics:
-    """Build FaceMetrics from dict"""
-    return FaceMetrics(
-        overall_score=data.get("overall_score", 5.0),
-        harmony_score=data.get("harmony_score", 5.0),
-        jawline=JawlineMetrics(**{k: data.get("jawline", {}).get(k, 5) for k in ["definition_score", "symmetry_score", "masseter_development", "chin_projection", "ramus_length"]}),
-        cheekbones=CheekbonesMetrics(**{k: data.get("cheekbones", {}).get(k, 5) for k in ["prominence_score", "width_score", "hollowness_below", "symmetry_score"]}),
-        eye_area=EyeAreaMetrics(**{k: data.get("eye_area", {}).get(k, 5) for k in ["upper_eyelid_exposure", "palpebral_fissure_height", "under_eye_area", "brow_bone_prominence", "orbital_rim_support", "symmetry_score"]}),
-        nose=NoseMetrics(**{k: data.get("nose", {}).get(k, 5) for k in ["bridge_height", "tip_projection", "nostril_symmetry", "overall_harmony"]}),
-        lips=LipsMetrics(**{k: data.get("lips", {}).get(k, 5) for k in ["upper_lip_volume", "lower_lip_volume", "cupids_bow_definition", "vermillion_border", "philtrum_definition", "lip_symmetry"]}),
-        forehead=ForeheadMetrics(**{k: data.get("forehead", {}).get(k, 5) for k in ["brow_bone_projection", "temple_hollowing", "forehead_symmetry", "skin_texture"]}),
-        skin=SkinMetrics(**{k: data.get("skin", {}).get(k, 5) for k in ["overall_quality", "texture_score", "clarity_score", "tone_evenness", "hydration_appearance", "pore_visibility", "under_eye_darkness"]}),
-        proportions=FacialProportions(**{k: data.get("proportions", {}).get(k, 5) for k in ["facial_thirds_balance", "upper_third_score", "middle_third_score", "lower_third_score", "horizontal_fifths_balance", "overall_symmetry", "facial_convexity", "golden_ratio_adherence"]}),
-        profile=ProfileMetrics(**{k: data.get("profile", {}).get(k, 5) for k in ["forehead_projection", "nose_projection", "lip_projection", "chin_projection", "submental_area", "ramus_visibility", "profile_harmony"]}),
-        hair=HairMetrics(**{k: data.get("hair", {}).get(k, 5) for k in ["density", "hairline_health", "hair_quality"]}),
-        body_fat=BodyFatIndicators(**{k: data.get("body_fat", {}).get(k, 5) for k in ["facial_leanness", "definition_potential"]}),
-        confidence_score=data.get("confidence_score", 0.5),
-        image_quality_front=data.get("image_quality_front", 5.0),
-        image_quality_left=data.get("image_quality_left", 5.0),
-        image_quality_right=data.get("image_quality_right", 5.0)
-    )
+        return create_fallback_analysis(str(e)), str(e)
+
+
+def step_event_data(name: str, state: dict) -> dict:
+    """Progress event payload for a finished pipeline step - early results included"""
+    data = {"step": name, "error": state.get("error")}
+    if name in ("analyze_face_metrics", "analyze_single_shot") and state.get("face_metrics"):
+        data["overall_score"] = state["face_metrics"].get("overall_score")
+    if name in ("generate_improvements", "analyze_single_shot") and state.get("improvements") is not None:
+        data["improvements_count"] = len(state["improvements"])
+    return data
 
 
 def build_improvement(data: dict) -> ImprovementSuggestion:
@@ -9,3 +9,5 @@ from .events import router as events_router
 from .forums import router as forums_router
 from .chat import router as chat_router
 from .leaderboard import router as leaderboard_router
+from .admin import router as admin_router
+from .uploads import router as uploads_router
@@ -0,0 +1,89 @@
+"""
+Admin API - Operational metrics and scan re-analysis backfills
+"""
+
+from fastapi import APIRouter, HTTPException, Depends, status
+from middleware.auth_middleware import get_current_admin_user
+from services.llm_client import llm_client
+from services.analysis_cache import analysis_cache
+from services.metrics import metrics
+from services.backfill import backfill_engine
+from models.scan import BackfillCreate
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+
+@router.get("/metrics")
+async def get_metrics(admin: dict = Depends(get_current_admin_user)):
+    """LLM latency, retry and circuit breaker state plus analysis cache counters"""
+    return {
+        "llm": llm_client.stats(),
+        "analysis_cache": analysis_cache.stats()
+    }
+
+
+@router.get("/metrics/latency")
+async def get_latency_metrics(admin: dict = Depends(get_current_admin_user)):
+    """p50/p95/p99 latency per scan phase, pipeline step and LLM call, plus token totals"""
+    return metrics.snapshot()
+
+
+def _serialize_backfill(job: dict) -> dict:
+    """Backfill job progress for the admin API"""
+    return {
+        "job_id": str(job["_id"]),
+        "status": job["status"],
+        "mode": job["mode"],
+        "version": job["version"],
+        "total": job.get("total", 0),
+        "processed": job.get("processed", 0),
+        "succeeded": job.get("succeeded", 0),
+        "failed": job.get("failed", 0),
+        "throughput_per_second": job.get("throughput_per_second"),
+        "eta_seconds": job.get("eta_seconds"),
+        "errors": job.get("errors", []),
+        "created_at": job["created_at"],
+        "updated_at": job.get("updated_at"),
+        "finished_at": job.get("finished_at")
+    }
+
+
+@router.post("/backfills", status_code=status.HTTP_202_ACCEPTED)
+async def start_backfill(data: BackfillCreate, admin: dict = Depends(get_current_admin_user)):
+    """Re-analyze completed scans whose analysis predates the current pipeline version"""
+    try:
+        job = await backfill_engine.create(
+            mode=data.mode,
+            force=data.force,
+            concurrency=data.concurrency,
+            rps=data.rps
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _serialize_backfill(job)
+
+
+@router.get("/backfills/{job_id}")
+async def get_backfill(job_id: str, admin: dict = Depends(get_current_admin_user)):
+    """Progress, throughput, ETA and recent errors of a backfill job"""
+    job = await backfill_engine.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Backfill job not found")
+    return _serialize_backfill(job)
+
+
+@router.post("/backfills/{job_id}/cancel")
+async def cancel_backfill(job_id: str, admin: dict = Depends(get_current_admin_user)):
+    """Stop a backfill running on this instance - it can be resumed later"""
+    if not await backfill_engine.cancel(job_id):
+        raise HTTPException(status_code=404, detail="Backfill job is not running on this instance")
+    return _serialize_backfill(await backfill_engine.get_job(job_id))
+
+
+@router.post("/backfills/{job_id}/resume", status_code=status.HTTP_202_ACCEPTED)
+async def resume_backfill(job_id: str, admin: dict = Depends(get_current_admin_user)):
+    """Resume a cancelled, failed or abandoned backfill from its checkpoint"""
+    job = await backfill_engine.resume(job_id)
+    if not job:
+        raise HTTPException(status_code=409, detail="Backfill job not found or still running")
+    return _serialize_backfill(job)
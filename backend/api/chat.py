@@ -25,8 +25,15 @@ async def send_message(data: ChatRequest, current_user: dict = Depends(require_p
     history = history_doc.get("messages", []) if history_doc else []
     
     # Get user context
-    latest_scan = await db.scans.find_one({"user_id": user_id}, sort=[("created_at", -1)])
-    user_context = {"latest_scan": latest_scan.get("analysis") if latest_scan else None}
+    latest_scan = await db.scans.find_one(
+        {"user_id": user_id, "overall_score": {"$ne": None}},
+        {"overall_score": 1, "analysis.focus_areas": 1},
+        sort=[("created_at", -1)]
+    )
+    user_context = {"latest_scan": {
+        "overall_score": latest_scan["overall_score"],
+        "focus_areas": latest_scan.get("analysis", {}).get("focus_areas", [])
+    } if latest_scan else None}
     
     # Get response from Gemini
     response_text = await gemini_service.chat(data.message, history, user_context)
@@ -9,6 +9,7 @@ from db import get_database
 from middleware import get_current_user
 from middleware.auth_middleware import require_paid_user, get_current_admin_user
 from models.course import CourseCreate, CourseResponse, ChapterCompletionRequest
+from services.course_index import course_index
 
 router = APIRouter(prefix="/courses", tags=["Courses"])
 
@@ -114,4 +115,5 @@ async def create_course(data: CourseCreate, admin: dict = Depends(get_current_ad
     course["updated_at"] = datetime.utcnow()
     course["is_active"] = True
     result = await db.courses.insert_one(course)
+    await course_index.refresh()
     return {"course_id": str(result.inserted_id)}
@@ -3,10 +3,11 @@ Leaderboard API
 """
 
 from fastapi import APIRouter, Depends
-from datetime import datetime
 from db import get_database
 from middleware import get_current_user
 from middleware.auth_middleware import require_paid_user
+from services.scan_stats import scan_stats
+from services.analysis_service import upsert_leaderboard_entry, rerank_leaderboard
 from bson import ObjectId
 
 router = APIRouter(prefix="/leaderboard", tags=["Leaderboard"])
@@ -31,7 +32,7 @@ async def get_leaderboard(limit: int = 100, current_user: dict = Depends(require
             "improvement_percentage": entry.get("improvement_percentage", 0)
         })
     
-    total = await db.leaderboard.count_documents({})
+    total = await db.leaderboard.estimated_document_count()
     return {"entries": entries, "total_users": total}
 
 
@@ -41,52 +42,19 @@ async def get_my_rank(current_user: dict = Depends(require_paid_user)):
     db = get_database()
     user_id = current_user["id"]
     entry = await db.leaderboard.find_one({"user_id": user_id})
-    total = await db.leaderboard.count_documents({})
     
     # If no leaderboard entry, check if user has completed scans and create entry
     if not entry:
-        latest_scan = await db.scans.find_one({
-            "user_id": user_id,
-            "processing_status": "completed",
-            "analysis": {"$exists": True}
-        }, sort=[("created_at", -1)])
-        
-        if latest_scan:
-            # User has completed scan but no leaderboard entry - create one
-            analysis = latest_scan.get("analysis", {})
-            overall_score = analysis.get("overall_score") or analysis.get("metrics", {}).get("overall_score", 0)
-            leaderboard_score = (float(overall_score) if overall_score else 0) * 10
-            
-            # Count scans
-            scans_count = await db.scans.count_documents({
-                "user_id": user_id,
-                "processing_status": "completed"
-            })
-            
-            # Create leaderboard entry
-            new_entry = {
-                "user_id": user_id,
-                "score": leaderboard_score,
-                "level": float(overall_score) if overall_score else 0,
-                "streak_days": 1,
-                "improvement_percentage": 0,
-                "scans_count": scans_count,
-                "last_scan_at": latest_scan.get("created_at", datetime.utcnow()),
-                "created_at": datetime.utcnow()
-            }
-            await db.leaderboard.insert_one(new_entry)
-            
-            # Recalculate all ranks
-            all_entries = await db.leaderboard.find().sort("score", -1).to_list(None)
-            for rank, e in enumerate(all_entries, 1):
-                await db.leaderboard.update_one({"_id": e["_id"]}, {"$set": {"rank": rank}})
-            
-            # Fetch the newly created entry with rank
-            entry = await db.leaderboard.find_one({"user_id": user_id})
-            total = await db.leaderboard.count_documents({})
-        else:
+        stats = await scan_stats.get_stats(user_id)
+        if not stats:
+            total = await db.leaderboard.estimated_document_count()
             return {"rank": None, "total_users": total, "message": "Complete a scan to join"}
+        
+        await upsert_leaderboard_entry(user_id, stats)
+        await rerank_leaderboard()
+        entry = await db.leaderboard.find_one({"user_id": user_id})
     
+    total = await db.leaderboard.estimated_document_count()
     return {
         "rank": entry.get("rank", 0),
         "total_users": total,
@@ -0,0 +1,98 @@
+"""
+Response helpers shared by API routers
+"""
+
+import json
+import os
+from datetime import date, datetime
+from typing import Any, Mapping, Optional
+import anyio
+from bson import ObjectId
+from fastapi.responses import JSONResponse, Response
+from starlette.types import Receive, Scope, Send
+
+
+def _json_default(value: Any) -> Any:
+    """Encode the non-JSON types found in our Mongo documents like jsonable_encoder does"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class TrustedJSONResponse(JSONResponse):
+    """
+    JSONResponse for documents we wrote ourselves (e.g. stored scan analyses).
+    Return it directly from an endpoint to skip FastAPI's recursive
+    jsonable_encoder pass, which dominates the cost of large nested payloads.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return json.dumps(
+            content,
+            default=_json_default,
+            ensure_ascii=False,
+            allow_nan=False,
+            indent=None,
+            separators=(",", ":")
+        ).encode("utf-8")
+
+
+class FileRangeResponse(Response):
+    """
+    Streams `length` bytes of a file starting at `offset`.
+    Uses the ASGI zero-copy send extension (sendfile) when the server offers
+    it; otherwise reads chunks with pread in a worker thread.
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(
+        self,
+        path: str,
+        offset: int,
+        length: int,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        media_type: Optional[str] = None
+    ):
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.body = b""
+        self.init_headers({**(headers or {}), "content-length": str(length)})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or self.length == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        file = await anyio.to_thread.run_sync(open, self.path, "rb")
+        try:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file,
+                    "offset": self.offset,
+                    "count": self.length
+                })
+                return
+
+            fd = file.fileno()
+            position, end = self.offset, self.offset + self.length
+            while position < end:
+                chunk = await anyio.to_thread.run_sync(os.pread, fd, min(self.chunk_size, end - position), position)
+                if not chunk:
+                    break
+                position += len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": position < end})
+            if position < end:
+                # File shrank underneath us - end the response rather than hang
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            await anyio.to_thread.run_sync(file.close)
@@ -2,223 +2,335 @@
 Face Scans API
 """
 
-from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, File
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from datetime import datetime
+from typing import Literal
+import asyncio
+import json
 from bson import ObjectId
 from db import get_database
 from middleware import get_current_user
 from middleware.auth_middleware import require_paid_user
-from services.storage_service import storage_service
-from agents.face_scan_agent import face_scan_agent
+from services.upload_stream import stream_scan_upload, UploadRejected, SCAN_IMAGE_FIELDS
+from services.direct_upload import direct_uploads
+from services.image_derivatives import image_derivatives, pick_images
+from services.analysis_queue import analysis_queue
+from services.metrics import metrics
+from services.scan_events import scan_events, TERMINAL_EVENTS
+from api.responses import TrustedJSONResponse
+from models.scan import DirectUploadCreate
 
 router = APIRouter(prefix="/scans", tags=["Face Scans"])
 
+# Image renditions a response can return (see services/image_derivatives.py)
+ImageSize = Literal["thumb", "medium", "original"]
+ImageFormat = Literal["webp", "jpeg"]
 
-@router.post("/upload")
-async def upload_scan_images(
-    front: UploadFile = File(...),
-    left: UploadFile = File(...),
-    right: UploadFile = File(...),
-    current_user: dict = Depends(get_current_user)
-):
-    """Upload 3 face scan images"""
-    db = get_database()
+
+# The body is streamed by hand, so describe the form for the OpenAPI docs
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": list(SCAN_IMAGE_FIELDS),
+            "properties": {name: {"type": "string", "format": "binary"} for name in SCAN_IMAGE_FIELDS}
+        }}}
+    }
+}
+
+
+@router.post("/upload", openapi_extra=UPLOAD_REQUEST_BODY)
+async def upload_scan_images(request: Request, current_user: dict = Depends(get_current_user)):
+    """Upload 3 face scan images (multipart fields front, left, right) - streamed straight to storage"""
     user_id = current_user["id"]
     
-    front_data = await front.read()
-    left_data = await left.read()
-    right_data = await right.read()
+    with metrics.trace() as trace, metrics.span("scan/upload"):
+        try:
+            uploads = await stream_scan_upload(request, user_id)
+        except UploadRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
     
-    front_url = await storage_service.upload_image(front_data, user_id, "front")
-    left_url = await storage_service.upload_image(left_data, user_id, "left")
-    right_url = await storage_service.upload_image(right_data, user_id, "right")
-    
-    if not all([front_url, left_url, right_url]):
-        raise HTTPException(status_code=500, detail="Failed to upload images")
+    scan_doc = {
+        "images": {name: upload.url for name, upload in uploads.items()},
+        "image_hashes": {name: upload.sha256 for name, upload in uploads.items()},
+        "timings": trace.timings
+    }
+    scan_id = await create_scan(current_user, scan_doc)
+    image_derivatives.schedule(scan_id, scan_doc["images"])
+    return {"scan_id": scan_id, "images": scan_doc["images"]}
+
+
+async def create_scan(current_user: dict, fields: dict) -> str:
+    """Insert a pending scan for uploaded images and mark the user's first scan"""
+    db = get_database()
+    user_id = current_user["id"]
     
     scan_doc = {
         "user_id": user_id,
         "created_at": datetime.utcnow(),
-        "images": {"front": front_url, "left": left_url, "right": right_url},
         "is_unlocked": current_user.get("is_paid", False),
-        "processing_status": "pending"
+        "processing_status": "pending",
+        **fields
     }
-    
     result = await db.scans.insert_one(scan_doc)
-    scan_id = str(result.inserted_id)
     
     if not current_user.get("first_scan_completed", False):
         await db.users.update_one(
             {"_id": ObjectId(user_id)},
             {"$set": {"first_scan_completed": True}}
         )
+    return str(result.inserted_id)
+
+
+@router.post("/uploads")
+async def create_direct_upload(data: DirectUploadCreate = DirectUploadCreate(), current_user: dict = Depends(get_current_user)):
+    """
+    Phase one of a direct upload: a presigned target per image.
+    Send each image to its target (POST with the form fields, or PUT with the
+    headers), then call /scans/uploads/{upload_id}/finalize.
+    """
+    try:
+        return await direct_uploads.create(current_user["id"], data.model_dump())
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+
+@router.post("/uploads/{upload_id}/finalize")
+async def finalize_direct_upload(upload_id: str, current_user: dict = Depends(get_current_user)):
+    """Phase two of a direct upload: verify the stored images and create the scan"""
+    try:
+        images = await direct_uploads.finalize(upload_id, current_user["id"])
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     
-    return {"scan_id": scan_id, "images": scan_doc["images"]}
+    try:
+        scan_id = await create_scan(current_user, {"images": images})
+        await direct_uploads.complete(upload_id, scan_id)
+    except Exception:
+        await direct_uploads.release(upload_id)
+        raise
+    image_derivatives.schedule(scan_id, images)
+    return {"scan_id": scan_id, "images": images}
+
+
+@router.put("/uploads/local/{token}", status_code=status.HTTP_204_NO_CONTENT)
+async def receive_local_upload(token: str, request: Request):
+    """Local storage stand-in for a presigned PUT - the signed token authorizes the upload"""
+    try:
+        uploaded = await direct_uploads.receive_local(token, request)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if uploaded is None:
+        raise HTTPException(status_code=403, detail="Invalid or expired upload token")
 
 
-@router.post("/{scan_id}/analyze")
+@router.post("/{scan_id}/analyze", status_code=status.HTTP_202_ACCEPTED)
 async def analyze_scan(scan_id: str, current_user: dict = Depends(get_current_user)):
-    """Trigger AI analysis for uploaded scan"""
+    """Queue AI analysis for an uploaded scan - poll /scans/{scan_id}/status for the result"""
     db = get_database()
     
-    scan = await db.scans.find_one({"_id": ObjectId(scan_id), "user_id": current_user["id"]})
+    scan = await db.scans.find_one({"_id": ObjectId(scan_id), "user_id": current_user["id"]}, {"_id": 1})
     if not scan:
         raise HTTPException(status_code=404, detail="Scan not found")
     
-    await db.scans.update_one({"_id": ObjectId(scan_id)}, {"$set": {"processing_status": "processing"}})
+    job = await analysis_queue.enqueue(scan_id, current_user["id"])
     
-    try:
-        # Get image data - handle both local and S3 storage
-        front_url = scan["images"]["front"]
-        left_url = scan["images"]["left"]
-        right_url = scan["images"]["right"]
-        
-        if front_url.startswith("/uploads/"):
-            # Local storage - read files directly
-            front_data = await storage_service.get_image(front_url)
-            left_data = await storage_service.get_image(left_url)
-            right_data = await storage_service.get_image(right_url)
-        else:
-            # S3 storage - fetch via HTTP
-            import httpx
-            async with httpx.AsyncClient() as client:
-                front_resp = await client.get(front_url)
-                left_resp = await client.get(left_url)
-                right_resp = await client.get(right_url)
-            front_data = front_resp.content
-            left_data = left_resp.content
-            right_data = right_resp.content
-        
-        if not all([front_data, left_data, right_data]):
-            raise HTTPException(status_code=500, detail="Failed to retrieve images")
-        
-        analysis = await face_scan_agent.analyze(front_data, left_data, right_data)
-        
-        await db.scans.update_one(
-            {"_id": ObjectId(scan_id)},
-            {"$set": {"analysis": analysis.model_dump(), "processing_status": "completed"}}
-        )
-        
-        # Update leaderboard entry for this user
-        user_id = current_user["id"]
-        overall_score = analysis.overall_score if hasattr(analysis, 'overall_score') else analysis.metrics.overall_score if hasattr(analysis, 'metrics') else 0
-        
-        # Get all completed scans for this user to calculate improvement
-        scan_cursor = db.scans.find({
-            "user_id": user_id,
-            "processing_status": "completed",
-            "analysis": {"$exists": True}
-        }).sort("created_at", -1)
-        
-        user_scans = []
-        async for s in scan_cursor:
-            score = s.get("analysis", {}).get("overall_score") or s.get("analysis", {}).get("metrics", {}).get("overall_score", 0)
-            user_scans.append({"score": score, "created_at": s.get("created_at")})
-        
-        # Calculate improvement percentage (compare first to latest)
-        improvement_percentage = 0
-        if len(user_scans) >= 2:
-            first_score = user_scans[-1]["score"] or 0
-            latest_score = user_scans[0]["score"] or 0
-            if first_score > 0:
-                improvement_percentage = ((latest_score - first_score) / first_score) * 100
-        
-        # Calculate score for leaderboard (based on overall_score * multiplier)
-        leaderboard_score = (float(overall_score) if overall_score else 0) * 10  # Scale to 100
-        
-        # Update or create leaderboard entry
-        existing_entry = await db.leaderboard.find_one({"user_id": user_id})
-        
-        if existing_entry:
-            # Update with new score if higher
-            new_score = max(existing_entry.get("score", 0), leaderboard_score)
-            await db.leaderboard.update_one(
-                {"user_id": user_id},
-                {
-                    "$set": {
-                        "score": new_score,
-                        "level": float(overall_score) if overall_score else 0,
-                        "improvement_percentage": improvement_percentage,
-                        "last_scan_at": datetime.utcnow()
-                    },
-                    "$inc": {"scans_count": 1}
-                }
-            )
-        else:
-            # Create new entry
-            await db.leaderboard.insert_one({
-                "user_id": user_id,
-                "score": leaderboard_score,
-                "level": float(overall_score) if overall_score else 0,
-                "streak_days": 1,
-                "improvement_percentage": 0,
-                "scans_count": 1,
-                "last_scan_at": datetime.utcnow(),
-                "created_at": datetime.utcnow()
-            })
-        
-        # Recalculate ranks for all leaderboard entries
-        all_entries = await db.leaderboard.find().sort("score", -1).to_list(None)
-        for rank, entry in enumerate(all_entries, 1):
-            await db.leaderboard.update_one({"_id": entry["_id"]}, {"$set": {"rank": rank}})
-        
-        return {"message": "Analysis complete", "scan_id": scan_id}
-    except Exception as e:
-        await db.scans.update_one({"_id": ObjectId(scan_id)}, {"$set": {"processing_status": "failed", "error_message": str(e)}})
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {e}")
+    return {"job_id": str(job["_id"]), "scan_id": scan_id, "status": job["status"]}
+
+
+@router.get("/jobs/{job_id}")
+async def get_analysis_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Get status of an analysis job"""
+    job = await analysis_queue.get_job(job_id, current_user["id"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return {
+        "job_id": str(job["_id"]),
+        "scan_id": job["scan_id"],
+        "status": job["status"],
+        "attempts": job.get("attempts", 0),
+        "error": job.get("error"),
+        "created_at": job["created_at"],
+        "updated_at": job.get("updated_at")
+    }
+
+
+@router.get("/{scan_id}/status")
+async def get_scan_status(scan_id: str, current_user: dict = Depends(get_current_user)):
+    """Lightweight processing status for polling"""
+    db = get_database()
+    
+    scan = await db.scans.find_one(
+        {"_id": ObjectId(scan_id), "user_id": current_user["id"]},
+        {"processing_status": 1, "error_message": 1}
+    )
+    if not scan:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    
+    return {
+        "scan_id": scan_id,
+        "processing_status": scan.get("processing_status"),
+        "error_message": scan.get("error_message")
+    }
+
+
+# Seconds between SSE keep-alives; each one also re-checks the stored status
+EVENT_STREAM_HEARTBEAT_SECONDS = 15.0
+
+
+def _format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@router.get("/{scan_id}/events")
+async def stream_scan_events(scan_id: str, request: Request, current_user: dict = Depends(get_current_user)):
+    """
+    Server-sent events for a scan's analysis: queued, processing, one `step`
+    event per pipeline step (the overall score arrives with the metrics step),
+    then completed or failed. The stream closes after a terminal event.
+    """
+    db = get_database()
+    
+    scan = await db.scans.find_one(
+        {"_id": ObjectId(scan_id), "user_id": current_user["id"]},
+        {"processing_status": 1, "error_message": 1, "overall_score": 1}
+    )
+    if not scan:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    
+    def terminal_message(doc: dict):
+        status_value = doc.get("processing_status")
+        if status_value == "completed":
+            return _format_sse("completed", {"scan_id": scan_id, "overall_score": doc.get("overall_score")})
+        if status_value == "failed":
+            return _format_sse("failed", {"scan_id": scan_id, "error": doc.get("error_message")})
+        return None
+    
+    async def event_stream():
+        with scan_events.subscribe(scan_id) as queue:
+            # Events published since the status was read are replayed from the bus history
+            final = terminal_message(scan)
+            if final:
+                yield final
+                return
+            yield _format_sse("status", {"scan_id": scan_id, "processing_status": scan.get("processing_status")})
+            
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=EVENT_STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # The job may be running on another instance - fall back to the stored status
+                    current = await db.scans.find_one(
+                        {"_id": ObjectId(scan_id)},
+                        {"processing_status": 1, "error_message": 1, "overall_score": 1}
+                    )
+                    final = terminal_message(current or {})
+                    if final:
+                        yield final
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                
+                yield _format_sse(message["event"], message["data"])
+                if message["event"] in TERMINAL_EVENTS:
+                    return
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @router.get("/latest")
-async def get_latest_scan(current_user: dict = Depends(get_current_user)):
-    """Get most recent scan"""
+async def get_latest_scan(
+    size: ImageSize = "medium",
+    image_format: ImageFormat = Query("webp", alias="format"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get most recent scan - `images` at the requested size, `original_images` full resolution"""
     db = get_database()
-    scan = await db.scans.find_one({"user_id": current_user["id"]}, sort=[("created_at", -1)])
+    is_paid = current_user.get("is_paid", False)
+    
+    # Unpaid users only see the overall score - don't load the full analysis
+    projection = {"created_at": 1, "images": 1, "derivatives": 1, "processing_status": 1, "overall_score": 1}
+    if is_paid:
+        projection["analysis"] = 1
+    
+    scan = await db.scans.find_one({"user_id": current_user["id"]}, projection, sort=[("created_at", -1)])
     if not scan:
         raise HTTPException(status_code=404, detail="No scans found")
     
-    is_paid = current_user.get("is_paid", False)
     response = {
         "id": str(scan["_id"]),
         "created_at": scan["created_at"],
-        "images": scan.get("images", {}),
+        "images": pick_images(scan, size, image_format),
+        "original_images": scan.get("images", {}),
         "is_unlocked": is_paid,
         "processing_status": scan.get("processing_status")
     }
     
-    if scan.get("analysis"):
-        if is_paid:
+    if is_paid:
+        if scan.get("analysis"):
             response["analysis"] = scan["analysis"]
-        else:
-            # For unpaid users, only show overall score
-            overall_score = scan["analysis"].get("overall_score") or scan["analysis"].get("metrics", {}).get("overall_score")
-            response["analysis"] = {"overall_score": overall_score, "locked": True}
+    elif scan.get("overall_score") is not None:
+        # For unpaid users, only show overall score
+        response["analysis"] = {"overall_score": scan["overall_score"], "locked": True}
     
-    return response
+    return TrustedJSONResponse(response)
 
 
 @router.get("/history")
-async def get_scan_history(limit: int = 10, current_user: dict = Depends(require_paid_user)):
-    """Get scan history (paid only)"""
+async def get_scan_history(
+    limit: int = 10,
+    image_format: ImageFormat = Query("webp", alias="format"),
+    current_user: dict = Depends(require_paid_user)
+):
+    """Get scan history (paid only) - each entry with a front-view thumbnail"""
     db = get_database()
-    cursor = db.scans.find({"user_id": current_user["id"]}).sort("created_at", -1).limit(limit)
-    scans = [{"id": str(s["_id"]), "created_at": s["created_at"], "overall_score": s.get("analysis", {}).get("metrics", {}).get("overall_score")} async for s in cursor]
+    # Summary fields only, ordered by the (user_id, created_at, overall_score) index
+    cursor = db.scans.find(
+        {"user_id": current_user["id"]},
+        {"created_at": 1, "overall_score": 1, "images.front": 1, "derivatives.front.thumb": 1}
+    ).sort("created_at", -1).limit(limit)
+    scans = [
+        {
+            "id": str(s["_id"]),
+            "created_at": s["created_at"],
+            "overall_score": s.get("overall_score"),
+            "thumbnail": pick_images(s, "thumb", image_format).get("front")
+        }
+        async for s in cursor
+    ]
     return {"scans": scans}
 
 
 @router.get("/{scan_id}")
-async def get_scan_by_id(scan_id: str, current_user: dict = Depends(require_paid_user)):
-    """Get a specific scan with full analysis (paid only)"""
+async def get_scan_by_id(
+    scan_id: str,
+    size: ImageSize = "medium",
+    image_format: ImageFormat = Query("webp", alias="format"),
+    current_user: dict = Depends(require_paid_user)
+):
+    """Get a specific scan with full analysis (paid only) - `images` at the requested size"""
     db = get_database()
     
-    scan = await db.scans.find_one({"_id": ObjectId(scan_id), "user_id": current_user["id"]})
+    scan = await db.scans.find_one(
+        {"_id": ObjectId(scan_id), "user_id": current_user["id"]},
+        {"created_at": 1, "images": 1, "derivatives": 1, "analysis": 1, "processing_status": 1}
+    )
     if not scan:
         raise HTTPException(status_code=404, detail="Scan not found")
     
-    return {
+    return TrustedJSONResponse({
         "id": str(scan["_id"]),
         "created_at": scan["created_at"],
-        "images": scan.get("images", {}),
+        "images": pick_images(scan, size, image_format),
+        "original_images": scan.get("images", {}),
         "analysis": scan.get("analysis"),
         "processing_status": scan.get("processing_status")
-    }
+    })
 
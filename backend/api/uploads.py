@@ -0,0 +1,101 @@
+"""
+Uploads API - Serves locally stored images at the /uploads/... URLs
+Only active with local storage; S3 URLs point at the bucket directly.
+Stored images are immutable (named by content hash or a unique id), so responses
+carry a strong ETag and a long private cache lifetime, and honour
+conditional and single-range requests.
+"""
+
+import mimetypes
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Tuple
+from fastapi import APIRouter, HTTPException, Request, Response
+from services.storage_service import storage_service, LocalStorageService
+from api.responses import FileRangeResponse
+
+router = APIRouter(prefix="/uploads", tags=["Uploads"])
+
+# Private: these are users' face photos, never to be kept by shared caches
+CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)", re.IGNORECASE)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match comparison (weak, as RFC 9110 requires for this header)"""
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def _not_modified_since(header: str, mtime: float) -> bool:
+    try:
+        return int(mtime) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, end inclusive) of a single `bytes=` range, or None to serve the
+    whole file (malformed or multi-range headers). Raises ValueError when the
+    range cannot be satisfied.
+    """
+    match = RANGE_RE.fullmatch(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        if int(last) == 0:
+            raise ValueError("Empty suffix range")
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+@router.api_route("/{path:path}", methods=["GET", "HEAD"])
+async def serve_upload(path: str, request: Request):
+    """Serve a stored image with ETag, Last-Modified, Range and cache headers"""
+    if not isinstance(storage_service, LocalStorageService) or path.endswith(".part"):
+        raise HTTPException(status_code=404, detail="Not found")
+    try:
+        found = await storage_service.stat_file(f"/uploads/{path}")
+    except ValueError:
+        found = None
+    if found is None:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    filepath, info = found
+    etag = f'"{info.st_mtime_ns:x}-{info.st_size:x}"'
+    headers = {
+        "etag": etag,
+        "last-modified": formatdate(info.st_mtime, usegmt=True),
+        "cache-control": CACHE_CONTROL,
+        "accept-ranges": "bytes",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+    elif "if-modified-since" in request.headers and _not_modified_since(request.headers["if-modified-since"], info.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    media_type = mimetypes.guess_type(filepath)[0] or "application/octet-stream"
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range == etag):
+        try:
+            byte_range = _parse_range(range_header, info.st_size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{info.st_size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            headers["content-range"] = f"bytes {start}-{end}/{info.st_size}"
+            return FileRangeResponse(filepath, start, end - start + 1, status_code=206, headers=headers, media_type=media_type)
+
+    return FileRangeResponse(filepath, 0, info.st_size, headers=headers, media_type=media_type)
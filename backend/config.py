@@ -25,6 +25,60 @@ class Settings(BaseSettings):
     # Google Gemini
     gemini_api_key: str = Field(default="")
     gemini_model: str = Field(default="gemini-2.5-flash")
+    llm_max_concurrency: int = Field(default=16)
+    llm_executor_workers: int = Field(default=16)
+    llm_attempt_timeout_seconds: float = Field(default=45.0)
+    llm_call_deadline_seconds: float = Field(default=90.0)
+    llm_breaker_failure_threshold: int = Field(default=5)
+    llm_breaker_reset_seconds: float = Field(default=30.0)
+    llm_backend: str = Field(default="gemini")  # gemini, fake, record, replay
+    llm_fake_profile: str = Field(default="")  # path to a JSON latency/failure/response profile file
+    llm_recordings_path: str = Field(default="llm_recordings.jsonl")
+    
+    # Scan Analysis Pipeline
+    analysis_pipeline_mode: str = Field(default="multi_step")  # multi_step, single_shot
+    
+    # Scan Analysis Queue
+    analysis_workers: int = Field(default=4)
+    analysis_job_max_attempts: int = Field(default=3)
+    analysis_job_lease_seconds: int = Field(default=300)
+    analysis_queue_poll_seconds: float = Field(default=1.0)
+    
+    # Scan Re-analysis Backfill
+    backfill_workers: int = Field(default=4)
+    backfill_rps: float = Field(default=2.0)  # upstream LLM requests per second
+    backfill_batch_size: int = Field(default=20)
+    backfill_lease_seconds: int = Field(default=120)
+    
+    # Scan Image Preprocessing
+    image_max_edge: int = Field(default=1536)
+    image_jpeg_quality: int = Field(default=85)
+    image_preprocess_workers: int = Field(default=2)
+    image_min_quality: float = Field(default=3.0)
+    image_min_edge: int = Field(default=720)
+    image_min_skin_fraction: float = Field(default=0.05)
+    
+    # Scan Image Derivatives
+    image_derivatives_enabled: bool = Field(default=True)
+    image_thumb_edge: int = Field(default=256)  # History lists
+    image_medium_edge: int = Field(default=1024)  # Scan result screens
+    image_derivative_webp_quality: int = Field(default=80)
+    image_derivative_jpeg_quality: int = Field(default=82)
+    
+    # Scan Analysis Cache
+    analysis_cache_enabled: bool = Field(default=True)
+    analysis_cache_ttl_seconds: int = Field(default=7 * 24 * 3600)
+    analysis_cache_lru_size: int = Field(default=256)
+    
+    # Course Recommendations
+    course_index_ttl_seconds: int = Field(default=300)
+    course_recommendation_limit: int = Field(default=3)
+    course_recommendation_min_score: float = Field(default=0.3)
+    
+    # Scan Uploads
+    upload_max_image_mb: int = Field(default=15)
+    upload_max_request_mb: int = Field(default=40)  # All three images plus multipart overhead
+    upload_url_expire_seconds: int = Field(default=600)  # Direct upload targets and pending uploads
     
     # Stripe
     stripe_secret_key: str = Field(default="")
@@ -39,6 +93,14 @@ class Settings(BaseSettings):
     aws_secret_access_key: str = Field(default="")
     aws_s3_bucket: str = Field(default="cannon-app-uploads")
     aws_s3_region: str = Field(default="us-east-1")
+    s3_max_concurrency: int = Field(default=16)  # Executor threads and pooled connections
+    s3_connect_timeout_seconds: float = Field(default=5.0)
+    s3_read_timeout_seconds: float = Field(default=30.0)
+    s3_operation_timeout_seconds: float = Field(default=60.0)  # Whole upload/download, including retries
+    s3_multipart_threshold_mb: int = Field(default=8)
+    s3_multipart_chunk_mb: int = Field(default=8)
+    storage_http_max_connections: int = Field(default=32)  # Pooled client for fetching image URLs
+    storage_http_timeout_seconds: float = Field(default=30.0)
     
     # Application
     app_name: str = Field(default="Cannon")
@@ -52,7 +52,26 @@ class MongoDBClient:
         
         # Scans collection indexes
         await db.scans.create_index("user_id")
-        await db.scans.create_index([("user_id", 1), ("created_at", -1)])
+        await db.scans.create_index([("user_id", 1), ("created_at", -1), ("overall_score", 1)])
+        
+        # Analysis job queue indexes
+        await db.analysis_jobs.create_index([("status", 1), ("run_after", 1), ("created_at", 1)])
+        await db.analysis_jobs.create_index([("status", 1), ("locked_until", 1)])
+        await db.analysis_jobs.create_index([("scan_id", 1), ("status", 1)])
+        await db.analysis_jobs.create_index(
+            "scan_id", unique=True, partialFilterExpression={"active": True}, name="scan_id_active_unique"
+        )
+        
+        # Re-analysis backfill jobs
+        await db.scans.create_index([("processing_status", 1), ("analysis_version", 1), ("_id", 1)])
+        await db.backfill_jobs.create_index([("status", 1), ("created_at", -1)])
+        
+        # Pending direct uploads expire on their own
+        await db.scan_uploads.create_index("expires_at", expireAfterSeconds=0)
+        await db.scan_uploads.create_index([("user_id", 1), ("status", 1)])
+        
+        # Analysis cache - TTL eviction
+        await db.analysis_cache.create_index("created_at", expireAfterSeconds=settings.analysis_cache_ttl_seconds)
         
         # Payments collection indexes
         await db.payments.create_index("user_id")
@@ -80,6 +99,7 @@ class MongoDBClient:
         await db.leaderboard.create_index("user_id", unique=True)
         await db.leaderboard.create_index([("score", -1)])
         await db.leaderboard.create_index([("rank", 1)])
+        await db.scan_stats.create_index("user_id", unique=True)
         
         # Chat history indexes
         await db.chat_history.create_index("user_id")
@@ -9,9 +9,16 @@ from contextlib import asynccontextmanager
 
 from config import settings
 from db import mongo_client
+from services.analysis_queue import analysis_queue
+from services.backfill import backfill_engine
+from services.course_index import course_index
+from services.storage_service import storage_service
+from services.image_derivatives import image_derivatives
+from agents.image_preprocessing import shutdown_pool as shutdown_image_pool
 from api import (
     auth_router, users_router, scans_router, payments_router,
-    courses_router, events_router, forums_router, chat_router, leaderboard_router
+    courses_router, events_router, forums_router, chat_router, leaderboard_router,
+    admin_router, uploads_router
 )
 
 
@@ -20,8 +27,19 @@ async def lifespan(app: FastAPI):
     """Application lifespan events"""
     # Startup
     await mongo_client.connect()
+    try:
+        await course_index.refresh()
+    except Exception as e:
+        # Recommendation steps retry the load and report the error until it succeeds
+        print(f"Course index startup refresh error: {e!r}")
+    await analysis_queue.start()
     yield
     # Shutdown
+    await backfill_engine.stop()
+    await image_derivatives.stop()
+    await analysis_queue.stop()
+    shutdown_image_pool()
+    await storage_service.close()
     await mongo_client.disconnect()
 
 
@@ -52,6 +70,10 @@ app.include_router(events_router, prefix="/api")
 app.include_router(forums_router, prefix="/api")
 app.include_router(chat_router, prefix="/api")
 app.include_router(leaderboard_router, prefix="/api")
+app.include_router(admin_router, prefix="/api")
+
+# Locally stored images are served at the /uploads/... URLs storage returns
+app.include_router(uploads_router)
 
 
 @app.get("/")
@@ -58,6 +58,8 @@ class CourseCreate(BaseModel):
     title: str
     description: str
     category: CourseCategory
+    tags: List[str] = Field(default_factory=list)
+    target_metrics: List[str] = Field(default_factory=list, description="Metric sections or scores, e.g. 'skin' or 'jawline.definition_score'")
     thumbnail_url: Optional[str] = None
     difficulty: str = Field(default="beginner")
     estimated_weeks: int = Field(default=4, ge=1)
@@ -70,6 +72,8 @@ class CourseResponse(BaseModel):
     title: str
     description: str
     category: CourseCategory
+    tags: List[str] = Field(default_factory=list)
+    target_metrics: List[str] = Field(default_factory=list)
     thumbnail_url: Optional[str] = None
     difficulty: str
     estimated_weeks: int
@@ -87,6 +91,8 @@ class CourseInDB(BaseModel):
     title: str
     description: str
     category: CourseCategory
+    tags: List[str] = Field(default_factory=list)
+    target_metrics: List[str] = Field(default_factory=list)
     thumbnail_url: Optional[str] = None
     difficulty: str = "beginner"
     estimated_weeks: int = 4
@@ -0,0 +1,114 @@
+"""
+Fast construction of scan analysis models
+FaceMetrics has ~64 bounded scores spread over 11 nested models. Instead of
+building each nested model from its own dict comprehension, the scores are
+flattened into one array, defaulted and clamped in a single vectorized pass,
+and the whole tree is validated by one pydantic-core call. Out-of-range
+scores from the LLM are clamped rather than failing the analysis.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from pydantic import BaseModel
+from models.scan import FaceMetrics
+
+
+def _bounds(field) -> Tuple[Optional[float], Optional[float]]:
+    low = high = None
+    for constraint in field.metadata:
+        low = getattr(constraint, "ge", low)
+        high = getattr(constraint, "le", high)
+    return low, high
+
+
+def _build_score_schema() -> List[Tuple[Optional[str], str, float, float, bool]]:
+    """(section, field, low, high, required) for every bounded score in FaceMetrics"""
+    schema = []
+    for name, field in FaceMetrics.model_fields.items():
+        if isinstance(field.annotation, type) and issubclass(field.annotation, BaseModel):
+            for sub_name, sub_field in field.annotation.model_fields.items():
+                low, high = _bounds(sub_field)
+                if low is not None and high is not None:
+                    schema.append((name, sub_name, low, high, sub_field.is_required()))
+        else:
+            low, high = _bounds(field)
+            if low is not None and high is not None:
+                schema.append((None, name, low, high, field.is_required()))
+    return schema
+
+
+# Flat score schema and its column vectors
+SCORE_SCHEMA = _build_score_schema()
+SCORE_LOW = np.array([entry[2] for entry in SCORE_SCHEMA], dtype=np.float64)
+SCORE_HIGH = np.array([entry[3] for entry in SCORE_SCHEMA], dtype=np.float64)
+SCORE_REQUIRED = np.array([entry[4] for entry in SCORE_SCHEMA], dtype=bool)
+# Missing required scores fall back to the middle of their range (5, or 0.5 for confidence)
+SCORE_DEFAULT = (SCORE_LOW + SCORE_HIGH) / 2
+
+# Score keys grouped by section (None = top level), in schema order
+SCORE_GROUPS: List[Tuple[Optional[str], List[str]]] = []
+for _section, _name, _, _, _ in SCORE_SCHEMA:
+    if not SCORE_GROUPS or SCORE_GROUPS[-1][0] != _section:
+        SCORE_GROUPS.append((_section, []))
+    SCORE_GROUPS[-1][1].append(_name)
+
+
+def _as_float(value) -> float:
+    if value is None or isinstance(value, bool):
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _raw_scores(data: dict) -> list:
+    values = []
+    for section, keys in SCORE_GROUPS:
+        source = data if section is None else data.get(section)
+        if not isinstance(source, dict):
+            source = {}
+        values.extend(map(source.get, keys))
+    return values
+
+
+def clamp_scores(rows: Sequence[dict]) -> np.ndarray:
+    """
+    Score matrix (one row per metrics dict, one column per SCORE_SCHEMA entry).
+    Missing or non-numeric scores become NaN; required ones then take their
+    default, and everything is clamped into range.
+    """
+    raw = [_raw_scores(row) for row in rows]
+    try:
+        matrix = np.array(raw, dtype=np.float64).reshape(len(rows), len(SCORE_SCHEMA))
+    except (TypeError, ValueError):
+        # Strings or other junk somewhere - convert value by value
+        matrix = np.array([[_as_float(v) for v in row] for row in raw], dtype=np.float64)
+        matrix = matrix.reshape(len(rows), len(SCORE_SCHEMA))
+
+    missing = np.isnan(matrix)
+    filled = np.where(missing & SCORE_REQUIRED, SCORE_DEFAULT, matrix)
+    return np.where(missing & ~SCORE_REQUIRED, np.nan, np.clip(filled, SCORE_LOW, SCORE_HIGH))
+
+
+def sanitize_face_metrics(data: dict) -> Dict[str, object]:
+    """Nested metrics dict containing only clamped scores (optional ones None when absent)"""
+    scores = clamp_scores([data])[0].tolist()
+    metrics: Dict[str, object] = {}
+    index = 0
+    for section, keys in SCORE_GROUPS:
+        chunk = {}
+        for key in keys:
+            score = scores[index]
+            chunk[key] = None if score != score else score  # NaN -> None
+            index += 1
+        if section is None:
+            metrics.update(chunk)
+        else:
+            metrics[section] = chunk
+    return metrics
+
+
+def build_face_metrics(data: dict) -> FaceMetrics:
+    """FaceMetrics from LLM output - scores clamped into range, other fields defaulted"""
+    return FaceMetrics.model_validate(sanitize_face_metrics(data))
@@ -267,6 +267,13 @@ class ScanCreate(BaseModel):
     right_image_url: str
 
 
+class DirectUploadCreate(BaseModel):
+    """Content types of the images a client will upload directly to storage"""
+    front: str = "image/jpeg"
+    left: str = "image/jpeg"
+    right: str = "image/jpeg"
+
+
 class ScanResponse(BaseModel):
     """Scan response for API"""
     id: str
@@ -286,6 +293,30 @@ class ScanInDB(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     images: dict = Field(default_factory=dict)
     analysis: Optional[ScanAnalysis] = None
+    overall_score: Optional[float] = None  # Copy of analysis.metrics.overall_score for summary queries
     is_unlocked: bool = False
-    processing_status: str = Field(default="pending")  # pending, processing, completed, failed
+    processing_status: str = Field(default="pending")  # pending, queued, processing, completed, failed
     error_message: Optional[str] = None
+
+
+class AnalysisJobInDB(BaseModel):
+    """Scan analysis job as stored in the analysis_jobs queue"""
+    scan_id: str
+    user_id: str
+    status: str = Field(default="queued")  # queued, running, completed, failed
+    attempts: int = 0
+    max_attempts: int = 3
+    run_after: datetime = Field(default_factory=datetime.utcnow)
+    locked_until: Optional[datetime] = None
+    worker_id: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class BackfillCreate(BaseModel):
+    """Admin request to re-analyze historical scans"""
+    mode: Optional[str] = None  # pipeline mode, defaults to settings
+    force: bool = False  # re-analyze scans already on the current version
+    concurrency: Optional[int] = Field(default=None, ge=1, le=64)
+    rps: Optional[float] = Field(default=None, gt=0)  # LLM requests per second
@@ -0,0 +1,102 @@
+"""
+Micro-benchmark for per-scan model CPU cost.
+Compares the previous per-section FaceMetrics construction with the
+vectorized clamp + single validation path, and FastAPI's jsonable_encoder
+with TrustedJSONResponse for the stored-scan read endpoints.
+
+Usage (from backend/):
+    python scripts/benchmark_models.py --iterations 5000
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from models.scan import (
+    FaceMetrics, ScanAnalysis, JawlineMetrics, CheekbonesMetrics, EyeAreaMetrics, NoseMetrics,
+    LipsMetrics, ForeheadMetrics, SkinMetrics, FacialProportions, ProfileMetrics, HairMetrics,
+    BodyFatIndicators
+)
+from models.fast_construct import build_face_metrics, clamp_scores
+from agents.langgraph_workflow import create_default_metrics_dict, build_improvement
+from api.responses import TrustedJSONResponse
+
+
+SECTIONS = {
+    "jawline": JawlineMetrics, "cheekbones": CheekbonesMetrics, "eye_area": EyeAreaMetrics,
+    "nose": NoseMetrics, "lips": LipsMetrics, "forehead": ForeheadMetrics, "skin": SkinMetrics,
+    "proportions": FacialProportions, "profile": ProfileMetrics, "hair": HairMetrics,
+    "body_fat": BodyFatIndicators,
+}
+
+
+def legacy_build_face_metrics(data: dict) -> FaceMetrics:
+    """The previous construction: one dict comprehension and validation per section"""
+    defaults = create_default_metrics_dict()
+    return FaceMetrics(
+        overall_score=data.get("overall_score", 5.0),
+        harmony_score=data.get("harmony_score", 5.0),
+        **{
+            name: model(**{k: data.get(name, {}).get(k, 5) for k in defaults[name]})
+            for name, model in SECTIONS.items()
+        },
+        confidence_score=data.get("confidence_score", 0.5),
+        image_quality_front=data.get("image_quality_front", 5.0),
+        image_quality_left=data.get("image_quality_left", 5.0),
+        image_quality_right=data.get("image_quality_right", 5.0)
+    )
+
+
+def timed(fn, iterations: int) -> float:
+    """Mean microseconds per call"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scan model construction and serialization")
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=256, help="rows for the batched clamp")
+    args = parser.parse_args()
+
+    metrics = create_default_metrics_dict()
+    improvements = [
+        {"area": f"area {i}", "priority": "high", "current_score": 5, "potential_score": 7,
+         "suggestion": "Practice mewing", "exercises": ["Mewing"], "products": [], "timeframe": "3 months"}
+        for i in range(5)
+    ]
+    analysis = ScanAnalysis(
+        metrics=build_face_metrics(metrics),
+        improvements=[build_improvement(i) for i in improvements],
+        estimated_potential=7.0
+    ).model_dump()
+    scan = {"id": "0" * 24, "created_at": datetime.utcnow(), "images": {}, "analysis": analysis, "processing_status": "completed"}
+
+    rows = [
+        ("build FaceMetrics (legacy)", lambda: legacy_build_face_metrics(metrics)),
+        ("build FaceMetrics (fast)", lambda: build_face_metrics(metrics)),
+        (f"clamp {args.batch} scans / scan", None),
+        ("serialize scan (jsonable_encoder)", lambda: JSONResponse(jsonable_encoder(scan)).body),
+        ("serialize scan (trusted)", lambda: TrustedJSONResponse(scan).body),
+    ]
+
+    batch = [metrics] * args.batch
+    print(f"{'case':<36} {'us/scan':>10}")
+    for name, fn in rows:
+        if fn is None:
+            cost = timed(lambda: clamp_scores(batch), max(1, args.iterations // args.batch)) / args.batch
+        else:
+            cost = timed(fn, args.iterations)
+        print(f"{name:<36} {cost:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
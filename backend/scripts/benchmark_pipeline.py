@@ -0,0 +1,150 @@
+"""
+Benchmark the face analysis pipeline and Cannon chat.
+Drives each workload at a fixed concurrency and reports throughput, latency
+percentiles, LLM calls per run and failure rate. With --backend fake or
+replay no Gemini key is needed; --backend record captures live responses
+for later replay.
+
+Usage (from backend/):
+    python scripts/benchmark_pipeline.py front.jpg left.jpg right.jpg --runs 5
+    python scripts/benchmark_pipeline.py front.jpg left.jpg right.jpg \\
+        --backend fake --profile fake_profile.json --runs 200 --concurrency 16
+    python scripts/benchmark_pipeline.py --workloads chat --backend fake --runs 500 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings
+from agents.langgraph_workflow import execute_face_analysis, PIPELINE_MODES
+from services.llm_client import llm_client
+from services.llm_backends import BACKENDS, FakeBackend, RecordingBackend, ReplayBackend, GeminiBackend
+from services.gemini_service import gemini_service
+
+
+CHAT_HISTORY = [
+    {"role": "user", "content": "I started mewing two weeks ago."},
+    {"role": "assistant", "content": "Nice - keep your tongue posture consistent through the day."},
+]
+CHAT_MESSAGE = "What should I focus on next for my jawline?"
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def total_llm_calls() -> int:
+    return sum(call["count"] for call in llm_client.stats()["calls"].values())
+
+
+async def run_workload(name: str, call, runs: int, concurrency: int) -> dict:
+    """Run `call` `runs` times with bounded concurrency; call returns an error or None"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+    calls_before = total_llm_calls()
+
+    async def one_run():
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                error = await call()
+            except Exception as e:
+                error = str(e)
+            latencies.append(time.perf_counter() - start)
+            if error:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_run() for _ in range(runs)))
+    wall = time.perf_counter() - started
+
+    return {
+        "workload": name,
+        "runs": runs,
+        "throughput": runs / wall if wall > 0 else 0.0,
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "p99_s": percentile(latencies, 99),
+        "mean_s": sum(latencies) / len(latencies),
+        "llm_calls_per_run": (total_llm_calls() - calls_before) / runs,
+        "failure_rate": failures / runs
+    }
+
+
+def pipeline_call(mode: str, images: tuple):
+    async def call():
+        _, error = await execute_face_analysis(*images, mode=mode)
+        return error
+    return call
+
+
+async def chat_call():
+    reply = await gemini_service.chat(CHAT_MESSAGE, CHAT_HISTORY)
+    return None if reply else "empty reply"
+
+
+def select_backend(args) -> None:
+    if args.backend == "fake":
+        llm_client.use_backend(FakeBackend.from_file(args.profile or settings.llm_fake_profile))
+    elif args.backend == "record":
+        llm_client.use_backend(RecordingBackend(GeminiBackend(), args.recordings))
+    elif args.backend == "replay":
+        llm_client.use_backend(ReplayBackend(args.recordings, replay_latency=not args.no_replay_latency))
+    else:
+        llm_client.use_backend(GeminiBackend())
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark analysis pipeline modes and chat")
+    parser.add_argument("images", nargs="*", help="front, left and right photos (pipeline workload)")
+    parser.add_argument("--workloads", nargs="+", default=["pipeline"], choices=["pipeline", "chat"])
+    parser.add_argument("--modes", nargs="+", default=list(PIPELINE_MODES))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--backend", choices=BACKENDS, default=settings.llm_backend)
+    parser.add_argument("--profile", default="", help="fake backend profile JSON")
+    parser.add_argument("--recordings", default=settings.llm_recordings_path, help="record/replay JSONL file")
+    parser.add_argument("--no-replay-latency", action="store_true", help="replay without recorded latency")
+    args = parser.parse_args()
+
+    if "pipeline" in args.workloads and len(args.images) != 3:
+        parser.error("the pipeline workload needs front, left and right image paths")
+    select_backend(args)
+
+    workloads = []
+    if "pipeline" in args.workloads:
+        images = []
+        for path in args.images:
+            with open(path, "rb") as f:
+                images.append(f.read())
+        workloads += [(mode, pipeline_call(mode, tuple(images))) for mode in args.modes]
+    if "chat" in args.workloads:
+        workloads.append(("chat", chat_call))
+
+    print(f"backend={args.backend} concurrency={args.concurrency}")
+    print(
+        f"{'workload':<12} {'runs':>5} {'rps':>7} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} "
+        f"{'mean s':>8} {'calls':>6} {'fail %':>7}"
+    )
+    for name, call in workloads:
+        r = await run_workload(name, call, args.runs, args.concurrency)
+        print(
+            f"{r['workload']:<12} {r['runs']:>5} {r['throughput']:>7.2f} {r['p50_s']:>8.2f} {r['p95_s']:>8.2f} "
+            f"{r['p99_s']:>8.2f} {r['mean_s']:>8.2f} {r['llm_calls_per_run']:>6.1f} {r['failure_rate'] * 100:>6.1f}%"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,55 @@
+"""
+Generate thumbnail and medium renditions for scans uploaded before
+derivatives existed (or whose background job failed). Until then the API
+serves the originals.
+
+Usage (from backend/):
+    python scripts/generate_derivatives.py --limit 1000 --concurrency 4
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import mongo_client, get_database
+from services.image_derivatives import image_derivatives
+from services.storage_service import storage_service
+from agents.image_preprocessing import shutdown_pool
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Render missing scan image derivatives")
+    parser.add_argument("--limit", type=int, default=0, help="max scans (0 = all)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    await mongo_client.connect()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    done = failed = 0
+
+    async def one(scan: dict):
+        nonlocal done, failed
+        async with semaphore:
+            if await image_derivatives.generate(str(scan["_id"]), scan["images"]):
+                done += 1
+            else:
+                failed += 1
+
+    try:
+        cursor = get_database().scans.find(
+            {"derivatives": {"$exists": False}, "images": {"$exists": True}},
+            {"images": 1}
+        ).limit(args.limit)
+        await asyncio.gather(*[one(scan) async for scan in cursor])
+        print(f"Generated derivatives for {done} scan(s), {failed} failed")
+    finally:
+        shutdown_pool()
+        await storage_service.close()
+        await mongo_client.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
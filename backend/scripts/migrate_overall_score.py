@@ -0,0 +1,34 @@
+"""
+Copy each analyzed scan's overall score to the top-level `overall_score` field.
+New analyses write it directly; this backfills scans stored before it existed.
+Older documents kept the score at analysis.overall_score, newer ones at
+analysis.metrics.overall_score. Safe to re-run: only scans missing the field
+are touched.
+
+Usage (from backend/):
+    python scripts/migrate_overall_score.py
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import mongo_client, get_database
+
+
+async def main():
+    await mongo_client.connect()
+    try:
+        result = await get_database().scans.update_many(
+            {"overall_score": {"$exists": False}, "analysis": {"$exists": True}},
+            [{"$set": {"overall_score": {"$ifNull": ["$analysis.overall_score", "$analysis.metrics.overall_score"]}}}]
+        )
+        print(f"Set overall_score on {result.modified_count} scan(s)")
+    finally:
+        await mongo_client.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
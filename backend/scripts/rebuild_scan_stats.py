@@ -0,0 +1,37 @@
+"""
+Rebuild per-user scan stats from the scans collection.
+Run once after deploying `scan_stats` (after scripts/migrate_overall_score.py),
+or any time the aggregates drift.
+Users without stats are also rebuilt lazily on their next scan.
+
+Usage (from backend/):
+    python scripts/rebuild_scan_stats.py
+    python scripts/rebuild_scan_stats.py --user-id <user id>
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import mongo_client
+from services.scan_stats import scan_stats
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Rebuild scan_stats from completed scans")
+    parser.add_argument("--user-id", default=None, help="only rebuild this user")
+    args = parser.parse_args()
+
+    await mongo_client.connect()
+    try:
+        written = await scan_stats.rebuild(args.user_id)
+        print(f"Rebuilt scan stats for {written} user(s)")
+    finally:
+        await mongo_client.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
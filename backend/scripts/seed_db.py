@@ -27,6 +27,8 @@ async def seed_db():
             "title": "Jawline Sculptor 101",
             "description": "The ultimate beginner guide to defining your jawline through mewing and chewing exercises.",
             "category": "jawline",
+            "tags": ["mewing", "chewing", "masseter"],
+            "target_metrics": ["jawline", "profile.chin_projection", "proportions.lower_third_score"],
             "difficulty": "beginner",
             "estimated_weeks": 4,
             "modules": [
@@ -86,6 +88,7 @@ async def seed_db():
             "title": "Glass Skin Routine",
             "description": "Achieve flawless skin texture.",
             "category": "skin",
+            "tags": ["hydration", "texture", "glass skin"],
             "difficulty": "intermediate",
             "estimated_weeks": 6,
             "modules": [
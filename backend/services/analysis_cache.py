@@ -0,0 +1,105 @@
+"""
+Analysis Cache - Content-addressed cache for scan analysis results
+Keyed by a digest of the three image payloads plus the model and prompt
+version. An in-process LRU sits in front of the `analysis_cache` Mongo
+collection, which evicts entries through a TTL index on created_at.
+"""
+
+import hashlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+from config import settings
+from db import get_database
+from models.scan import ScanAnalysis
+
+
+class AnalysisCache:
+    """Two-tier (memory + MongoDB) cache of serialized ScanAnalysis results"""
+
+    def __init__(self):
+        self.enabled = settings.analysis_cache_enabled
+        self.max_entries = settings.analysis_cache_lru_size
+        self._lru: "OrderedDict[str, dict]" = OrderedDict()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+
+    @staticmethod
+    def make_key(front_image: bytes, left_image: bytes, right_image: bytes, prompt_version: str) -> str:
+        """Digest of the image bytes plus model and prompt version"""
+        digest = hashlib.sha256()
+        for image in (front_image, left_image, right_image):
+            digest.update(hashlib.sha256(image).digest())
+        digest.update(f"{settings.gemini_model}:{prompt_version}".encode())
+        return digest.hexdigest()
+
+    def _remember(self, key: str, analysis: dict) -> None:
+        self._lru[key] = analysis
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[ScanAnalysis]:
+        """Look up a cached analysis, memory first"""
+        if not self.enabled:
+            return None
+
+        cached = self._lru.get(key)
+        if cached is not None:
+            self._lru.move_to_end(key)
+            self.memory_hits += 1
+            return ScanAnalysis.model_validate(cached)
+
+        try:
+            doc = await get_database().analysis_cache.find_one({"_id": key}, {"analysis": 1})
+        except Exception as e:
+            print(f"Analysis cache read error: {e}")
+            self.errors += 1
+            doc = None
+
+        if doc is None:
+            self.misses += 1
+            return None
+
+        self.db_hits += 1
+        self._remember(key, doc["analysis"])
+        return ScanAnalysis.model_validate(doc["analysis"])
+
+    async def set(self, key: str, analysis: ScanAnalysis) -> None:
+        """Store an analysis in both tiers"""
+        if not self.enabled:
+            return
+
+        data = analysis.model_dump(mode="json")
+        self._remember(key, data)
+        try:
+            await get_database().analysis_cache.replace_one(
+                {"_id": key},
+                {"_id": key, "analysis": data, "model": settings.gemini_model, "created_at": datetime.utcnow()},
+                upsert=True
+            )
+            self.writes += 1
+        except Exception as e:
+            print(f"Analysis cache write error: {e}")
+            self.errors += 1
+
+    def stats(self) -> dict:
+        """Hit/miss counters"""
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "memory_entries": len(self._lru),
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "errors": self.errors,
+            "hit_rate": round((self.memory_hits + self.db_hits) / lookups, 3) if lookups else 0.0
+        }
+
+
+# Singleton instance
+analysis_cache = AnalysisCache()
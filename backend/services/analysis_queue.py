@@ -0,0 +1,297 @@
+"""
+Analysis Queue - Persistent MongoDB job queue for scan analysis
+Jobs live in the `analysis_jobs` collection and are claimed atomically
+by a pool of async workers started with the application. A running job's
+lease is renewed while it runs, and only the worker holding it may finish
+it. Queued and running
+jobs carry `active: true`, which a unique partial index on scan_id turns
+into at most one active job per scan.
+"""
+
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional, List
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from config import settings
+from db import get_database
+from services.analysis_service import run_scan_analysis
+from services.scan_events import scan_events
+
+
+ACTIVE_JOB_STATUSES = ["queued", "running"]
+
+
+class JobAbandoned(Exception):
+    """The job's lease expired on its last allowed attempt - its worker keeps dying"""
+    retryable = False
+
+
+class AnalysisJobQueue:
+    """MongoDB-backed queue with an in-process async worker pool"""
+
+    def __init__(self):
+        self.worker_count = settings.analysis_workers
+        self.max_attempts = settings.analysis_job_max_attempts
+        self.lease_seconds = settings.analysis_job_lease_seconds
+        self.poll_interval = settings.analysis_queue_poll_seconds
+        self.instance_id = uuid.uuid4().hex[:8]
+        self._workers: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+    async def enqueue(self, scan_id: str, user_id: str) -> dict:
+        """
+        Queue a scan for analysis.
+        Returns the existing job if one is already queued or running for the scan.
+        """
+        db = get_database()
+        active_query = {"scan_id": scan_id, "status": {"$in": ACTIVE_JOB_STATUSES}}
+
+        existing = await db.analysis_jobs.find_one(active_query)
+        if existing:
+            return existing
+
+        now = datetime.utcnow()
+        job = {
+            "scan_id": scan_id,
+            "user_id": user_id,
+            "status": "queued",
+            "active": True,
+            "attempts": 0,
+            "max_attempts": self.max_attempts,
+            "run_after": now,
+            "locked_until": None,
+            "worker_id": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now
+        }
+        try:
+            result = await db.analysis_jobs.insert_one(job)
+        except DuplicateKeyError:
+            # A concurrent request (e.g. a double tap) queued the scan first
+            existing = await db.analysis_jobs.find_one(active_query)
+            if existing:
+                return existing
+            raise
+        job["_id"] = result.inserted_id
+
+        await db.scans.update_one(
+            {"_id": ObjectId(scan_id)},
+            {"$set": {"processing_status": "queued", "error_message": None}}
+        )
+        scan_events.publish(scan_id, "queued")
+
+        self._wakeup.set()
+        return job
+
+    async def get_job(self, job_id: str, user_id: str) -> Optional[dict]:
+        """Fetch a job owned by the given user"""
+        db = get_database()
+        return await db.analysis_jobs.find_one({"_id": ObjectId(job_id), "user_id": user_id})
+
+    async def claim(self, worker_id: str) -> Optional[dict]:
+        """
+        Atomically claim the oldest runnable job.
+        Running jobs whose lease has expired (crashed worker) are reclaimed
+        while they have attempts left.
+        """
+        db = get_database()
+        now = datetime.utcnow()
+
+        return await db.analysis_jobs.find_one_and_update(
+            {
+                "$or": [
+                    {"status": "queued", "run_after": {"$lte": now}},
+                    {
+                        "status": "running",
+                        "locked_until": {"$lt": now},
+                        "$expr": {"$lt": ["$attempts", "$max_attempts"]}
+                    }
+                ]
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "worker_id": worker_id,
+                    "locked_until": now + timedelta(seconds=self.lease_seconds),
+                    "started_at": now,
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def fail_abandoned(self) -> int:
+        """Fail jobs whose lease expired on their last allowed attempt. Returns how many."""
+        db = get_database()
+        failed = 0
+        while True:
+            now = datetime.utcnow()
+            # Take the job over first so only one worker fails it
+            job = await db.analysis_jobs.find_one_and_update(
+                {
+                    "status": "running",
+                    "locked_until": {"$lt": now},
+                    "$expr": {"$gte": ["$attempts", "$max_attempts"]}
+                },
+                {"$set": {"locked_until": now + timedelta(seconds=self.lease_seconds), "updated_at": now}}
+            )
+            if job is None:
+                return failed
+            await self._fail(job, JobAbandoned(f"Analysis did not finish after {job['attempts']} attempt(s)"))
+            failed += 1
+
+    @staticmethod
+    def _owned(job: dict) -> dict:
+        """Filter matching the job only while this claim of it still holds"""
+        return {"_id": job["_id"], "worker_id": job["worker_id"], "status": "running"}
+
+    async def _renew_lease(self, job: dict, run: asyncio.Task, lost: asyncio.Event) -> None:
+        """Extend the lease while the job runs; cancel the run if the job was taken over"""
+        db = get_database()
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            now = datetime.utcnow()
+            try:
+                result = await db.analysis_jobs.update_one(
+                    self._owned(job),
+                    {"$set": {"locked_until": now + timedelta(seconds=self.lease_seconds), "updated_at": now}}
+                )
+            except Exception as e:
+                print(f"Analysis job lease renewal error: {e}")
+                continue
+            if result.matched_count == 0:
+                lost.set()
+                run.cancel()
+                return
+
+    async def _complete(self, job: dict) -> None:
+        """Mark a job as completed"""
+        db = get_database()
+        now = datetime.utcnow()
+        await db.analysis_jobs.update_one(
+            self._owned(job),
+            {
+                "$set": {"status": "completed", "locked_until": None, "finished_at": now, "updated_at": now},
+                "$unset": {"active": ""}
+            }
+        )
+
+    async def _fail(self, job: dict, error: Exception) -> None:
+        """
+        Requeue a failed job with backoff, or mark it and its scan as failed.
+        Errors with retryable=False (e.g. rejected photos) fail immediately.
+        Nothing is written if another worker has taken the job over.
+        """
+        db = get_database()
+        now = datetime.utcnow()
+
+        retryable = getattr(error, "retryable", True)
+        if retryable and job.get("attempts", 0) < job.get("max_attempts", self.max_attempts):
+            delay = 2 ** job.get("attempts", 0)
+            result = await db.analysis_jobs.update_one(
+                self._owned(job),
+                {"$set": {
+                    "status": "queued",
+                    "locked_until": None,
+                    "run_after": now + timedelta(seconds=delay),
+                    "error": str(error),
+                    "updated_at": now
+                }}
+            )
+            if not result.matched_count:
+                return
+            await db.scans.update_one(
+                {"_id": ObjectId(job["scan_id"])},
+                {"$set": {"processing_status": "queued"}}
+            )
+            scan_events.publish(job["scan_id"], "retrying", {"attempt": job.get("attempts", 0), "error": str(error)})
+            return
+
+        result = await db.analysis_jobs.update_one(
+            self._owned(job),
+            {
+                "$set": {
+                    "status": "failed",
+                    "locked_until": None,
+                    "error": str(error),
+                    "finished_at": now,
+                    "updated_at": now
+                },
+                "$unset": {"active": ""}
+            }
+        )
+        if not result.matched_count:
+            return
+        await db.scans.update_one(
+            {"_id": ObjectId(job["scan_id"])},
+            {"$set": {"processing_status": "failed", "error_message": str(error)}}
+        )
+        scan_events.publish(job["scan_id"], "failed", {"error": str(error)})
+
+    async def _worker(self, worker_id: str) -> None:
+        """Claim and run jobs until the queue is stopped"""
+        while not self._stopping:
+            try:
+                job = await self.claim(worker_id)
+            except Exception as e:
+                print(f"Analysis queue claim error: {e}")
+                job = None
+
+            if job is None:
+                try:
+                    await self.fail_abandoned()
+                except Exception as e:
+                    print(f"Analysis queue sweep error: {e}")
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            run = asyncio.create_task(run_scan_analysis(job["scan_id"], job["user_id"]))
+            lost = asyncio.Event()
+            renewer = asyncio.create_task(self._renew_lease(job, run, lost))
+            try:
+                await run
+                await self._complete(job)
+            except asyncio.CancelledError:
+                if not lost.is_set():
+                    raise
+                print(f"Analysis job {job['_id']} was taken over by another worker - abandoned")
+            except Exception as e:
+                print(f"Analysis job {job['_id']} failed (attempt {job.get('attempts')}): {e}")
+                await self._fail(job, e)
+            finally:
+                renewer.cancel()
+                await asyncio.gather(renewer, return_exceptions=True)
+
+    async def start(self) -> None:
+        """Start the worker pool"""
+        if self._workers:
+            return
+        self._stopping = False
+        for i in range(self.worker_count):
+            worker_id = f"{self.instance_id}-{i}"
+            self._workers.append(asyncio.create_task(self._worker(worker_id)))
+        print(f"⚙️ Started {self.worker_count} analysis workers")
+
+    async def stop(self) -> None:
+        """Stop the worker pool; in-flight jobs are reclaimed once their lease expires"""
+        self._stopping = True
+        self._wakeup.set()
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+# Singleton instance
+analysis_queue = AnalysisJobQueue()
@@ -0,0 +1,140 @@
+"""
+Analysis Service - Runs face scan analysis and updates the leaderboard
+Executed by analysis queue workers, outside of the HTTP request
+"""
+
+from datetime import datetime
+from typing import Iterable
+from bson import ObjectId
+from db import get_database
+from services.storage_service import storage_service
+from services.metrics import metrics
+from services.scan_events import scan_events
+from services.scan_stats import scan_stats
+from agents.face_scan_agent import face_scan_agent
+from agents.langgraph_workflow import checkpoint_version
+
+
+async def fetch_scan_images(scan: dict) -> tuple:
+    """Load front/left/right image bytes for a scan concurrently - handles local and S3 storage"""
+    images = scan["images"]
+    return tuple(await storage_service.get_images([images["front"], images["left"], images["right"]]))
+
+
+async def run_scan_analysis(scan_id: str, user_id: str) -> None:
+    """
+    Run the full analysis pipeline for a scan and update the leaderboard.
+    Raises on failure so the caller can record the error.
+    Per-phase timings and LLM token usage are stored on the scan document.
+    """
+    db = get_database()
+
+    with metrics.trace() as trace:
+        try:
+            with metrics.span("scan/total"):
+                await _analyze_and_record(db, scan_id, user_id)
+        finally:
+            if trace.timings:
+                timing_fields = {f"timings.{name}": ms for name, ms in trace.timings.items()}
+                await db.scans.update_one(
+                    {"_id": ObjectId(scan_id)},
+                    {"$set": {**timing_fields, "llm_usage": trace.llm_usage}}
+                )
+
+
+async def _analyze_and_record(db, scan_id: str, user_id: str) -> None:
+    """Analysis phases, each inside its own timing span"""
+    with metrics.span("scan/load_scan"):
+        scan = await db.scans.find_one({"_id": ObjectId(scan_id), "user_id": user_id})
+        if not scan:
+            raise ValueError(f"Scan {scan_id} not found")
+
+        await db.scans.update_one({"_id": ObjectId(scan_id)}, {"$set": {"processing_status": "processing"}})
+        scan_events.publish(scan_id, "processing")
+
+    with metrics.span("scan/fetch_images"):
+        front_data, left_data, right_data = await fetch_scan_images(scan)
+    if not all([front_data, left_data, right_data]):
+        raise RuntimeError("Failed to retrieve images")
+
+    with metrics.span("scan/analyze"):
+        analysis = await face_scan_agent.analyze(front_data, left_data, right_data, scan_id=scan_id)
+
+    with metrics.span("scan/save_analysis"):
+        await db.scans.update_one(
+            {"_id": ObjectId(scan_id)},
+            {"$set": {
+                "analysis": analysis.model_dump(),
+                "overall_score": analysis.metrics.overall_score,
+                "analysis_version": checkpoint_version(),
+                "processing_status": "completed"
+            }}
+        )
+
+    scan_events.publish(scan_id, "completed", {"overall_score": analysis.metrics.overall_score})
+
+    with metrics.span("scan/update_leaderboard"):
+        await update_leaderboard(scan, analysis.metrics.overall_score)
+
+
+async def update_leaderboard(scan: dict, overall_score: float) -> None:
+    """Fold a completed scan into the user's stats, update their leaderboard entry and re-rank"""
+    db = get_database()
+    user_id = scan["user_id"]
+
+    # Count each scan once - retried jobs reach here again after the analysis was saved
+    claim = await db.scans.update_one(
+        {"_id": scan["_id"], "stats_recorded": {"$ne": True}},
+        {"$set": {"stats_recorded": True}}
+    )
+    stats = None
+    if claim.modified_count:
+        stats = await scan_stats.record_scan(user_id, overall_score, scan.get("created_at", datetime.utcnow()))
+    if stats is None:
+        # Already counted (a re-analysis or retried job - the score may have changed),
+        # first scan, history from before scan_stats, or a rebuild in flight
+        await scan_stats.rebuild(user_id)
+        stats = await scan_stats.get_stats(user_id)
+    if not stats:
+        return
+
+    await upsert_leaderboard_entry(user_id, stats)
+    await rerank_leaderboard()
+
+
+async def upsert_leaderboard_entry(user_id: str, stats: dict) -> None:
+    """Write the user's leaderboard entry from their scan stats"""
+    db = get_database()
+    # Leaderboard score is the best overall_score, scaled to 100
+    await db.leaderboard.update_one(
+        {"user_id": user_id},
+        {
+            "$set": {
+                "score": float(stats["best_score"] or 0) * 10,
+                "level": float(stats["latest"]["score"] or 0),
+                "improvement_percentage": scan_stats.improvement_percentage(stats),
+                "scans_count": stats["count"],
+                "last_scan_at": stats["last_scan_at"]
+            },
+            "$setOnInsert": {"streak_days": 1, "created_at": datetime.utcnow()}
+        },
+        upsert=True
+    )
+
+
+async def refresh_leaderboard(user_ids: Iterable[str]) -> None:
+    """Rebuild the stats and leaderboard entries of users whose scores were rewritten, then re-rank"""
+    for user_id in user_ids:
+        await scan_stats.rebuild(user_id)
+        stats = await scan_stats.get_stats(user_id)
+        if stats:
+            await upsert_leaderboard_entry(user_id, stats)
+    await rerank_leaderboard()
+
+
+async def rerank_leaderboard() -> None:
+    """Recalculate ranks for all leaderboard entries"""
+    db = get_database()
+    all_entries = await db.leaderboard.find().sort("score", -1).to_list(None)
+    for rank, entry in enumerate(all_entries, 1):
+        await db.leaderboard.update_one({"_id": entry["_id"]}, {"$set": {"rank": rank}})
@@ -0,0 +1,383 @@
+"""
+Backfill Service - Admin-triggered bulk re-analysis of historical scans
+Completed scans whose `analysis_version` differs from the current pipeline
+version are read in `_id`-ordered batches, analyzed by a bounded worker pool under
+a global LLM requests-per-second budget, and written back with bulk_write.
+Progress and the resume cursor live in the `backfill_jobs` collection.
+Each written batch refreshes the affected users' scan stats and leaderboard
+entries. The owning instance renews the job's lease on a timer and stops the
+run if another instance has taken the job over.
+"""
+
+import asyncio
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from config import settings
+from db import get_database
+from agents.langgraph_workflow import checkpoint_version, execute_face_analysis, get_pipeline_mode, pipeline_version
+from services.analysis_cache import analysis_cache
+from services.analysis_service import fetch_scan_images, refresh_leaderboard
+
+
+# Upstream LLM requests one scan costs in each pipeline mode
+LLM_CALLS_PER_SCAN = {"multi_step": 2, "single_shot": 1}
+
+# Most recent per-scan errors kept on the job document
+MAX_RECORDED_ERRORS = 20
+
+
+class RateLimiter:
+    """Token bucket shared by every backfill worker"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        # A bucket smaller than one scan's cost could never fill up enough
+        self.capacity = max(burst or rate, max(LLM_CALLS_PER_SCAN.values()), 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, cost: float = 1.0) -> None:
+        """Wait until `cost` tokens are available"""
+        if cost > self.capacity:
+            raise ValueError(f"Cost {cost} exceeds the bucket capacity {self.capacity}")
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= cost:
+                    self.tokens -= cost
+                    return
+                await asyncio.sleep((cost - self.tokens) / self.rate)
+
+
+class BackfillRun:
+    """In-process state for one running backfill job"""
+
+    def __init__(self, job: dict):
+        self.job_id = job["_id"]
+        self.version = job["version"]
+        self.mode = job["mode"]
+        self.force = job.get("force", False)
+        self.total = job.get("total", 0)
+        self.processed = job.get("processed", 0)
+        self.succeeded = job.get("succeeded", 0)
+        self.failed = job.get("failed", 0)
+        self.errors: List[dict] = list(job.get("errors", []))
+        self.cursor: Optional[ObjectId] = job.get("cursor")
+        self.started = time.monotonic()
+        self.processed_at_start = self.processed
+        # Scan ids in dispatch order, and those whose result has been written
+        self.dispatched: deque = deque()
+        self.settled: set = set()
+        self.pending_writes: List[UpdateOne] = []
+        # Set when another instance took the job over - nothing more is written
+        self.lost = False
+        self.task: Optional[asyncio.Task] = None
+        # Users whose scores are in pending_writes - their stats and ranks are refreshed on flush
+        self.rescored_users: set = set()
+
+    def throughput(self) -> float:
+        """Scans per second since this process started the run"""
+        elapsed = time.monotonic() - self.started
+        return (self.processed - self.processed_at_start) / elapsed if elapsed > 0 else 0.0
+
+    def eta_seconds(self) -> Optional[float]:
+        rate = self.throughput()
+        if rate <= 0:
+            return None
+        return max(self.total - self.processed, 0) / rate
+
+    def advance_cursor(self) -> None:
+        """Move the resume cursor past the longest fully-settled prefix"""
+        while self.dispatched and self.dispatched[0] in self.settled:
+            scan_id = self.dispatched.popleft()
+            self.settled.discard(scan_id)
+            self.cursor = scan_id
+
+
+class BackfillEngine:
+    """Runs backfill jobs as background tasks with checkpointed progress"""
+
+    def __init__(self):
+        self.instance_id = uuid.uuid4().hex[:8]
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def _scan_filter(self, run: BackfillRun, after: Optional[ObjectId]) -> dict:
+        query = {"processing_status": "completed"}
+        if not run.force:
+            query["analysis_version"] = {"$ne": run.version}
+        if after is not None:
+            query["_id"] = {"$gt": after}
+        return query
+
+    def _owned(self, run: BackfillRun) -> dict:
+        """Filter matching the job only while this instance holds it"""
+        return {"_id": run.job_id, "worker_id": self.instance_id, "status": "running"}
+
+    async def _keep_lease(self, run: BackfillRun) -> None:
+        """Renew the lease on a timer; stop the run if another instance took the job over"""
+        while True:
+            await asyncio.sleep(settings.backfill_lease_seconds / 3)
+            now = datetime.utcnow()
+            try:
+                result = await get_database().backfill_jobs.update_one(
+                    self._owned(run),
+                    {"$set": {
+                        "locked_until": now + timedelta(seconds=settings.backfill_lease_seconds),
+                        "updated_at": now
+                    }}
+                )
+            except Exception as e:
+                print(f"Backfill lease renewal error: {e}")
+                continue
+            if not result.matched_count:
+                run.lost = True
+                run.task.cancel()
+                return
+
+    async def create(
+        self,
+        mode: Optional[str] = None,
+        force: bool = False,
+        concurrency: Optional[int] = None,
+        rps: Optional[float] = None
+    ) -> dict:
+        """Create a backfill job for stale (or, with force, all) completed scans and start it"""
+        db = get_database()
+        mode = get_pipeline_mode(mode)
+        version = checkpoint_version(mode)
+
+        query = {"processing_status": "completed"}
+        if not force:
+            query["analysis_version"] = {"$ne": version}
+
+        now = datetime.utcnow()
+        job = {
+            "status": "running",
+            "mode": mode,
+            "version": version,
+            "force": force,
+            "concurrency": concurrency or settings.backfill_workers,
+            "rps": rps or settings.backfill_rps,
+            "total": await db.scans.count_documents(query),
+            "processed": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "errors": [],
+            "cursor": None,
+            "worker_id": self.instance_id,
+            "locked_until": now + timedelta(seconds=settings.backfill_lease_seconds),
+            "created_at": now,
+            "updated_at": now
+        }
+        result = await db.backfill_jobs.insert_one(job)
+        job["_id"] = result.inserted_id
+        self._start(job)
+        return job
+
+    async def resume(self, job_id: str) -> Optional[dict]:
+        """
+        Resume a cancelled or interrupted job from its checkpointed cursor.
+        A running job is only taken over once its lease has expired.
+        """
+        db = get_database()
+        now = datetime.utcnow()
+        job = await db.backfill_jobs.find_one_and_update(
+            {
+                "_id": ObjectId(job_id),
+                "$or": [
+                    {"status": {"$in": ["cancelled", "failed"]}},
+                    {"status": "running", "locked_until": {"$lt": now}}
+                ]
+            },
+            {"$set": {
+                "status": "running",
+                "worker_id": self.instance_id,
+                "locked_until": now + timedelta(seconds=settings.backfill_lease_seconds),
+                "updated_at": now
+            }},
+            return_document=ReturnDocument.AFTER
+        )
+        if job is not None:
+            self._start(job)
+        return job
+
+    async def cancel(self, job_id: str) -> bool:
+        """Stop a job; in-flight scans are abandoned and picked up again on resume"""
+        task = self._tasks.get(job_id)
+        if task is None:
+            return False
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return True
+
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        return await get_database().backfill_jobs.find_one({"_id": ObjectId(job_id)})
+
+    def _start(self, job: dict) -> None:
+        job_id = str(job["_id"])
+        self._tasks[job_id] = asyncio.create_task(self._run(job))
+
+    async def stop(self) -> None:
+        """Cancel all running jobs (called on shutdown)"""
+        for job_id in list(self._tasks):
+            await self.cancel(job_id)
+
+    async def _run(self, job: dict) -> None:
+        job_id = str(job["_id"])
+        run = BackfillRun(job)
+        limiter = RateLimiter(job["rps"])
+        queue: asyncio.Queue = asyncio.Queue(maxsize=job["concurrency"] * 2)
+        write_lock = asyncio.Lock()
+        workers = [
+            asyncio.create_task(self._worker(run, queue, limiter, write_lock))
+            for _ in range(job["concurrency"])
+        ]
+        run.task = asyncio.current_task()
+        renewer = asyncio.create_task(self._keep_lease(run))
+
+        status = "completed"
+        try:
+            after = run.cursor
+            while True:
+                # A fresh query per batch: at low rps one long-lived cursor would be
+                # dropped by the server between getMores
+                batch = await get_database().scans.find(
+                    self._scan_filter(run, after),
+                    {"images": 1, "user_id": 1}
+                ).sort("_id", 1).limit(settings.backfill_batch_size).to_list(None)
+                if not batch:
+                    break
+                for scan in batch:
+                    run.dispatched.append(scan["_id"])
+                    await queue.put(scan)
+                after = batch[-1]["_id"]
+
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        except asyncio.CancelledError:
+            status = "cancelled"
+        except Exception as e:
+            print(f"Backfill {job_id} failed: {e}")
+            status = "failed"
+            run.errors.append({"scan_id": None, "error": str(e)})
+        finally:
+            renewer.cancel()
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(renewer, *workers, return_exceptions=True)
+            if run.lost:
+                print(f"Backfill {job_id} was taken over by another instance - stopped")
+            else:
+                async with write_lock:
+                    await self._flush(run, status=status)
+            self._tasks.pop(job_id, None)
+
+    async def _worker(
+        self,
+        run: BackfillRun,
+        queue: asyncio.Queue,
+        limiter: RateLimiter,
+        write_lock: asyncio.Lock
+    ) -> None:
+        """Analyze scans from the queue and batch their results"""
+        while True:
+            scan = await queue.get()
+            if scan is None:
+                return
+
+            await limiter.acquire(LLM_CALLS_PER_SCAN.get(run.mode, 1))
+            operation = None
+            try:
+                front, left, right = await fetch_scan_images(scan)
+                if not all([front, left, right]):
+                    raise RuntimeError("Failed to retrieve images")
+                analysis = await self._analyze(run, front, left, right)
+                operation = UpdateOne(
+                    {"_id": scan["_id"]},
+                    {"$set": {
+                        "analysis": analysis.model_dump(),
+                        "overall_score": analysis.metrics.overall_score,
+                        "analysis_version": run.version,
+                        "reanalyzed_at": datetime.utcnow()
+                    }}
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                run.errors = (run.errors + [{"scan_id": str(scan["_id"]), "error": str(e)}])[-MAX_RECORDED_ERRORS:]
+
+            async with write_lock:
+                run.processed += 1
+                if operation is not None:
+                    run.succeeded += 1
+                    run.pending_writes.append(operation)
+                    run.rescored_users.add(scan["user_id"])
+                else:
+                    run.failed += 1
+                run.settled.add(scan["_id"])
+                batch_size = settings.backfill_batch_size
+                if len(run.pending_writes) >= batch_size or len(run.settled) >= batch_size:
+                    await self._flush(run)
+
+    async def _analyze(self, run: BackfillRun, front: bytes, left: bytes, right: bytes):
+        """
+        Analyze in the job's pipeline mode. Cache hits are reused unless the job
+        is forced; a run where any step fell back raises, so the scan counts as
+        failed and keeps its existing analysis.
+        """
+        cache_key = analysis_cache.make_key(front, left, right, pipeline_version(run.mode))
+        if not run.force:
+            cached = await analysis_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        analysis, error = await execute_face_analysis(front, left, right, mode=run.mode)
+        if error is not None:
+            raise RuntimeError(error)
+        await analysis_cache.set(cache_key, analysis)
+        return analysis
+
+    async def _flush(self, run: BackfillRun, status: Optional[str] = None) -> None:
+        """Write batched results, then checkpoint progress and renew the lease while we own the job"""
+        db = get_database()
+        if run.pending_writes:
+            await db.scans.bulk_write(run.pending_writes, ordered=False)
+            run.pending_writes = []
+        if run.rescored_users:
+            users, run.rescored_users = run.rescored_users, set()
+            await refresh_leaderboard(users)
+        run.advance_cursor()
+
+        now = datetime.utcnow()
+        update = {
+            "processed": run.processed,
+            "succeeded": run.succeeded,
+            "failed": run.failed,
+            "errors": run.errors,
+            "cursor": run.cursor,
+            "throughput_per_second": round(run.throughput(), 3),
+            "eta_seconds": round(run.eta_seconds(), 1) if run.eta_seconds() is not None else None,
+            "locked_until": now + timedelta(seconds=settings.backfill_lease_seconds),
+            "updated_at": now
+        }
+        if status is not None:
+            update.update({"status": status, "locked_until": None})
+            if status == "completed":
+                update["finished_at"] = now
+        result = await db.backfill_jobs.update_one(self._owned(run), {"$set": update})
+        if not result.matched_count and status is None:
+            run.lost = True
+            run.task.cancel()
+
+
+# Singleton instance
+backfill_engine = BackfillEngine()
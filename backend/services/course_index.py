@@ -0,0 +1,173 @@
+"""
+Course Index - In-memory course recommendation index over the `courses` collection
+Each active course becomes a row of metric weights (its `target_metrics`, or
+the defaults for its category) and keyword flags (category and `tags`). A
+scan is scored against every course at once: room-to-improve per metric times
+the weight matrix, plus a boost for courses matching the suggested
+improvement areas. The index is rebuilt on course writes and after a TTL so
+other instances pick up changes.
+"""
+
+import asyncio
+import re
+import time
+from typing import Dict, List, Optional
+import numpy as np
+from config import settings
+from db import get_database
+from models.fast_construct import SCORE_SCHEMA, SCORE_LOW, SCORE_HIGH, clamp_scores
+
+
+# Metrics a course targets when it does not list `target_metrics` itself.
+# Entries are sections ("jawline") or single scores ("profile.chin_projection").
+CATEGORY_METRICS: Dict[str, List[str]] = {
+    "jawline": ["jawline", "profile.chin_projection", "profile.ramus_visibility", "profile.submental_area"],
+    "mewing": ["jawline.definition_score", "proportions.lower_third_score", "profile", "cheekbones.prominence_score"],
+    "skin": ["skin", "forehead.skin_texture"],
+    "skincare": ["skin", "forehead.skin_texture"],
+    "fat_loss": ["body_fat", "cheekbones.hollowness_below", "profile.submental_area", "jawline.definition_score"],
+    "posture": ["profile"],
+    "hair": ["hair"],
+    "mindset": [],
+}
+
+# Extra words an improvement area may use for a category
+CATEGORY_KEYWORDS: Dict[str, List[str]] = {
+    "jawline": ["jaw", "chin", "masseter"],
+    "mewing": ["tongue", "posture"],
+    "skin": ["acne", "complexion", "pores"],
+    "skincare": ["skin", "acne", "complexion"],
+    "fat_loss": ["fat", "body", "leanness", "bloat"],
+    "posture": ["neck", "head"],
+    "hair": ["hairline", "beard"],
+    "mindset": ["confidence"],
+}
+
+# Boost per improvement area matching a course keyword, by improvement priority
+PRIORITY_BOOST = {"high": 0.3, "medium": 0.2, "low": 0.1}
+
+SCORE_COLUMNS = {
+    f"{section}.{name}" if section else name: index
+    for index, (section, name, _, _, _) in enumerate(SCORE_SCHEMA)
+}
+
+_WORD_RE = re.compile(r"[a-z]+")
+
+
+def _columns_for(target: str) -> List[int]:
+    """Score columns for a section name or a dotted score path"""
+    if target in SCORE_COLUMNS:
+        return [SCORE_COLUMNS[target]]
+    prefix = f"{target}."
+    return [index for path, index in SCORE_COLUMNS.items() if path.startswith(prefix)]
+
+
+def _words(text: str) -> List[str]:
+    words = _WORD_RE.findall(text.lower().replace("_", " "))
+    # Crude singularization so "cheekbones" matches "cheekbone"
+    return words + [w[:-1] for w in words if len(w) > 3 and w.endswith("s")]
+
+
+class CourseRecommendationIndex:
+    """Vectorized course scoring, rebuilt from MongoDB"""
+
+    def __init__(self):
+        self.course_ids: List[str] = []
+        self.weights = np.zeros((0, len(SCORE_SCHEMA)))
+        self.vocabulary: Dict[str, int] = {}
+        self.keywords = np.zeros((0, 0))
+        self.loaded_at: Optional[float] = None
+        # Why the last refresh failed, until one succeeds
+        self.refresh_error: Optional[str] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def build(self, courses: List[dict]) -> None:
+        """Build the weight and keyword matrices from course documents"""
+        weights = np.zeros((len(courses), len(SCORE_SCHEMA)))
+        course_words: List[set] = []
+        for row, course in enumerate(courses):
+            category = str(course.get("category") or "")
+            targets = course.get("target_metrics") or CATEGORY_METRICS.get(category, [])
+            for target in targets:
+                weights[row, _columns_for(target)] = 1.0
+
+            words = set(_words(category))
+            for tag in (course.get("tags") or []) + CATEGORY_KEYWORDS.get(category, []):
+                words.update(_words(tag))
+            course_words.append(words)
+
+        # Each course's weights sum to 1, so broad and narrow courses compare fairly
+        totals = weights.sum(axis=1, keepdims=True)
+        weights = np.divide(weights, totals, out=np.zeros_like(weights), where=totals > 0)
+
+        vocabulary = {word: i for i, word in enumerate(sorted(set().union(*course_words)))}
+        keywords = np.zeros((len(courses), len(vocabulary)))
+        for row, words in enumerate(course_words):
+            keywords[row, [vocabulary[w] for w in words]] = 1.0
+
+        self.course_ids = [str(course["_id"]) for course in courses]
+        self.weights = weights
+        self.vocabulary = vocabulary
+        self.keywords = keywords
+        self.loaded_at = time.monotonic()
+
+    async def refresh(self) -> None:
+        """Reload active courses from MongoDB"""
+        try:
+            cursor = get_database().courses.find(
+                {"is_active": True},
+                {"category": 1, "tags": 1, "target_metrics": 1}
+            )
+            self.build(await cursor.to_list(None))
+        except Exception as e:
+            self.refresh_error = repr(e)
+            raise
+        self.refresh_error = None
+
+    async def ensure_fresh(self) -> None:
+        """Load on first use and again once the TTL has passed"""
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < settings.course_index_ttl_seconds:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.loaded_at is None or time.monotonic() - self.loaded_at >= settings.course_index_ttl_seconds:
+                try:
+                    await self.refresh()
+                except Exception as e:
+                    # Keep serving the previous index; retry after the TTL.
+                    # refresh_error stays set so callers can report it.
+                    print(f"Course index refresh error: {e}")
+                    self.loaded_at = time.monotonic()
+
+    def score(self, metrics: dict, improvements: List[dict]) -> np.ndarray:
+        """Relevance of every course for one scan's metrics and improvement areas"""
+        scores = clamp_scores([metrics])[0]
+        room = np.nan_to_num((SCORE_HIGH - scores) / (SCORE_HIGH - SCORE_LOW))
+        relevance = self.weights @ room
+
+        if improvements and self.vocabulary:
+            areas = np.zeros(len(self.vocabulary))
+            for improvement in improvements:
+                boost = PRIORITY_BOOST.get(str(improvement.get("priority", "medium")), 0.2)
+                for word in _words(str(improvement.get("area", ""))):
+                    index = self.vocabulary.get(word)
+                    if index is not None:
+                        areas[index] = max(areas[index], boost)
+            relevance = relevance + (self.keywords * areas).max(axis=1, initial=0.0)
+        return relevance
+
+    async def recommend(self, metrics: dict, improvements: List[dict], limit: Optional[int] = None) -> List[str]:
+        """Ids of the most relevant active courses, best first"""
+        await self.ensure_fresh()
+        if not self.course_ids:
+            return []
+
+        relevance = self.score(metrics, improvements)
+        limit = limit or settings.course_recommendation_limit
+        ranked = np.argsort(-relevance, kind="stable")[:limit]
+        return [self.course_ids[i] for i in ranked if relevance[i] >= settings.course_recommendation_min_score]
+
+
+# Singleton instance
+course_index = CourseRecommendationIndex()
@@ -0,0 +1,164 @@
+"""
+Direct Upload - Two-phase scan uploads straight to storage
+Phase one issues a presigned target per image (an S3 POST policy, or a
+signed token for the local upload endpoint) and records a pending upload
+in `scan_uploads`. The client sends the images to storage itself; phase
+two moves each object to a sealed key the client cannot write, then checks
+it exists, fits the size limit and really is the declared image type before
+the scan document is created. Image bytes never pass through the API worker.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from starlette.requests import Request
+from config import settings
+from db import get_database
+from services.storage_service import storage_service, IMAGE_EXTENSIONS
+from services.upload_stream import (
+    UploadRejected, UploadedImage, stream_image_body, sniff_image_type, SCAN_IMAGE_FIELDS, SNIFF_BYTES
+)
+
+
+class DirectUploadService:
+    """Issues direct upload targets and finalizes them into scans"""
+
+    @property
+    def max_bytes(self) -> int:
+        return settings.upload_max_image_mb * 1024 * 1024
+
+    async def create(self, user_id: str, content_types: Dict[str, str]) -> dict:
+        """Pending upload with one target per scan image"""
+        for name, content_type in content_types.items():
+            if content_type not in IMAGE_EXTENSIONS:
+                raise UploadRejected(415, f"Image '{name}' must be one of {', '.join(IMAGE_EXTENSIONS)}")
+
+        now = datetime.utcnow()
+        images = {
+            name: {"url": storage_service.new_image_url(user_id, name, content_types[name]), "content_type": content_types[name]}
+            for name in SCAN_IMAGE_FIELDS
+        }
+        upload = {
+            "user_id": user_id,
+            "status": "pending",  # pending, finalizing, finalized, rejected
+            "images": images,
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=settings.upload_url_expire_seconds)
+        }
+        result = await get_database().scan_uploads.insert_one(upload)
+
+        targets = {
+            name: storage_service.create_upload_target(
+                image["url"], image["content_type"], self.max_bytes, str(result.inserted_id)
+            )
+            for name, image in images.items()
+        }
+        return {"upload_id": str(result.inserted_id), "expires_at": upload["expires_at"], "max_bytes": self.max_bytes, "targets": targets}
+
+    async def finalize(self, upload_id: str, user_id: str) -> Dict[str, str]:
+        """
+        Claim a pending upload, seal its images and verify them.
+        Returns {field: sealed url}. Raises UploadRejected: 404 unknown, 409 not all
+        images uploaded yet (the client may retry), 415/413 invalid content
+        (the upload is rejected and its objects deleted).
+        """
+        db = get_database()
+        try:
+            upload_oid = ObjectId(upload_id)
+        except InvalidId:
+            raise UploadRejected(404, "Upload not found")
+
+        # Claim the upload so concurrent finalize calls cannot create two scans
+        upload = await db.scan_uploads.find_one_and_update(
+            {"_id": upload_oid, "user_id": user_id, "status": "pending", "expires_at": {"$gt": datetime.utcnow()}},
+            {"$set": {"status": "finalizing"}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not upload:
+            raise UploadRejected(404, "Upload not found, expired or already finalized")
+
+        try:
+            sealed = {}
+            for name, image in upload["images"].items():
+                # Seal before verifying, so the client cannot swap the bytes afterwards
+                sealed[name] = await storage_service.seal_image(image["url"])
+                if sealed[name] is None:
+                    raise UploadRejected(409, f"Image '{name}' has not been uploaded")
+            for name, image in upload["images"].items():
+                await self._verify(name, {**image, "url": sealed[name]})
+        except UploadRejected as e:
+            if e.status_code == 409:
+                await db.scan_uploads.update_one({"_id": upload_oid}, {"$set": {"status": "pending"}})
+            else:
+                await self._reject(upload, e.detail)
+            raise
+        except Exception:
+            # Storage unavailable - let the client retry
+            await db.scan_uploads.update_one({"_id": upload_oid}, {"$set": {"status": "pending"}})
+            raise
+
+        return sealed
+
+    async def release(self, upload_id: str) -> None:
+        """Return a claimed upload to pending after creating its scan failed, so the client can retry"""
+        await get_database().scan_uploads.update_one(
+            {"_id": ObjectId(upload_id), "status": "finalizing"},
+            {"$set": {"status": "pending"}}
+        )
+
+    async def complete(self, upload_id: str, scan_id: str) -> None:
+        """Record the scan created from a finalized upload"""
+        await get_database().scan_uploads.update_one(
+            {"_id": ObjectId(upload_id)},
+            {"$set": {"status": "finalized", "scan_id": scan_id, "finalized_at": datetime.utcnow()}}
+        )
+
+    async def _verify(self, name: str, image: dict) -> None:
+        probe = await storage_service.probe_image(image["url"], SNIFF_BYTES)
+        if probe is None:
+            raise UploadRejected(409, f"Image '{name}' has not been uploaded")
+        size, head = probe
+        if size > self.max_bytes:
+            raise UploadRejected(413, f"Image '{name}' exceeds {settings.upload_max_image_mb} MB")
+        if sniff_image_type(head) != image["content_type"]:
+            raise UploadRejected(415, f"Image '{name}' is not a valid {image['content_type']} file")
+
+    async def _reject(self, upload: dict, reason: str) -> None:
+        for image in upload["images"].values():
+            await storage_service.delete_image(image["url"])
+            await storage_service.delete_image(storage_service.sealed_url(image["url"]))
+        await get_database().scan_uploads.update_one(
+            {"_id": upload["_id"]},
+            {"$set": {"status": "rejected", "error": reason}}
+        )
+
+    async def receive_local(self, token: str, request: Request) -> Optional[UploadedImage]:
+        """
+        Local stand-in for a presigned PUT: stream the body to the signed URL.
+        Returns None if the token is invalid or expired, or its upload is no
+        longer pending (finalized images must not be overwritten).
+        """
+        claims = storage_service.verify_upload_token(token)
+        if not claims or not claims.get("upload_id"):
+            return None
+        try:
+            pending = await get_database().scan_uploads.find_one(
+                {"_id": ObjectId(claims["upload_id"]), "status": "pending"}, {"_id": 1}
+            )
+        except InvalidId:
+            return None
+        if pending is None:
+            return None
+
+        async def open_writer(content_type: str):
+            if content_type != claims["content_type"]:
+                raise UploadRejected(415, f"Expected {claims['content_type']}, got {content_type}")
+            return await storage_service.open_writer(claims["url"], content_type)
+
+        return await stream_image_body(request, "image", claims["max_bytes"], open_writer)
+
+
+# Singleton instance
+direct_uploads = DirectUploadService()
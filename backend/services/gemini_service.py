@@ -5,8 +5,9 @@ Uses Gemini 2.5 Flash with structured outputs
 
 import google.generativeai as genai
 from typing import Optional, List
-from config import settings
 from models.scan import FaceMetrics, ScanAnalysis
+from services.llm_client import llm_client, response_schema_for
+from services.json_extraction import extract_json
 
 
 # Exhaustive system prompt for face analysis
@@ -217,9 +218,7 @@ class GeminiService:
     """Gemini LLM service for face analysis and chat"""
     
     def __init__(self):
-        genai.configure(api_key=settings.gemini_api_key)
-        self.model = genai.GenerativeModel(settings.gemini_model)
-        self.vision_model = genai.GenerativeModel(settings.gemini_model)
+        self.llm = llm_client
     
     async def analyze_face(
         self,
@@ -255,7 +254,7 @@ class GeminiService:
             # Try structured output first
             try:
                 response = await self._generate_structured_response(prompt_parts)
-                return ScanAnalysis.model_validate_json(response)
+                return ScanAnalysis.model_validate(extract_json(response, expect=dict))
             except Exception as struct_error:
                 print(f"Structured output failed, using fallback: {struct_error}")
                 return await self._analyze_face_fallback(prompt_parts)
@@ -269,11 +268,12 @@ class GeminiService:
         """Generate response with structured output config"""
         generation_config = genai.GenerationConfig(
             response_mime_type="application/json",
-            response_schema=ScanAnalysis
+            response_schema=response_schema_for(ScanAnalysis)
         )
         
-        response = self.vision_model.generate_content(
+        response = await self.llm.generate(
             prompt_parts,
+            call_name="analyze_face_structured",
             generation_config=generation_config
         )
         
@@ -286,16 +286,9 @@ class GeminiService:
             "\n\nIMPORTANT: Return ONLY valid JSON. No markdown, no explanations."
         ]
         
-        response = self.vision_model.generate_content(fallback_prompt)
+        response = await self.llm.generate(fallback_prompt, call_name="analyze_face_fallback")
         
-        # Try to parse the response
-        text = response.text.strip()
-        if text.startswith("```"):
-            text = text.split("```")[1]
-            if text.startswith("json"):
-                text = text[4:]
-        
-        return ScanAnalysis.model_validate_json(text)
+        return ScanAnalysis.model_validate(extract_json(response.text, expect=dict))
     
     def _get_default_analysis(self) -> ScanAnalysis:
         """Return a default analysis when all methods fail"""
@@ -413,8 +406,7 @@ class GeminiService:
         messages.append({"role": "user", "parts": [message]})
         
         # Generate response
-        chat = self.model.start_chat(history=messages[:-1])
-        response = chat.send_message(message)
+        response = await self.llm.send_chat(messages[:-1], message)
         
         return response.text
 
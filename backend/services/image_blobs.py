@@ -0,0 +1,129 @@
+"""
+Image Blobs - Reference counts for content-addressed scan images
+Images are stored once per SHA-256 (see storage_service.content_url); each
+scan image pointing at a stored object holds one reference in the
+`image_blobs` collection. A duplicate upload only takes a reference, and an
+object (with its renditions) is deleted when its last reference goes.
+
+A blob document moves pending -> stored -> deleting. While the last
+reference's object is being deleted the document is in `deleting` and new
+uploads of the same bytes wait for it to disappear, so a delete can never
+remove an object that a concurrent upload has just written.
+"""
+
+import asyncio
+import re
+from datetime import datetime, timedelta
+from typing import List, Optional
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from db import get_database
+
+
+CONTENT_HASH_RE = re.compile(r"/cas/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})\.\w+$")
+
+
+def content_hash(url: str) -> Optional[str]:
+    """SHA-256 of a content-addressed image URL, or None for any other URL"""
+    match = CONTENT_HASH_RE.search(url)
+    return match.group(1) if match else None
+
+
+class ImageBlobStore:
+    """Reference counting for content-addressed images"""
+
+    ACQUIRE_ATTEMPTS = 50
+    RETRY_DELAY_SECONDS = 0.05
+    # A delete that has not finished by then crashed half-way
+    STALE_DELETE_SECONDS = 60
+
+    async def acquire(self, sha256: str, url: str, size: int, content_type: str) -> Optional[str]:
+        """
+        Take a reference to an image. Returns the URL of the already stored
+        object, or None when the caller has to write it and then mark_stored.
+        """
+        db = get_database()
+        for _ in range(self.ACQUIRE_ATTEMPTS):
+            now = datetime.utcnow()
+            try:
+                before = await db.image_blobs.find_one_and_update(
+                    {"_id": sha256, "state": {"$ne": "deleting"}},
+                    {
+                        "$inc": {"refs": 1},
+                        "$set": {"updated_at": now},
+                        "$setOnInsert": {
+                            "url": url,
+                            "size": size,
+                            "content_type": content_type,
+                            "state": "pending",
+                            "created_at": now
+                        }
+                    },
+                    upsert=True,
+                    return_document=ReturnDocument.BEFORE
+                )
+            except DuplicateKeyError:
+                # The last reference is being deleted - wait until the object is gone
+                await db.image_blobs.delete_one({
+                    "_id": sha256,
+                    "state": "deleting",
+                    "updated_at": {"$lt": now - timedelta(seconds=self.STALE_DELETE_SECONDS)}
+                })
+                await asyncio.sleep(self.RETRY_DELAY_SECONDS)
+                continue
+            if before is not None and before.get("state") == "stored":
+                return before["url"]
+            return None
+        raise RuntimeError(f"Image blob {sha256} is still being deleted")
+
+    async def mark_stored(self, sha256: str) -> None:
+        """The object is written; later uploads of the same bytes skip the write"""
+        await get_database().image_blobs.update_one(
+            {"_id": sha256, "state": "pending"},
+            {"$set": {"state": "stored", "updated_at": datetime.utcnow()}}
+        )
+
+    async def release(self, sha256: str) -> Optional[dict]:
+        """
+        Drop a reference. Returns the blob document when that was the last
+        one - the caller then deletes its objects and calls forget().
+        """
+        db = get_database()
+        after = await db.image_blobs.find_one_and_update(
+            {"_id": sha256, "refs": {"$gt": 0}},
+            {"$inc": {"refs": -1}, "$set": {"updated_at": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if after is None or after["refs"] > 0:
+            return None
+        # Only one releaser (and no new reference) can win this claim
+        return await db.image_blobs.find_one_and_update(
+            {"_id": sha256, "refs": 0, "state": {"$ne": "deleting"}},
+            {"$set": {"state": "deleting", "updated_at": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def forget(self, sha256: str) -> None:
+        """Remove a blob whose objects were deleted"""
+        await get_database().image_blobs.delete_one({"_id": sha256, "state": "deleting"})
+
+    async def get_renditions(self, sha256: str) -> Optional[dict]:
+        """Renditions already generated for an image ({size: entry}), if any"""
+        blob = await get_database().image_blobs.find_one(
+            {"_id": sha256, "state": "stored"}, {"renditions": 1}
+        )
+        return blob.get("renditions") if blob else None
+
+    async def record_renditions(self, sha256: str, renditions: dict, urls: List[str]) -> None:
+        """
+        Remember an image's renditions so other scans of the same bytes reuse
+        them; `urls` are deleted along with the image
+        """
+        await get_database().image_blobs.update_one(
+            {"_id": sha256, "state": "stored"},
+            {"$set": {"renditions": renditions, "rendition_urls": urls}}
+        )
+
+
+# Singleton instance
+image_blobs = ImageBlobStore()
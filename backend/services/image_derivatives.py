@@ -0,0 +1,123 @@
+"""
+Image Derivatives - Thumbnail and medium renditions of scan photos
+After upload, each original is rendered in the image process pool into
+WebP and JPEG renditions per size, stored next to the original through
+storage_service, and recorded on the scan document under `derivatives`.
+API responses pick the rendition that fits the view and fall back to the
+original until the derivatives exist. Renditions of a content-addressed
+original are shared by every scan of the same bytes, rendered only once,
+and deleted with the original's last reference.
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Dict, Optional, Set
+from bson import ObjectId
+from config import settings
+from db import get_database
+from services.storage_service import storage_service
+from services.image_blobs import image_blobs, content_hash
+from agents.image_preprocessing import get_pool, render_derivatives
+
+
+FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+def derivative_sizes() -> Dict[str, int]:
+    return {"thumb": settings.image_thumb_edge, "medium": settings.image_medium_edge}
+
+
+def derivative_url(original_url: str, size: str, fmt: str) -> str:
+    """URL of a rendition stored next to its original: photo.jpg -> photo_thumb.webp"""
+    stem = original_url.rsplit(".", 1)[0] if "." in original_url.rsplit("/", 1)[-1] else original_url
+    return f"{stem}_{size}.{'jpg' if fmt == 'jpeg' else fmt}"
+
+
+def pick_images(scan: dict, size: str = "medium", fmt: str = "webp") -> Dict[str, str]:
+    """{view: url} at the requested size, falling back to the originals"""
+    originals = scan.get("images", {})
+    if size == "original":
+        return dict(originals)
+    derivatives = scan.get("derivatives", {})
+    return {
+        view: derivatives.get(view, {}).get(size, {}).get(fmt, url)
+        for view, url in originals.items()
+    }
+
+
+class DerivativeService:
+    """Generates scan image renditions in the background after upload"""
+
+    def __init__(self):
+        self._tasks: Set[asyncio.Task] = set()
+
+    def schedule(self, scan_id: str, images: Dict[str, str]) -> None:
+        """Generate derivatives for a new scan without delaying the upload response"""
+        if not settings.image_derivatives_enabled:
+            return
+        task = asyncio.create_task(self.generate(scan_id, images))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def generate(self, scan_id: str, images: Dict[str, str]) -> Optional[dict]:
+        """Render, store and record every rendition of a scan's images"""
+        db = get_database()
+        try:
+            derivatives = {}
+            for view, original_url in images.items():
+                sha256 = content_hash(original_url)
+                shared = await image_blobs.get_renditions(sha256) if sha256 else None
+                if shared and set(shared) == set(derivative_sizes()):
+                    derivatives[view] = shared
+            pending = {view: url for view, url in images.items() if view not in derivatives}
+
+            originals = await storage_service.get_images(list(pending.values()))
+            if not all(originals):
+                raise RuntimeError("Failed to retrieve images")
+
+            loop = asyncio.get_running_loop()
+            sizes = derivative_sizes()
+            rendered = await asyncio.gather(*(
+                loop.run_in_executor(
+                    get_pool(), render_derivatives, data, sizes,
+                    settings.image_derivative_webp_quality, settings.image_derivative_jpeg_quality
+                )
+                for data in originals
+            ))
+
+            uploads = []
+            for (view, original_url), renditions in zip(pending.items(), rendered):
+                derivatives[view] = {}
+                for size, rendition in renditions.items():
+                    entry = {"width": rendition["width"], "height": rendition["height"]}
+                    for fmt, content_type in FORMATS.items():
+                        entry[fmt] = derivative_url(original_url, size, fmt)
+                        uploads.append(storage_service.put_image(entry[fmt], rendition[fmt], content_type))
+                    derivatives[view][size] = entry
+
+            if not all(await asyncio.gather(*uploads)):
+                raise RuntimeError("Failed to store renditions")
+
+            for view, original_url in pending.items():
+                sha256 = content_hash(original_url)
+                if sha256:
+                    urls = [entry[fmt] for entry in derivatives[view].values() for fmt in FORMATS]
+                    await image_blobs.record_renditions(sha256, derivatives[view], urls)
+
+            await db.scans.update_one(
+                {"_id": ObjectId(scan_id)},
+                {"$set": {"derivatives": derivatives, "derivatives_at": datetime.utcnow()}}
+            )
+            return derivatives
+        except Exception as e:
+            print(f"Image derivative error for scan {scan_id}: {e!r}")
+            return None
+
+    async def stop(self) -> None:
+        """Cancel derivative jobs still running at shutdown"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+# Singleton instance
+image_derivatives = DerivativeService()
@@ -0,0 +1,240 @@
+"""
+JSON Extraction - Robust parsing of JSON payloads from LLM responses
+Finds the JSON value inside prose or markdown fences, repairs trailing
+commas and truncated output, and parses incrementally from a stream of
+text chunks. Well-formed responses take the json.loads fast path; the
+character scanner only runs when that fails. extract_json_checked also
+reports whether the value had to be repaired, so callers can avoid caching
+or checkpointing a result built from a cut-off reply.
+"""
+
+import json
+import re
+from typing import Any, Iterable, List, Optional, Tuple, Type
+
+
+# ```json ... ``` (or a bare ``` fence) - the language tag is not part of the payload
+FENCE_RE = re.compile(r"```[a-zA-Z]*\s*\n?(.*?)```", re.DOTALL)
+
+# Backtracking attempts when a truncated value does not close cleanly
+MAX_REPAIR_ATTEMPTS = 64
+
+CLOSERS = {"{": "}", "[": "]"}
+
+_decoder = json.JSONDecoder()
+
+
+class JSONExtractionError(ValueError):
+    """No usable JSON value could be recovered from the text"""
+
+
+class _Scanner:
+    """
+    Single-pass, string-aware scanner over a JSON value.
+    Copies characters into a repaired buffer, dropping trailing commas and
+    anything after the top-level value, and remembers positions where the
+    buffer can be cut and closed if the input turns out to be truncated.
+    """
+
+    def __init__(self, openers: str = "{["):
+        self.openers = openers
+        self.out: List[str] = []
+        self.stack: List[str] = []
+        self.in_string = False
+        self.escape = False
+        self.started = False
+        self.complete = False
+        # (buffer length, open containers) after each complete member
+        self.cut_points: List[Tuple[int, Tuple[str, ...]]] = []
+
+    def feed(self, text: str) -> None:
+        out = self.out
+        for ch in text:
+            if self.complete:
+                return
+            if not self.started:
+                if ch not in self.openers:
+                    continue
+                self.started = True
+
+            if self.in_string:
+                out.append(ch)
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+
+            if ch == '"':
+                self.in_string = True
+                out.append(ch)
+            elif ch in "{[":
+                if self.stack:
+                    # An empty nested container is a valid fallback
+                    self.cut_points.append((len(out), tuple(self.stack)))
+                self.stack.append(ch)
+                out.append(ch)
+                if len(self.stack) == 1:
+                    # So is an empty top-level one, for a reply cut off in its first member
+                    self.cut_points.append((len(out), tuple(self.stack)))
+            elif ch in "}]":
+                self._strip_trailing_comma()
+                if self.stack:
+                    self.stack.pop()
+                out.append(ch)
+                if not self.stack:
+                    self.complete = True
+                else:
+                    self.cut_points.append((len(out), tuple(self.stack)))
+            elif ch == ",":
+                self.cut_points.append((len(out), tuple(self.stack)))
+                out.append(ch)
+            else:
+                out.append(ch)
+
+    def _strip_trailing_comma(self) -> None:
+        out = self.out
+        while out and out[-1].isspace():
+            out.pop()
+        if out and out[-1] == ",":
+            out.pop()
+
+    def closed_text(self) -> Optional[str]:
+        """Buffer with open containers closed, or None if it ends mid-token"""
+        text = "".join(self.out).rstrip()
+        if self.in_string or text.endswith(":"):
+            return None
+        if text.endswith(","):
+            text = text[:-1]
+        return text + "".join(CLOSERS[c] for c in reversed(self.stack))
+
+    def value(self) -> Any:
+        """
+        Parse the repaired buffer. A truncated trailing member (half a string,
+        a key without value) is dropped by backtracking to an earlier cut point
+        rather than guessed at.
+        """
+        if not self.started:
+            raise JSONExtractionError("No JSON value found")
+        text = self.closed_text()
+        if text is not None:
+            try:
+                return json.loads(text)
+            except ValueError:
+                pass
+        for length, stack in reversed(self.cut_points[-MAX_REPAIR_ATTEMPTS:]):
+            candidate = "".join(self.out[:length]).rstrip().rstrip(",")
+            try:
+                return json.loads(candidate + "".join(CLOSERS[c] for c in reversed(stack)))
+            except ValueError:
+                continue
+        raise JSONExtractionError("Could not repair JSON value")
+
+
+def repair_json(text: str, openers: str = "{[") -> Any:
+    """Parse the first JSON value in `text`, fixing trailing commas and truncation"""
+    scanner = _Scanner(openers)
+    scanner.feed(text)
+    return scanner.value()
+
+
+def _matches(value: Any, expect: Optional[Type]) -> bool:
+    return expect is None or isinstance(value, expect)
+
+
+def extract_json(text: str, expect: Optional[Type] = None) -> Any:
+    """
+    Return the JSON payload of an LLM response.
+    `expect` (dict or list) restricts which value is accepted.
+    Raises JSONExtractionError when nothing usable is found.
+    """
+    value, _ = extract_json_checked(text, expect)
+    return value
+
+
+def extract_json_checked(text: str, expect: Optional[Type] = None) -> Tuple[Any, bool]:
+    """
+    Like extract_json, but returns (value, repaired). `repaired` is True when
+    the value was only recovered by fixing the text (truncation, trailing
+    commas) - it may be missing members the model meant to send.
+    """
+    if not text:
+        raise JSONExtractionError("Empty response")
+
+    # Fast path - the whole response is JSON
+    stripped = text.strip()
+    try:
+        value = json.loads(stripped)
+        if _matches(value, expect):
+            return value, False
+    except ValueError:
+        pass
+
+    # Prefer a fenced block when the model wrapped its answer in markdown
+    fence = FENCE_RE.search(text)
+    if fence:
+        text = fence.group(1)
+    elif "```" in text:
+        # Opening fence without a closing one - truncated response
+        text = text.split("```", 1)[1]
+
+    openers = "{" if expect is dict else "[" if expect is list else "{["
+    start = min((i for i in (text.find(c) for c in openers) if i != -1), default=-1)
+    if start == -1:
+        raise JSONExtractionError("No JSON value found")
+
+    # Well-formed value followed (or preceded) by prose
+    try:
+        value, _ = _decoder.raw_decode(text, start)
+        if _matches(value, expect):
+            return value, False
+    except ValueError:
+        pass
+
+    value = repair_json(text[start:], openers)
+    if not _matches(value, expect):
+        raise JSONExtractionError(f"Expected {expect.__name__}, got {type(value).__name__}")
+    return value, True
+
+
+class IncrementalJSONParser:
+    """
+    Parses a JSON value from streamed text chunks without rescanning.
+    `complete` turns true once the top-level value has closed; `partial()`
+    returns a best-effort value for the text received so far.
+    """
+
+    def __init__(self, expect: Optional[Type] = None):
+        self.expect = expect
+        self._scanner = _Scanner("{" if expect is dict else "[" if expect is list else "{[")
+
+    def feed(self, chunk: str) -> bool:
+        """Consume a chunk; returns True once the value is complete"""
+        self._scanner.feed(chunk)
+        return self._scanner.complete
+
+    @property
+    def complete(self) -> bool:
+        return self._scanner.complete
+
+    def partial(self) -> Any:
+        """Value parsed from the text so far, with open containers closed"""
+        return self._scanner.value()
+
+    def result(self) -> Any:
+        """Final value - repaired if the stream ended early"""
+        value = self._scanner.value()
+        if not _matches(value, self.expect):
+            raise JSONExtractionError(f"Expected {self.expect.__name__}, got {type(value).__name__}")
+        return value
+
+
+def parse_stream(chunks: Iterable[Any], expect: Optional[Type] = None) -> Any:
+    """Parse a streamed response (text chunks or SDK chunks with .text), stopping once complete"""
+    parser = IncrementalJSONParser(expect)
+    for chunk in chunks:
+        if parser.feed(chunk if isinstance(chunk, str) else chunk.text):
+            break
+    return parser.result()
@@ -0,0 +1,347 @@
+"""
+LLM Backends - Pluggable providers behind LLMClient
+`gemini` calls the real SDK. `fake` is a deterministic local stand-in with
+configurable latency distributions, failure rates and canned responses.
+`record` proxies Gemini and appends every response to a JSONL file that
+`replay` later serves back, so pipeline and chat runs are repeatable
+without an API key.
+
+Backend methods are blocking, like the SDK; LLMClient runs them on its
+executor with the usual retries, timeouts and circuit breaker.
+"""
+
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from pydantic import BaseModel
+from config import settings
+from models.scan import FaceMetrics, ImprovementSuggestion, ScanAnalysis
+
+
+BACKENDS = ("gemini", "fake", "record", "replay")
+
+
+class UsageMetadata:
+    """Token counts, shaped like the SDK's usage_metadata"""
+
+    def __init__(self, prompt_token_count: int = 0, candidates_token_count: int = 0):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class LLMResponse:
+    """Minimal stand-in for a GenerateContentResponse"""
+
+    def __init__(self, text: str, usage_metadata: Optional[UsageMetadata] = None):
+        self.text = text
+        self.usage_metadata = usage_metadata or UsageMetadata()
+
+
+class GeminiBackend:
+    """The real Gemini SDK"""
+
+    def __init__(self):
+        genai.configure(api_key=settings.gemini_api_key)
+        self._models: Dict[str, genai.GenerativeModel] = {}
+
+    def get_model(self, model_name: Optional[str] = None) -> genai.GenerativeModel:
+        """Return a cached GenerativeModel instance"""
+        name = model_name or settings.gemini_model
+        if name not in self._models:
+            self._models[name] = genai.GenerativeModel(name)
+        return self._models[name]
+
+    def generate(self, call_name: str, model_name: Optional[str], contents: Any, generation_config: Any = None) -> Any:
+        kwargs = {"generation_config": generation_config} if generation_config is not None else {}
+        return self.get_model(model_name).generate_content(contents, **kwargs)
+
+    def send_chat(self, call_name: str, model_name: Optional[str], history: list, message: str) -> Any:
+        return self.get_model(model_name).start_chat(history=history).send_message(message)
+
+
+# ============================================
+# FAKE BACKEND
+# ============================================
+
+# Exceptions raised for injected failures - classified like real SDK errors
+FAILURE_EXCEPTIONS = {
+    "rate_limited": google_exceptions.ResourceExhausted,
+    "unavailable": google_exceptions.ServiceUnavailable,
+    "timeout": google_exceptions.DeadlineExceeded,
+    "fatal": google_exceptions.InvalidArgument,
+}
+
+# Response models used to synthesize canned JSON when the profile has none
+DEFAULT_RESPONSE_MODELS: Dict[str, Any] = {
+    "analyze_face_metrics": FaceMetrics,
+    "analyze_single_shot": ScanAnalysis,
+    "analyze_face_structured": ScanAnalysis,
+    "analyze_face_fallback": ScanAnalysis,
+    "generate_improvements": [ImprovementSuggestion],
+}
+
+DEFAULT_CHAT_REPLY = "Consistency beats intensity - stick with your routine and rescan in four weeks."
+
+DEFAULT_CALL_PROFILE = {
+    "latency_ms": {"distribution": "lognormal", "median": 800, "sigma": 0.35},
+    "failure_rate": 0.0,
+    "failure": "unavailable",
+    "prompt_tokens": 1500,
+    "response_tokens": 600,
+}
+
+
+class LatencyDistribution:
+    """
+    Latency sampler built from a profile spec, in milliseconds:
+    {"distribution": "fixed", "value": 500}
+    {"distribution": "uniform", "low": 200, "high": 900}
+    {"distribution": "normal", "mean": 600, "stddev": 150}
+    {"distribution": "lognormal", "median": 800, "sigma": 0.35}
+    """
+
+    def __init__(self, spec: dict, rng: random.Random):
+        self.spec = spec
+        self.kind = spec.get("distribution", "fixed")
+        self.rng = rng
+        if self.kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {self.kind}")
+
+    def sample_ms(self) -> float:
+        spec = self.spec
+        if self.kind == "uniform":
+            value = self.rng.uniform(spec["low"], spec["high"])
+        elif self.kind == "normal":
+            value = self.rng.gauss(spec["mean"], spec.get("stddev", 0.0))
+        elif self.kind == "lognormal":
+            value = self.rng.lognormvariate(math.log(spec["median"]), spec.get("sigma", 0.0))
+        else:
+            value = spec.get("value", 0.0)
+        return max(0.0, value)
+
+
+def sample_for_schema(schema: dict, defs: Optional[dict] = None) -> Any:
+    """Deterministic value satisfying a pydantic JSON schema - numbers sit mid-range"""
+    defs = defs if defs is not None else schema.get("$defs", {})
+    if "$ref" in schema:
+        return sample_for_schema(defs[schema["$ref"].split("/")[-1]], defs)
+    if "allOf" in schema:
+        return sample_for_schema(schema["allOf"][0], defs)
+    if "anyOf" in schema:
+        options = [option for option in schema["anyOf"] if option.get("type") != "null"]
+        return sample_for_schema(options[0], defs) if options else None
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "default" in schema and schema["default"] not in (None, [], {}):
+        return schema["default"]
+
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: sample_for_schema(prop, defs) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [sample_for_schema(schema.get("items", {}), defs)]
+    if kind in ("number", "integer"):
+        low = schema.get("minimum", schema.get("exclusiveMinimum", 0))
+        high = schema.get("maximum", schema.get("exclusiveMaximum", 10))
+        value = (low + high) / 2
+        return int(value) if kind == "integer" else value
+    if kind == "boolean":
+        return True
+    if kind == "string":
+        return "sample"
+    return None
+
+
+def canned_response_for(spec: Any) -> str:
+    """Canned response text for a pydantic model or a one-item list of one"""
+    if isinstance(spec, list):
+        return json.dumps([sample_for_schema(spec[0].model_json_schema())])
+    if isinstance(spec, type) and issubclass(spec, BaseModel):
+        return json.dumps(sample_for_schema(spec.model_json_schema()))
+    return spec if isinstance(spec, str) else json.dumps(spec)
+
+
+class FakeBackend:
+    """
+    Local Gemini stand-in driven by a profile:
+    {
+      "seed": 42,
+      "default": {"latency_ms": {...}, "failure_rate": 0.02, "failure": "unavailable",
+                  "prompt_tokens": 1500, "response_tokens": 600},
+      "calls": {"chat": {"latency_ms": {...}, "response": "Hello"}, ...}
+    }
+    Per-call entries override the default; `response` may be a string or JSON value.
+    """
+
+    def __init__(self, profile: Optional[dict] = None):
+        profile = profile or {}
+        self.rng = random.Random(profile.get("seed", 0))
+        self._lock = threading.Lock()
+        default = {**DEFAULT_CALL_PROFILE, **profile.get("default", {})}
+        self.call_profiles: Dict[str, dict] = {
+            name: {**default, **overrides} for name, overrides in profile.get("calls", {}).items()
+        }
+        self.default_profile = default
+        self._latency: Dict[str, LatencyDistribution] = {}
+        self._responses: Dict[str, str] = {}
+
+    @classmethod
+    def from_file(cls, path: str) -> "FakeBackend":
+        if not path:
+            return cls()
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def _profile(self, call_name: str) -> dict:
+        return self.call_profiles.get(call_name, self.default_profile)
+
+    def _response_text(self, call_name: str) -> str:
+        if call_name not in self._responses:
+            profile = self._profile(call_name)
+            if "response" in profile:
+                text = canned_response_for(profile["response"])
+            elif call_name in DEFAULT_RESPONSE_MODELS:
+                text = canned_response_for(DEFAULT_RESPONSE_MODELS[call_name])
+            else:
+                text = DEFAULT_CHAT_REPLY
+            self._responses[call_name] = text
+        return self._responses[call_name]
+
+    def _call(self, call_name: str) -> LLMResponse:
+        profile = self._profile(call_name)
+        with self._lock:
+            if call_name not in self._latency:
+                self._latency[call_name] = LatencyDistribution(profile["latency_ms"], self.rng)
+            latency_ms = self._latency[call_name].sample_ms()
+            failed = self.rng.random() < profile["failure_rate"]
+
+        time.sleep(latency_ms / 1000)
+        if failed:
+            raise FAILURE_EXCEPTIONS[profile["failure"]](f"Injected {profile['failure']} failure for {call_name}")
+        return LLMResponse(
+            self._response_text(call_name),
+            UsageMetadata(profile["prompt_tokens"], profile["response_tokens"])
+        )
+
+    def generate(self, call_name: str, model_name: Optional[str], contents: Any, generation_config: Any = None) -> LLMResponse:
+        return self._call(call_name)
+
+    def send_chat(self, call_name: str, model_name: Optional[str], history: list, message: str) -> LLMResponse:
+        return self._call(call_name)
+
+
+# ============================================
+# RECORD / REPLAY
+# ============================================
+
+def _canonical(value: Any) -> Any:
+    """JSON-safe form of request contents - binary parts become their digest"""
+    if isinstance(value, bytes):
+        return {"sha256": hashlib.sha256(value).hexdigest()}
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def request_key(call_name: str, model_name: Optional[str], *parts: Any) -> str:
+    """Stable key for a request - call name, model and canonicalized contents"""
+    payload = json.dumps(
+        [call_name, model_name or settings.gemini_model, _canonical(list(parts))],
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class RecordingBackend:
+    """Proxies another backend and appends each response to a JSONL file"""
+
+    def __init__(self, inner: Any, path: str):
+        self.inner = inner
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _record(self, key: str, call_name: str, response: Any, latency_ms: float) -> None:
+        usage = getattr(response, "usage_metadata", None)
+        entry = {
+            "key": key,
+            "call_name": call_name,
+            "text": response.text,
+            "prompt_tokens": getattr(usage, "prompt_token_count", 0) or 0,
+            "response_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+            "latency_ms": round(latency_ms, 1),
+        }
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def generate(self, call_name: str, model_name: Optional[str], contents: Any, generation_config: Any = None) -> Any:
+        start = time.perf_counter()
+        response = self.inner.generate(call_name, model_name, contents, generation_config)
+        self._record(request_key(call_name, model_name, contents), call_name, response, (time.perf_counter() - start) * 1000)
+        return response
+
+    def send_chat(self, call_name: str, model_name: Optional[str], history: list, message: str) -> Any:
+        start = time.perf_counter()
+        response = self.inner.send_chat(call_name, model_name, history, message)
+        self._record(request_key(call_name, model_name, history, message), call_name, response, (time.perf_counter() - start) * 1000)
+        return response
+
+
+class ReplayBackend:
+    """
+    Serves responses recorded by RecordingBackend, optionally with their
+    recorded latency. Unrecorded requests raise a fatal (non-retried) error.
+    """
+
+    def __init__(self, path: str, replay_latency: bool = True):
+        self.replay_latency = replay_latency
+        self.entries: Dict[str, List[dict]] = {}
+        self._cursor: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.entries.setdefault(entry["key"], []).append(entry)
+
+    def _replay(self, key: str, call_name: str) -> LLMResponse:
+        recorded = self.entries.get(key)
+        if not recorded:
+            raise google_exceptions.InvalidArgument(f"No recorded response for {call_name} ({key[:12]})")
+        # Repeated identical requests cycle through their recordings in order
+        with self._lock:
+            index = self._cursor.get(key, 0)
+            self._cursor[key] = index + 1
+        entry = recorded[index % len(recorded)]
+        if self.replay_latency:
+            time.sleep(entry.get("latency_ms", 0) / 1000)
+        return LLMResponse(entry["text"], UsageMetadata(entry.get("prompt_tokens", 0), entry.get("response_tokens", 0)))
+
+    def generate(self, call_name: str, model_name: Optional[str], contents: Any, generation_config: Any = None) -> LLMResponse:
+        return self._replay(request_key(call_name, model_name, contents), call_name)
+
+    def send_chat(self, call_name: str, model_name: Optional[str], history: list, message: str) -> LLMResponse:
+        return self._replay(request_key(call_name, model_name, history, message), call_name)
+
+
+def create_backend(name: Optional[str] = None) -> Any:
+    """Backend configured from settings (llm_backend, llm_fake_profile, llm_recordings_path)"""
+    name = name or settings.llm_backend
+    if name == "gemini":
+        return GeminiBackend()
+    if name == "fake":
+        return FakeBackend.from_file(settings.llm_fake_profile)
+    if name == "record":
+        return RecordingBackend(GeminiBackend(), settings.llm_recordings_path)
+    if name == "replay":
+        return ReplayBackend(settings.llm_recordings_path)
+    raise ValueError(f"Unknown LLM backend: {name} (expected one of {', '.join(BACKENDS)})")
@@ -0,0 +1,206 @@
+"""
+LLM Client - Shared async layer over the synchronous Gemini SDK
+Blocking SDK calls run on a bounded thread pool behind a global
+concurrency cap, so the event loop keeps serving requests while
+LLM calls are in flight. Calls are retried per error class within a
+deadline and guarded by a circuit breaker. Per-call latency is recorded
+for monitoring. The provider itself is pluggable (see llm_backends).
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Optional, Type
+from pydantic import BaseModel
+from config import settings
+from services.metrics import metrics
+from services.llm_backends import create_backend
+from services.llm_resilience import (
+    RETRY_POLICIES, LLMUnavailableError, classify_error, create_circuit_breaker
+)
+
+
+# Keys the Gemini response Schema proto understands
+SCHEMA_KEYS = ("type", "format", "description", "nullable", "enum", "properties", "required", "items")
+
+
+def response_schema_for(model_cls: Type[BaseModel]) -> dict:
+    """
+    Convert a Pydantic model into a Gemini response_schema dict.
+    Inlines $refs, maps Optional[...] to nullable and drops JSON-schema
+    keywords (bounds, defaults, titles) the Schema proto rejects.
+    """
+    schema = model_cls.model_json_schema()
+    defs = schema.pop("$defs", {})
+
+    def convert(node: dict) -> dict:
+        if "$ref" in node:
+            node = {**defs[node["$ref"].split("/")[-1]], **{k: v for k, v in node.items() if k != "$ref"}}
+        if "allOf" in node and len(node["allOf"]) == 1:
+            node = {**convert(node["allOf"][0]), **{k: v for k, v in node.items() if k != "allOf"}}
+        if "anyOf" in node:
+            options = [option for option in node["anyOf"] if option.get("type") != "null"]
+            converted = convert(options[0])
+            if len(options) < len(node["anyOf"]):
+                converted["nullable"] = True
+            if node.get("description"):
+                converted["description"] = node["description"]
+            return converted
+
+        out = {key: node[key] for key in SCHEMA_KEYS if key in node}
+        if "enum" in out:
+            out["format"] = "enum"
+        if "properties" in out:
+            out["properties"] = {name: convert(prop) for name, prop in out["properties"].items()}
+        if "items" in out:
+            out["items"] = convert(out["items"])
+        return out
+
+    return convert(schema)
+
+
+class LLMCallStats:
+    """Running latency statistics for one call name"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_seconds = 0.0
+
+    def record(self, seconds: float, ok: bool) -> None:
+        self.count += 1
+        if not ok:
+            self.errors += 1
+        self.total_seconds += seconds
+        self.last_seconds = seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": round(self.total_seconds / self.count * 1000, 1) if self.count else 0.0,
+            "max_ms": round(self.max_seconds * 1000, 1),
+            "last_ms": round(self.last_seconds * 1000, 1)
+        }
+
+
+class LLMClient:
+    """Async Gemini client shared by the analysis pipeline and GeminiService"""
+
+    def __init__(self):
+        self.backend = create_backend()
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.llm_executor_workers,
+            thread_name_prefix="llm"
+        )
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._stats: Dict[str, LLMCallStats] = {}
+        self.in_flight = 0
+        self.breaker = create_circuit_breaker()
+        self.retry_counts: Dict[str, int] = {name: 0 for name in RETRY_POLICIES}
+        self.deadline_exceeded = 0
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        """Global concurrency cap, created lazily inside the running loop"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(settings.llm_max_concurrency)
+        return self._semaphore
+
+    def use_backend(self, backend: Any) -> None:
+        """Swap the LLM provider, e.g. for the fake or replay backend"""
+        self.backend = backend
+
+    async def _attempt(self, fn: Callable[..., Any], args: tuple, kwargs: dict, call_name: str, timeout: float) -> Any:
+        """One SDK call on the LLM executor under the concurrency cap"""
+        loop = asyncio.get_running_loop()
+        async with self.semaphore:
+            self.in_flight += 1
+            start = time.perf_counter()
+            ok = False
+            try:
+                # A timed-out call keeps its worker thread until the SDK returns
+                result = await asyncio.wait_for(
+                    loop.run_in_executor(self._executor, partial(fn, *args, **kwargs)),
+                    timeout=timeout
+                )
+                ok = True
+                metrics.record_llm_call(call_name, (time.perf_counter() - start) * 1000, result)
+                return result
+            finally:
+                self.in_flight -= 1
+                elapsed = time.perf_counter() - start
+                self._stats.setdefault(call_name, LLMCallStats()).record(elapsed, ok)
+                metrics.observe(f"llm/{call_name}", elapsed * 1000, in_trace=False)
+
+    async def run(self, fn: Callable[..., Any], *args, call_name: str = "llm", **kwargs) -> Any:
+        """
+        Run a blocking SDK call with retries, per-attempt timeout and an overall deadline.
+        Raises LLMUnavailableError without calling upstream while the breaker is open.
+        """
+        deadline = time.monotonic() + settings.llm_call_deadline_seconds
+        attempt = 0
+        while True:
+            attempt += 1
+            if not self.breaker.allow():
+                raise LLMUnavailableError(f"Gemini circuit breaker open - skipped {call_name}")
+
+            timeout = max(0.1, min(settings.llm_attempt_timeout_seconds, deadline - time.monotonic()))
+            try:
+                result = await self._attempt(fn, args, kwargs, call_name, timeout)
+            except Exception as e:
+                error_class = classify_error(e)
+                self.breaker.record_failure(error_class)
+
+                policy = RETRY_POLICIES[error_class]
+                if attempt >= policy.max_attempts:
+                    raise
+                delay = policy.delay(attempt)
+                if time.monotonic() + delay >= deadline:
+                    self.deadline_exceeded += 1
+                    raise
+                self.retry_counts[error_class] += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled mid-call: no outcome to record, but a half-open probe must not stay claimed
+                self.breaker.release_probe()
+                raise
+
+            self.breaker.record_success()
+            return result
+
+    async def generate(
+        self,
+        contents: Any,
+        call_name: str = "generate",
+        model_name: Optional[str] = None,
+        generation_config: Optional[Any] = None
+    ) -> Any:
+        """Async generate_content"""
+        return await self.run(
+            self.backend.generate, call_name, model_name, contents, generation_config, call_name=call_name
+        )
+
+    async def send_chat(self, history: list, message: str, call_name: str = "chat", model_name: Optional[str] = None) -> Any:
+        """Async chat turn on top of the given history"""
+        return await self.run(self.backend.send_chat, call_name, model_name, history, message, call_name=call_name)
+
+    def stats(self) -> dict:
+        """Latency statistics per call name, retry counts and breaker state"""
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": settings.llm_max_concurrency,
+            "calls": {name: s.to_dict() for name, s in self._stats.items()},
+            "retries": dict(self.retry_counts),
+            "deadline_exceeded": self.deadline_exceeded,
+            "circuit_breaker": self.breaker.stats()
+        }
+
+
+# Singleton instance
+llm_client = LLMClient()
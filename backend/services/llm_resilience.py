@@ -0,0 +1,127 @@
+"""
+LLM Resilience - Retry policies and circuit breaker for Gemini calls
+Errors are classified (rate limited, unavailable, timeout, fatal) and each
+class has its own jittered exponential backoff policy. A circuit breaker
+fails fast while the upstream is degraded so tail latency stays bounded.
+"""
+
+import random
+import time
+from typing import Dict, Optional
+from google.api_core import exceptions as google_exceptions
+from config import settings
+
+
+class LLMUnavailableError(RuntimeError):
+    """Raised without calling upstream while the circuit breaker is open"""
+    retryable = True
+
+
+class RetryPolicy:
+    """Backoff policy for one error class"""
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given (1-based) attempt"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+
+# Per-error-class policies - fatal errors (bad request, auth) are never retried
+RETRY_POLICIES: Dict[str, RetryPolicy] = {
+    "rate_limited": RetryPolicy(max_attempts=5, base_delay=2.0, max_delay=20.0),
+    "unavailable": RetryPolicy(max_attempts=4, base_delay=1.0, max_delay=10.0),
+    "timeout": RetryPolicy(max_attempts=2, base_delay=0.5, max_delay=2.0),
+    "fatal": RetryPolicy(max_attempts=1, base_delay=0.0, max_delay=0.0),
+}
+
+# Error classes that indicate upstream degradation and count towards the breaker
+DEGRADED_CLASSES = ("rate_limited", "unavailable", "timeout")
+
+
+def classify_error(error: BaseException) -> str:
+    """Map an exception from the SDK (or our own timeout) to an error class"""
+    if isinstance(error, (google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted)):
+        return "rate_limited"
+    if isinstance(error, (
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.InternalServerError,
+        google_exceptions.BadGateway
+    )):
+        return "unavailable"
+    if isinstance(error, (TimeoutError, google_exceptions.DeadlineExceeded, google_exceptions.GatewayTimeout)):
+        return "timeout"
+    return "fatal"
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+    closed -> open after `failure_threshold` degraded failures; after
+    `reset_seconds` one probe call is let through (half_open) and its
+    outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.open_count = 0
+        self.rejected_count = 0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream right now"""
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        self.rejected_count += 1
+        return False
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """The call was abandoned (e.g. cancelled) before an outcome - let the next one probe"""
+        self._probe_in_flight = False
+
+    def record_failure(self, error_class: str) -> None:
+        self._probe_in_flight = False
+        if error_class not in DEGRADED_CLASSES:
+            # The upstream answered - a bad request says nothing about its health
+            if self.state == "half_open":
+                self.state = "closed"
+            return
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.open_count += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "open_count": self.open_count,
+            "rejected_count": self.rejected_count
+        }
+
+
+def create_circuit_breaker() -> CircuitBreaker:
+    """Circuit breaker configured from settings"""
+    return CircuitBreaker(
+        failure_threshold=settings.llm_breaker_failure_threshold,
+        reset_seconds=settings.llm_breaker_reset_seconds
+    )
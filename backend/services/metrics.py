@@ -0,0 +1,144 @@
+"""
+Metrics - In-process latency histograms, token counters and per-scan traces
+Spans are recorded into process-wide histograms (p50/p95/p99 via bucket
+interpolation) and, when a ScanTrace is active in the current context,
+into that trace so the numbers can be stored on the scan document.
+"""
+
+import bisect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+
+# Histogram bucket upper bounds in milliseconds (roughly x1.5 steps, 1 ms - 10 min)
+BUCKET_BOUNDS_MS: List[float] = [1.0]
+while BUCKET_BOUNDS_MS[-1] < 600_000:
+    BUCKET_BOUNDS_MS.append(round(BUCKET_BOUNDS_MS[-1] * 1.5, 3))
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, pct: float) -> float:
+        """Estimate a percentile by linear interpolation inside its bucket"""
+        if not self.count:
+            return 0.0
+        target = pct / 100 * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and cumulative + bucket_count >= target:
+                lower = BUCKET_BOUNDS_MS[index - 1] if index > 0 else 0.0
+                upper = BUCKET_BOUNDS_MS[index] if index < len(BUCKET_BOUNDS_MS) else self.max_ms
+                estimate = lower + (upper - lower) * (target - cumulative) / bucket_count
+                return min(estimate, self.max_ms)
+            cumulative += bucket_count
+        return self.max_ms
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 1) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50), 1),
+            "p95_ms": round(self.percentile(95), 1),
+            "p99_ms": round(self.percentile(99), 1),
+            "max_ms": round(self.max_ms, 1)
+        }
+
+
+class ScanTrace:
+    """Timings and LLM token usage collected while analyzing one scan"""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self.llm_usage: Dict[str, dict] = {}
+
+    def add_timing(self, name: str, ms: float) -> None:
+        self.timings[name] = round(self.timings.get(name, 0.0) + ms, 1)
+
+    def add_llm_call(self, call_name: str, ms: float, prompt_tokens: int, response_tokens: int) -> None:
+        usage = self.llm_usage.setdefault(
+            call_name, {"calls": 0, "latency_ms": 0.0, "prompt_tokens": 0, "response_tokens": 0}
+        )
+        usage["calls"] += 1
+        usage["latency_ms"] = round(usage["latency_ms"] + ms, 1)
+        usage["prompt_tokens"] += prompt_tokens
+        usage["response_tokens"] += response_tokens
+
+    def to_dict(self) -> dict:
+        return {"timings": dict(self.timings), "llm_usage": dict(self.llm_usage)}
+
+
+_current_trace: ContextVar[Optional[ScanTrace]] = ContextVar("scan_trace", default=None)
+
+
+class MetricsRegistry:
+    """Process-wide histograms and token counters"""
+
+    def __init__(self):
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.tokens: Dict[str, dict] = {}
+
+    def observe(self, name: str, ms: float, in_trace: bool = True) -> None:
+        """Record a duration in the named histogram and, optionally, the active trace"""
+        self.histograms.setdefault(name, LatencyHistogram()).observe(ms)
+        trace = _current_trace.get()
+        if in_trace and trace is not None:
+            trace.add_timing(name, ms)
+
+    @contextmanager
+    def span(self, name: str):
+        """Time a block of code"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000)
+
+    def record_llm_call(self, call_name: str, ms: float, response=None) -> None:
+        """Record token usage (from Gemini usage_metadata) for a successful call"""
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        response_tokens = getattr(usage, "candidates_token_count", 0) or 0
+
+        totals = self.tokens.setdefault(call_name, {"calls": 0, "prompt_tokens": 0, "response_tokens": 0})
+        totals["calls"] += 1
+        totals["prompt_tokens"] += prompt_tokens
+        totals["response_tokens"] += response_tokens
+
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_llm_call(call_name, ms, prompt_tokens, response_tokens)
+
+    @contextmanager
+    def trace(self):
+        """Collect spans and LLM usage for everything run inside this block"""
+        scan_trace = ScanTrace()
+        token = _current_trace.set(scan_trace)
+        try:
+            yield scan_trace
+        finally:
+            _current_trace.reset(token)
+
+    def snapshot(self) -> dict:
+        return {
+            "latency": {name: h.to_dict() for name, h in sorted(self.histograms.items())},
+            "tokens": {name: dict(t) for name, t in sorted(self.tokens.items())}
+        }
+
+
+# Singleton instance
+metrics = MetricsRegistry()
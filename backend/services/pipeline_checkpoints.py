@@ -0,0 +1,69 @@
+"""
+Pipeline Checkpoints - Persist analysis pipeline progress on the scan document
+Each completed step's GraphState output (minus image bytes) is stored under
+`scans.pipeline_checkpoint`, so a retried analysis resumes from the first
+incomplete step instead of paying for every LLM call again. Checkpoints
+written by a different pipeline version are ignored.
+"""
+
+from datetime import datetime
+from typing import Iterable, Optional
+from bson import ObjectId
+from db import get_database
+
+
+# GraphState keys never persisted - raw image bytes are re-fetched on resume
+EXCLUDED_KEYS = ("front_image", "left_image", "right_image")
+
+
+class PipelineCheckpointStore:
+    """Reads and writes pipeline checkpoints on scan documents"""
+
+    async def load(self, scan_id: str, version: str) -> Optional[dict]:
+        """
+        Return {"state": ..., "completed_steps": [...]} for a matching version,
+        or None when there is no usable checkpoint.
+        """
+        try:
+            scan = await get_database().scans.find_one(
+                {"_id": ObjectId(scan_id)},
+                {"pipeline_checkpoint": 1}
+            )
+        except Exception as e:
+            print(f"Checkpoint load error: {e}")
+            return None
+
+        checkpoint = (scan or {}).get("pipeline_checkpoint")
+        if not checkpoint or checkpoint.get("version") != version:
+            return None
+        return checkpoint
+
+    async def save(self, scan_id: str, version: str, state: dict, completed_steps: Iterable[str]) -> None:
+        """Persist the current state and completed step names"""
+        persisted = {k: v for k, v in state.items() if k not in EXCLUDED_KEYS}
+        try:
+            await get_database().scans.update_one(
+                {"_id": ObjectId(scan_id)},
+                {"$set": {"pipeline_checkpoint": {
+                    "version": version,
+                    "state": persisted,
+                    "completed_steps": sorted(completed_steps),
+                    "updated_at": datetime.utcnow()
+                }}}
+            )
+        except Exception as e:
+            print(f"Checkpoint save error: {e}")
+
+    async def clear(self, scan_id: str) -> None:
+        """Drop the checkpoint once the pipeline has completed cleanly"""
+        try:
+            await get_database().scans.update_one(
+                {"_id": ObjectId(scan_id)},
+                {"$unset": {"pipeline_checkpoint": ""}}
+            )
+        except Exception as e:
+            print(f"Checkpoint clear error: {e}")
+
+
+# Singleton instance
+checkpoint_store = PipelineCheckpointStore()
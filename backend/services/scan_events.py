@@ -0,0 +1,91 @@
+"""
+Scan Events - In-process pub/sub for scan analysis progress
+Pipeline steps and queue workers publish events per scan; the SSE endpoint
+subscribes to them. Recent events are kept per scan so a client that
+connects mid-run first receives what it missed.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Optional, Set
+
+
+# Events after which no more progress is published for a scan
+TERMINAL_EVENTS = ("completed", "failed")
+
+# Events kept per scan for late subscribers, and how long after a terminal event
+HISTORY_SIZE = 32
+HISTORY_TTL_SECONDS = 60.0
+
+# History of scans with no event for this long is dropped even without a
+# terminal event (the job ran elsewhere, or died)
+IDLE_HISTORY_TTL_SECONDS = 15 * 60.0
+
+
+class ScanEventBus:
+    """Fan-out of scan progress events to subscribed queues"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._history: Dict[str, Deque[dict]] = {}
+        # Scan id -> time of its last event, oldest first
+        self._last_event: "OrderedDict[str, float]" = OrderedDict()
+
+    def publish(self, scan_id: Optional[str], event: str, data: Optional[dict] = None) -> None:
+        """Send an event to every subscriber of the scan"""
+        if not scan_id:
+            return
+        message = {"event": event, "data": {"scan_id": scan_id, **(data or {})}}
+
+        history = self._history.setdefault(scan_id, deque(maxlen=HISTORY_SIZE))
+        if event == "queued":
+            history.clear()
+        history.append(message)
+        self._touch(scan_id)
+        if event in TERMINAL_EVENTS:
+            asyncio.get_running_loop().call_later(HISTORY_TTL_SECONDS, self._expire, scan_id, message)
+
+        for queue in self._subscribers.get(scan_id, ()):
+            queue.put_nowait(message)
+
+    def _touch(self, scan_id: str) -> None:
+        """Record activity for a scan and sweep histories that went idle"""
+        now = time.monotonic()
+        self._last_event.pop(scan_id, None)
+        self._last_event[scan_id] = now
+        cutoff = now - IDLE_HISTORY_TTL_SECONDS
+        while self._last_event:
+            oldest, at = next(iter(self._last_event.items()))
+            if at >= cutoff:
+                break
+            del self._last_event[oldest]
+            self._history.pop(oldest, None)
+
+    def _expire(self, scan_id: str, terminal: dict) -> None:
+        """Drop a finished scan's history unless a newer run has started"""
+        history = self._history.get(scan_id)
+        if history and history[-1] is terminal:
+            del self._history[scan_id]
+            self._last_event.pop(scan_id, None)
+
+    @contextmanager
+    def subscribe(self, scan_id: str):
+        """Yield a queue receiving the scan's recent and future events"""
+        queue: asyncio.Queue = asyncio.Queue()
+        for message in self._history.get(scan_id, ()):
+            queue.put_nowait(message)
+        self._subscribers.setdefault(scan_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(scan_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[scan_id]
+
+
+# Singleton instance
+scan_events = ScanEventBus()
@@ -0,0 +1,140 @@
+"""
+Scan Stats - Per-user aggregates over completed scans
+One `scan_stats` document per user, updated atomically as each scan
+completes, so leaderboard improvement and scan counts are single-document
+reads instead of a rescan of the user's history.
+
+A rebuild bumps the document's `generation` and sets `rebuilding` before it
+aggregates, and only writes its totals if no newer rebuild started since.
+While `rebuilding` is set, record_scan does not $inc (the aggregate may
+already include the scan) and the caller rebuilds instead, so the two paths
+never count a scan twice.
+"""
+
+from datetime import datetime
+from typing import Optional
+from pymongo import ReturnDocument
+from db import get_database
+
+
+COMPLETED = {"processing_status": "completed", "analysis": {"$exists": True}}
+
+# Score of a completed scan: the denormalized field, or wherever older analyses stored it
+SCORE_EXPR = {"$ifNull": [
+    "$overall_score",
+    {"$ifNull": ["$analysis.overall_score", {"$ifNull": ["$analysis.metrics.overall_score", 0]}]}
+]}
+
+
+class ScanStatsStore:
+    """Atomic per-user scan aggregates in the `scan_stats` collection"""
+
+    @staticmethod
+    def improvement_percentage(stats: Optional[dict]) -> float:
+        """Change from the first to the latest scan, in percent of the first"""
+        if not stats or stats.get("count", 0) < 2:
+            return 0.0
+        first_score = stats["first"]["score"] or 0
+        latest_score = stats["latest"]["score"] or 0
+        if first_score <= 0:
+            return 0.0
+        return (latest_score - first_score) / first_score * 100
+
+    @staticmethod
+    def mean_score(stats: Optional[dict]) -> float:
+        """Running mean of all completed scan scores"""
+        if not stats or not stats.get("count"):
+            return 0.0
+        return stats["score_sum"] / stats["count"]
+
+    async def record_scan(self, user_id: str, score: float, scanned_at: datetime) -> Optional[dict]:
+        """
+        Fold one completed scan into the user's stats and return the updated document,
+        or None when the user has no stats yet or a rebuild is in flight - the caller
+        rebuilds instead.
+        `first` and `latest` are {at, score} subdocuments: BSON compares them field by
+        field, so $min/$max keep the earliest and latest scan even when scans
+        complete out of order.
+        """
+        db = get_database()
+        score = float(score or 0)
+        point = {"at": scanned_at, "score": score}
+        return await db.scan_stats.find_one_and_update(
+            {"user_id": user_id, "count": {"$exists": True}, "rebuilding": {"$ne": True}},
+            {
+                "$inc": {"count": 1, "score_sum": score},
+                "$min": {"first": point, "lowest_score": score},
+                "$max": {"latest": point, "best_score": score, "last_scan_at": scanned_at},
+                "$set": {"updated_at": datetime.utcnow()}
+            },
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def get_stats(self, user_id: str) -> Optional[dict]:
+        """The user's stats, rebuilt from their scans if they predate `scan_stats`"""
+        db = get_database()
+        stats = await db.scan_stats.find_one({"user_id": user_id})
+        if stats is None or "count" not in stats:
+            await self.rebuild(user_id)
+            stats = await db.scan_stats.find_one({"user_id": user_id})
+        # A first rebuild still running elsewhere has no totals yet
+        return stats if stats and "count" in stats else None
+
+    async def rebuild(self, user_id: Optional[str] = None) -> int:
+        """
+        Recompute stats from the scans collection - for one user, or everyone when
+        `user_id` is None. Marks the scans as counted so later completions are not
+        double counted. Returns the number of users written.
+        """
+        db = get_database()
+        if user_id is None:
+            written = 0
+            users = db.scans.aggregate([{"$match": COMPLETED}, {"$group": {"_id": "$user_id"}}])
+            async for group in users:
+                written += await self.rebuild(group["_id"])
+            return written
+
+        now = datetime.utcnow()
+        marker = await db.scan_stats.find_one_and_update(
+            {"user_id": user_id},
+            {"$inc": {"generation": 1}, "$set": {"rebuilding": True}, "$setOnInsert": {"created_at": now}},
+            projection={"generation": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        current = {"user_id": user_id, "generation": marker["generation"]}
+
+        match = {**COMPLETED, "user_id": user_id}
+        pipeline = [
+            {"$match": match},
+            {"$project": {"created_at": 1, "score": SCORE_EXPR}},
+            {"$sort": {"created_at": 1}},
+            {"$group": {
+                "_id": None,
+                "count": {"$sum": 1},
+                "score_sum": {"$sum": "$score"},
+                "lowest_score": {"$min": "$score"},
+                "best_score": {"$max": "$score"},
+                "first": {"$first": {"at": "$created_at", "score": "$score"}},
+                "latest": {"$last": {"at": "$created_at", "score": "$score"}},
+                "last_scan_at": {"$max": "$created_at"}
+            }}
+        ]
+        groups = await db.scans.aggregate(pipeline).to_list(1)
+        if not groups:
+            await db.scan_stats.delete_one(current)
+            return 0
+
+        totals = groups[0]
+        totals.pop("_id")
+        # Superseded by a newer rebuild: that one includes everything this one saw
+        result = await db.scan_stats.update_one(
+            current,
+            {"$set": {**totals, "rebuilding": False, "updated_at": datetime.utcnow()}}
+        )
+        await db.scans.update_many(match, {"$set": {"stats_recorded": True}})
+        return result.modified_count
+
+
+# Singleton instance
+scan_stats = ScanStatsStore()
@@ -1,69 +1,346 @@
 """
 Storage Service - S3 or local fallback for image storage
+boto3 is synchronous, so S3 calls run on a bounded thread pool sharing one
+pooled client, and local file I/O runs in worker threads; the event loop
+never blocks on the network or the disk. Images at other URLs are fetched
+with an app-lifetime keep-alive httpx client (HTTP/2 when h2 is installed).
+Uploaded images are content-addressed: stored once under their SHA-256 and
+reference-counted in image_blobs, so re-uploading the same photo skips the
+write and deleting one scan's copy never removes another's.
 """
 
+import asyncio
+import hashlib
+from abc import ABC, abstractmethod
+import io
 import os
-from typing import Optional
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Optional, Sequence, Tuple
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
+import httpx
+from jose import JWTError, jwt
 from config import settings
+from services.image_blobs import image_blobs, content_hash
 
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
 
-class LocalStorageService:
-    """Local file storage fallback for development/testing"""
+
+# File extension for each accepted image content type
+IMAGE_EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp"}
+
+# S3 requires every multipart part except the last to be at least 5 MiB
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+def image_filename(image_type: str, content_type: str = "image/jpeg") -> str:
+    """Unique, time-ordered filename for an uploaded image"""
+    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    unique_id = str(uuid.uuid4())[:8]
+    return f"{timestamp}_{image_type}_{unique_id}.{IMAGE_EXTENSIONS.get(content_type, 'jpg')}"
+
+
+class StorageService(ABC):
+    """Operations shared by every storage backend"""
     
-    def __init__(self):
-        self.storage_dir = os.path.join(os.path.dirname(__file__), "..", "uploads")
-        os.makedirs(self.storage_dir, exist_ok=True)
+    _http: Optional[httpx.AsyncClient] = None
+    
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """Pooled client for image URLs outside this storage, created on first use"""
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                limits=httpx.Limits(
+                    max_connections=settings.storage_http_max_connections,
+                    max_keepalive_connections=settings.storage_http_max_connections
+                ),
+                timeout=settings.storage_http_timeout_seconds,
+                follow_redirects=True
+            )
+        return self._http
+    
+    async def fetch_url(self, url: str) -> Optional[bytes]:
+        """Download an image by URL with the pooled client"""
+        try:
+            response = await self.http.get(url)
+            response.raise_for_status()
+            return response.content
+        except httpx.HTTPError as e:
+            print(f"Image fetch error: {e!r}")
+            return None
+    
+    @abstractmethod
+    async def get_image(self, key: str) -> Optional[bytes]:
+        """Image bytes by key or URL, or None if unavailable"""
+    
+    async def get_images(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        """Fetch several images concurrently, in order (None for any that failed)"""
+        return list(await asyncio.gather(*(self.get_image(key) for key in keys)))
+    
+    # URL prefix of content-addressed images, set by each backend
+    content_prefix = ""
+    
+    @abstractmethod
+    def new_image_url(self, user_id: str, image_type: str, content_type: str) -> str:
+        """Unique URL for an image whose content is not known yet (direct uploads, staging)"""
+    
+    def content_url(self, sha256: str, content_type: str) -> str:
+        """Content-addressed URL of an image: <prefix>/ab/cd/abcd....jpg"""
+        return f"{self.content_prefix}{sha256[:2]}/{sha256[2:4]}/{sha256}.{IMAGE_EXTENSIONS.get(content_type, 'jpg')}"
+    
+    @abstractmethod
+    async def open_writer(self, url: str, content_type: str):
+        """
+        Writer that streams one image into storage: write(chunk), commit() -> url,
+        abort(), and retarget(url) to change the destination before commit
+        """
+    
+    async def open_upload(self, user_id: str, image_type: str, content_type: str) -> "ContentAddressedWriter":
+        """Writer for a new image, stored under its content hash on commit"""
+        staging = await self.open_writer(self.new_image_url(user_id, image_type, content_type), content_type)
+        return ContentAddressedWriter(self, staging, content_type)
+    
+    async def store_content(
+        self,
+        sha256: str,
+        size: int,
+        content_type: str,
+        write: Callable[[str], Awaitable]
+    ) -> str:
+        """
+        Reference the image with this hash, calling `write(url)` to store it
+        only if it is not stored yet. Returns the image URL.
+        """
+        url = self.content_url(sha256, content_type)
+        existing = await image_blobs.acquire(sha256, url, size, content_type)
+        if existing is not None:
+            return existing
+        try:
+            await write(url)
+            await image_blobs.mark_stored(sha256)
+        except BaseException:
+            # Drop our reference (and the object, unless someone else holds one)
+            await self.delete_image(url)
+            raise
+        return url
     
     async def upload_image(
         self,
         image_data: bytes,
         user_id: str,
-        image_type: str = "front"
+        image_type: str = "front",
+        content_type: str = "image/jpeg"
     ) -> Optional[str]:
-        """Save image to local filesystem"""
+        """Store an image under its content hash - bytes already stored are not written again"""
+        sha256 = hashlib.sha256(image_data).hexdigest()
         try:
-            # Create user directory
-            user_dir = os.path.join(self.storage_dir, user_id)
-            os.makedirs(user_dir, exist_ok=True)
-            
-            # Generate unique filename
-            timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-            unique_id = str(uuid.uuid4())[:8]
-            filename = f"{timestamp}_{image_type}_{unique_id}.jpg"
-            filepath = os.path.join(user_dir, filename)
-            
-            # Write file
-            with open(filepath, "wb") as f:
-                f.write(image_data)
-            
-            # Return a local URL (relative path)
-            return f"/uploads/{user_id}/{filename}"
-            
+            return await self.store_content(
+                sha256, len(image_data), content_type,
+                lambda url: self._write_bytes(url, image_data, content_type)
+            )
         except Exception as e:
-            print(f"Local storage error: {e}")
+            print(f"Storage upload error: {e!r}")
             return None
     
+    async def _write_bytes(self, url: str, data: bytes, content_type: str) -> None:
+        writer = await self.open_writer(url, content_type)
+        try:
+            await writer.write(data)
+        except BaseException:
+            await writer.abort()
+            raise
+        await writer.commit()
+    
+    @abstractmethod
+    def create_upload_target(self, url: str, content_type: str, max_bytes: int, upload_id: str) -> dict:
+        """Where and how a client uploads an image directly: {method, url, fields | headers}"""
+    
+    def sealed_url(self, url: str) -> str:
+        """Where a verified direct upload is moved - no upload target is ever issued for it"""
+        head, name = url.rsplit("/", 1)
+        return f"{head}/sealed/{name}"
+    
+    @abstractmethod
+    async def seal_image(self, url: str) -> Optional[str]:
+        """
+        Move a directly uploaded image out of the client's reach, to sealed_url.
+        Idempotent; returns the sealed URL, or None if neither copy exists.
+        """
+    
+    def verify_upload_token(self, token: str) -> Optional[dict]:
+        """Claims of a local upload token - only local storage issues them"""
+        return None
+    
+    @abstractmethod
+    async def probe_image(self, url: str, head_bytes: int) -> Optional[Tuple[int, bytes]]:
+        """(size, first bytes) of a stored image, or None if it does not exist"""
+    
+    async def put_image(self, url: str, data: bytes, content_type: str) -> bool:
+        """Store bytes at a URL chosen by the caller (e.g. a rendition next to its original)"""
+        try:
+            await self._write_bytes(url, data, content_type)
+            return True
+        except Exception as e:
+            print(f"Storage put error: {e!r}")
+            return False
+    
+    @abstractmethod
+    async def delete_object(self, url: str) -> bool:
+        """Delete the object at a URL unconditionally"""
+    
+    async def delete_image(self, url: str) -> bool:
+        """
+        Delete an image. Content-addressed images only lose a reference; the
+        object and its renditions go once no scan references them.
+        """
+        sha256 = content_hash(url)
+        if sha256 is None:
+            return await self.delete_object(url)
+        try:
+            blob = await image_blobs.release(sha256)
+        except Exception as e:
+            print(f"Image release error: {e!r}")
+            return False
+        if blob is None:
+            return True
+        try:
+            urls = [blob["url"], *blob.get("rendition_urls", [])]
+            return all(await asyncio.gather(*(self.delete_object(u) for u in urls)))
+        finally:
+            await image_blobs.forget(sha256)
+    
+    async def close(self) -> None:
+        """Release pooled resources on shutdown"""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+
+class LocalStorageService(StorageService):
+    """
+    Local file storage for development and single-node deployments.
+    Uploaded images live under uploads/cas/<aa>/<bb>/<sha256>.<ext>; direct
+    uploads and staging files under uploads/<aa>/<bb>/<user_id>/, sharded by
+    a hash of the user id. Either way no directory grows unbounded. Writes go to a temp file that is
+    fsynced and renamed into place, so readers never see a partial image.
+    All disk I/O runs in worker threads.
+    """
+    
+    def __init__(self):
+        self.storage_dir = os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "uploads"))
+        os.makedirs(self.storage_dir, exist_ok=True)
+        self.content_prefix = "/uploads/cas/"
+    
+    @staticmethod
+    def _user_prefix(user_id: str) -> str:
+        digest = hashlib.sha1(user_id.encode()).hexdigest()
+        return f"{digest[:2]}/{digest[2:4]}/{user_id}"
+    
+    def _path(self, url: str) -> str:
+        """Filesystem path for an /uploads/ URL; refuses paths outside the storage directory"""
+        relative = url[len("/uploads/"):] if url.startswith("/uploads/") else url
+        path = os.path.realpath(os.path.join(self.storage_dir, relative))
+        if not path.startswith(self.storage_dir + os.sep):
+            raise ValueError(f"Invalid upload path: {url}")
+        return path
+    
+    def new_image_url(self, user_id: str, image_type: str, content_type: str) -> str:
+        return f"/uploads/{self._user_prefix(user_id)}/{image_filename(image_type, content_type)}"
+    
+    async def open_writer(self, url: str, content_type: str) -> "LocalUploadWriter":
+        writer = LocalUploadWriter(self, url)
+        await writer.open()
+        return writer
+    
+    def create_upload_target(self, url: str, content_type: str, max_bytes: int, upload_id: str) -> dict:
+        """Stand-in for a presigned PUT: a signed token for the local upload endpoint"""
+        token = jwt.encode(
+            {
+                "type": "scan_upload",
+                "upload_id": upload_id,
+                "url": url,
+                "content_type": content_type,
+                "max_bytes": max_bytes,
+                "exp": datetime.utcnow() + timedelta(seconds=settings.upload_url_expire_seconds)
+            },
+            settings.jwt_secret_key,
+            algorithm=settings.jwt_algorithm
+        )
+        return {"method": "PUT", "url": f"/api/scans/uploads/local/{token}", "headers": {"Content-Type": content_type}}
+    
+    def verify_upload_token(self, token: str) -> Optional[dict]:
+        """Claims of a token issued by create_upload_target, or None if invalid or expired"""
+        try:
+            claims = jwt.decode(token, settings.jwt_secret_key, algorithms=[settings.jwt_algorithm])
+        except JWTError:
+            return None
+        return claims if claims.get("type") == "scan_upload" else None
+    
+    async def stat_file(self, url: str) -> Optional[Tuple[str, os.stat_result]]:
+        """(path, stat) of a stored file, or None if it does not exist"""
+        def stat():
+            path = self._path(url)
+            try:
+                info = os.stat(path)
+            except FileNotFoundError:
+                return None
+            return (path, info) if os.path.isfile(path) else None
+        return await asyncio.to_thread(stat)
+    
+    async def seal_image(self, url: str) -> Optional[str]:
+        sealed = self.sealed_url(url)
+        
+        def move():
+            source, target = self._path(url), self._path(sealed)
+            if os.path.isfile(source):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(source, target)
+            return sealed if os.path.isfile(target) else None
+        return await asyncio.to_thread(move)
+    
+    async def probe_image(self, url: str, head_bytes: int) -> Optional[Tuple[int, bytes]]:
+        def probe():
+            path = self._path(url)
+            if not os.path.isfile(path):
+                return None
+            with open(path, "rb") as f:
+                return os.fstat(f.fileno()).st_size, f.read(head_bytes)
+        return await asyncio.to_thread(probe)
+    
     async def get_image(self, key: str) -> Optional[bytes]:
         """Read image from local filesystem"""
-        try:
+        if not key.startswith("/uploads/"):
+            return await self.fetch_url(key)
+        
+        def read():
             # Convert URL path to file path
-            filepath = os.path.join(self.storage_dir, key.replace("/uploads/", ""))
+            filepath = self._path(key)
             if os.path.exists(filepath):
                 with open(filepath, "rb") as f:
                     return f.read()
             return None
+        
+        try:
+            return await asyncio.to_thread(read)
         except Exception as e:
             print(f"Local read error: {e}")
             return None
     
-    async def delete_image(self, key: str) -> bool:
+    async def delete_object(self, key: str) -> bool:
         """Delete image from local filesystem"""
-        try:
-            filepath = os.path.join(self.storage_dir, key.replace("/uploads/", ""))
+        def delete():
+            filepath = self._path(key)
             if os.path.exists(filepath):
                 os.remove(filepath)
+        
+        try:
+            await asyncio.to_thread(delete)
             return True
         except Exception as e:
             print(f"Local delete error: {e}")
@@ -74,70 +351,139 @@ class LocalStorageService:
         return key
 
 
-class S3StorageService:
+class S3StorageService(StorageService):
     """AWS S3 storage for production"""
     
     def __init__(self):
         import boto3
-        from botocore.exceptions import ClientError
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
+        from botocore.exceptions import BotoCoreError, ClientError
         self.ClientError = ClientError
+        self.errors = (BotoCoreError, ClientError, asyncio.TimeoutError)
         
+        # boto3 clients are thread-safe; one client shares its connection pool across workers
         self.s3_client = boto3.client(
             "s3",
             aws_access_key_id=settings.aws_access_key_id,
             aws_secret_access_key=settings.aws_secret_access_key,
-            region_name=settings.aws_s3_region
+            region_name=settings.aws_s3_region,
+            config=Config(
+                max_pool_connections=settings.s3_max_concurrency,
+                connect_timeout=settings.s3_connect_timeout_seconds,
+                read_timeout=settings.s3_read_timeout_seconds,
+                retries={"max_attempts": 3, "mode": "standard"}
+            )
         )
         self.bucket = settings.aws_s3_bucket
+        self.base_url = f"https://{self.bucket}.s3.{settings.aws_s3_region}.amazonaws.com/"
+        self.content_prefix = f"{self.base_url}scans/cas/"
+        self.multipart_threshold = settings.s3_multipart_threshold_mb * 1024 * 1024
+        self.transfer_config = TransferConfig(
+            multipart_threshold=self.multipart_threshold,
+            multipart_chunksize=settings.s3_multipart_chunk_mb * 1024 * 1024,
+            max_concurrency=4
+        )
+        self._executor = ThreadPoolExecutor(max_workers=settings.s3_max_concurrency, thread_name_prefix="s3")
     
-    async def upload_image(
-        self,
-        image_data: bytes,
-        user_id: str,
-        image_type: str = "front"
-    ) -> Optional[str]:
-        """Upload an image to S3"""
+    async def _run(self, fn, *args, **kwargs):
+        """Run a blocking boto3 call on the S3 thread pool, bounded by the operation timeout"""
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(
+            loop.run_in_executor(self._executor, lambda: fn(*args, **kwargs)),
+            timeout=settings.s3_operation_timeout_seconds
+        )
+    
+    def _put(self, key: str, image_data: bytes, content_type: str = "image/jpeg") -> None:
+        """Single PUT for typical photos, multipart for large bodies"""
+        if len(image_data) < self.multipart_threshold:
+            self.s3_client.put_object(Bucket=self.bucket, Key=key, Body=image_data, ContentType=content_type)
+        else:
+            self.s3_client.upload_fileobj(
+                io.BytesIO(image_data), self.bucket, key,
+                ExtraArgs={"ContentType": content_type},
+                Config=self.transfer_config
+            )
+    
+    async def _write_bytes(self, url: str, data: bytes, content_type: str) -> None:
+        await self._run(self._put, self._key(url), data, content_type)
+    
+    def new_image_url(self, user_id: str, image_type: str, content_type: str) -> str:
+        return f"{self.base_url}scans/{user_id}/{image_filename(image_type, content_type)}"
+    
+    async def open_writer(self, url: str, content_type: str) -> "S3UploadWriter":
+        return S3UploadWriter(self, self._key(url), content_type)
+    
+    def create_upload_target(self, url: str, content_type: str, max_bytes: int, upload_id: str) -> dict:
+        """Presigned POST - S3 enforces the content type and size range itself"""
+        post = self.s3_client.generate_presigned_post(
+            Bucket=self.bucket,
+            Key=self._key(url),
+            Fields={"Content-Type": content_type},
+            Conditions=[{"Content-Type": content_type}, ["content-length-range", 1, max_bytes]],
+            ExpiresIn=settings.upload_url_expire_seconds
+        )
+        return {"method": "POST", "url": post["url"], "fields": post["fields"]}
+    
+    async def seal_image(self, url: str) -> Optional[str]:
+        """Server-side copy to the sealed key - the POST policy only covers the original one"""
+        sealed = self.sealed_url(url)
         try:
-            timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-            unique_id = str(uuid.uuid4())[:8]
-            key = f"scans/{user_id}/{timestamp}_{image_type}_{unique_id}.jpg"
-            
-            self.s3_client.put_object(
-                Bucket=self.bucket,
-                Key=key,
-                Body=image_data,
-                ContentType="image/jpeg"
+            await self._run(
+                self.s3_client.copy_object, Bucket=self.bucket, Key=self._key(sealed),
+                CopySource={"Bucket": self.bucket, "Key": self._key(url)}
             )
-            
-            url = f"https://{self.bucket}.s3.{settings.aws_s3_region}.amazonaws.com/{key}"
-            return url
-            
         except self.ClientError as e:
-            print(f"S3 upload error: {e}")
-            return None
+            if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+                raise
+            # Sealed by an earlier finalize attempt, or never uploaded
+            return sealed if await self.probe_image(sealed, 1) else None
+        await self.delete_object(url)
+        return sealed
+    
+    async def probe_image(self, url: str, head_bytes: int) -> Optional[Tuple[int, bytes]]:
+        def probe():
+            try:
+                response = self.s3_client.get_object(
+                    Bucket=self.bucket, Key=self._key(url), Range=f"bytes=0-{head_bytes - 1}"
+                )
+            except self.ClientError as e:
+                if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404", "InvalidRange"):
+                    return None
+                raise
+            # Content-Range is "bytes 0-11/<total size>"
+            total = re.search(r"/(\d+)$", response.get("ContentRange", ""))
+            return (int(total.group(1)) if total else response["ContentLength"]), response["Body"].read()
+        return await self._run(probe)
+    
+    def _key(self, key: str) -> str:
+        """Object key for either a key or the public URL returned by upload_image"""
+        return key[len(self.base_url):] if key.startswith(self.base_url) else key
+    
+    async def close(self) -> None:
+        await super().close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
     
     async def get_image(self, key: str) -> Optional[bytes]:
-        """Download an image from S3"""
+        """Download an image from S3 (or any other URL with the pooled HTTP client)"""
+        if key.startswith(("http://", "https://")) and not key.startswith(self.base_url):
+            return await self.fetch_url(key)
         try:
-            response = self.s3_client.get_object(
-                Bucket=self.bucket,
-                Key=key
-            )
-            return response["Body"].read()
-        except self.ClientError as e:
-            print(f"S3 download error: {e}")
+            def download():
+                response = self.s3_client.get_object(Bucket=self.bucket, Key=self._key(key))
+                return response["Body"].read()
+            return await self._run(download)
+        except self.errors as e:
+            print(f"S3 download error: {e!r}")
             return None
     
-    async def delete_image(self, key: str) -> bool:
+    async def delete_object(self, key: str) -> bool:
         """Delete an image from S3"""
         try:
-            self.s3_client.delete_object(
-                Bucket=self.bucket,
-                Key=key
-            )
+            await self._run(self.s3_client.delete_object, Bucket=self.bucket, Key=self._key(key))
             return True
-        except self.ClientError as e:
-            print(f"S3 delete error: {e}")
+        except self.errors as e:
+            print(f"S3 delete error: {e!r}")
             return False
     
     def get_presigned_url(self, key: str, expiration: int = 3600) -> Optional[str]:
@@ -145,7 +491,7 @@ class S3StorageService:
         try:
             url = self.s3_client.generate_presigned_url(
                 "get_object",
-                Params={"Bucket": self.bucket, "Key": key},
+                Params={"Bucket": self.bucket, "Key": self._key(key)},
                 ExpiresIn=expiration
             )
             return url
@@ -154,6 +500,185 @@ class S3StorageService:
             return None
 
 
+class LocalUploadWriter:
+    """Streams chunks to a temporary file that is renamed into place on commit"""
+    
+    def __init__(self, storage: LocalStorageService, url: str):
+        self.storage = storage
+        self.path = storage._path(url)
+        self.url = url
+        self.temp_path = f"{self.path}.{uuid.uuid4().hex[:8]}.part"
+        self._file = None
+    
+    async def open(self) -> None:
+        def _open():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            return open(self.temp_path, "wb")
+        self._file = await asyncio.to_thread(_open)
+    
+    async def write(self, chunk: bytes) -> None:
+        await asyncio.to_thread(self._file.write, chunk)
+    
+    def retarget(self, url: str) -> None:
+        """Commit under another URL - the temp file is renamed there instead"""
+        self.path = self.storage._path(url)
+        self.url = url
+    
+    async def commit(self) -> str:
+        def _commit():
+            # Durable before it becomes visible under its final name
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            os.replace(self.temp_path, self.path)
+        await asyncio.to_thread(_commit)
+        return self.url
+    
+    async def abort(self) -> None:
+        def _abort():
+            self._file.close()
+            if os.path.exists(self.temp_path):
+                os.remove(self.temp_path)
+        await asyncio.to_thread(_abort)
+
+
+class S3UploadWriter:
+    """
+    Streams chunks to S3. Bodies smaller than one part are sent with a single
+    PUT on commit; larger ones become a multipart upload whose parts are sent
+    in the background (at most two in flight) while the request keeps streaming.
+    A multipart upload retargeted after it started is completed under its
+    original key and then copied server-side to the new one.
+    """
+    
+    MAX_PARTS_IN_FLIGHT = 2
+    
+    def __init__(self, storage: "S3StorageService", key: str, content_type: str):
+        self.storage = storage
+        self.key = key
+        self.target_key = key
+        self.content_type = content_type
+        self.part_size = max(S3_MIN_PART_SIZE, settings.s3_multipart_chunk_mb * 1024 * 1024)
+        self.buffer = bytearray()
+        self.upload_id: Optional[str] = None
+        self.parts: list = []
+        self._in_flight: list = []
+    
+    async def write(self, chunk: bytes) -> None:
+        self.buffer += chunk
+        if len(self.buffer) >= self.part_size:
+            await self._send_part()
+    
+    async def _send_part(self) -> None:
+        s3 = self.storage.s3_client
+        if self.upload_id is None:
+            response = await self.storage._run(
+                s3.create_multipart_upload, Bucket=self.storage.bucket, Key=self.key, ContentType=self.content_type
+            )
+            self.upload_id = response["UploadId"]
+        
+        body, self.buffer = bytes(self.buffer), bytearray()
+        part_number = len(self.parts) + len(self._in_flight) + 1
+        
+        async def upload_part():
+            response = await self.storage._run(
+                s3.upload_part, Bucket=self.storage.bucket, Key=self.key,
+                UploadId=self.upload_id, PartNumber=part_number, Body=body
+            )
+            return {"PartNumber": part_number, "ETag": response["ETag"]}
+        
+        self._in_flight.append(asyncio.create_task(upload_part()))
+        if len(self._in_flight) >= self.MAX_PARTS_IN_FLIGHT:
+            self.parts.append(await self._in_flight.pop(0))
+    
+    def retarget(self, url: str) -> None:
+        """Commit under another URL"""
+        self.target_key = self.storage._key(url)
+    
+    async def commit(self) -> str:
+        s3 = self.storage.s3_client
+        if self.upload_id is None:
+            await self.storage._run(
+                s3.put_object, Bucket=self.storage.bucket, Key=self.target_key,
+                Body=bytes(self.buffer), ContentType=self.content_type
+            )
+        else:
+            if self.buffer:
+                await self._send_part()
+            self.parts.extend(await asyncio.gather(*self._in_flight))
+            self._in_flight = []
+            await self.storage._run(
+                s3.complete_multipart_upload, Bucket=self.storage.bucket, Key=self.key,
+                UploadId=self.upload_id, MultipartUpload={"Parts": sorted(self.parts, key=lambda p: p["PartNumber"])}
+            )
+            if self.target_key != self.key:
+                await self.storage._run(
+                    s3.copy_object, Bucket=self.storage.bucket, Key=self.target_key,
+                    CopySource={"Bucket": self.storage.bucket, "Key": self.key}
+                )
+                await self.storage.delete_object(self.key)
+        return self.storage.base_url + self.target_key
+    
+    async def abort(self) -> None:
+        for task in self._in_flight:
+            task.cancel()
+        await asyncio.gather(*self._in_flight, return_exceptions=True)
+        self.buffer = bytearray()
+        if self.upload_id is not None:
+            try:
+                await self.storage._run(
+                    self.storage.s3_client.abort_multipart_upload,
+                    Bucket=self.storage.bucket, Key=self.key, UploadId=self.upload_id
+                )
+            except self.storage.errors as e:
+                print(f"S3 abort error: {e!r}")
+
+
+class ContentAddressedWriter:
+    """
+    Hashes an image while it streams into a staging writer, then commits it
+    under its SHA-256. If the same bytes are already stored, the staged copy
+    is dropped and the existing object is referenced instead.
+    """
+    
+    def __init__(self, storage: StorageService, staging, content_type: str):
+        self.storage = storage
+        self.staging = staging
+        self.content_type = content_type
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        # Set on commit - callers use it instead of hashing the bytes again
+        self.sha256: Optional[str] = None
+        self._committed = False
+    
+    async def write(self, chunk: bytes) -> None:
+        self.hasher.update(chunk)
+        self.size += len(chunk)
+        await self.staging.write(chunk)
+    
+    async def commit(self) -> str:
+        async def write(url: str) -> None:
+            self.staging.retarget(url)
+            await self.staging.commit()
+            self._committed = True
+        
+        self.sha256 = self.hasher.hexdigest()
+        try:
+            url = await self.storage.store_content(self.sha256, self.size, self.content_type, write)
+        except BaseException:
+            await self.abort()
+            raise
+        if not self._committed:
+            # Duplicate of a stored image - nothing of ours needs to be kept
+            await self.staging.abort()
+        return url
+    
+    async def abort(self) -> None:
+        if not self._committed:
+            await self.staging.abort()
+
+
 def create_storage_service():
     """
     Factory function to create appropriate storage service.
@@ -173,4 +698,3 @@ def create_storage_service():
 
 # Singleton instance - automatically picks the right storage
 storage_service = create_storage_service()
-
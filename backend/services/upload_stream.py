@@ -0,0 +1,264 @@
+"""
+Upload Stream - Streams multipart scan uploads straight into storage
+The request body is parsed chunk by chunk and each image part is piped to
+a storage writer (local temp file or S3 multipart) as it arrives, so at
+most one network chunk plus one S3 part per image is held in memory.
+Per-image and per-request limits are enforced while streaming, and parts
+that are not JPEG, PNG or WebP are rejected from their first bytes. Scan
+images are hashed once, by the content-addressed writer that stores them.
+"""
+
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+from config import settings
+from services.storage_service import storage_service
+
+
+SCAN_IMAGE_FIELDS = ("front", "left", "right")
+
+# Bytes needed to recognise every accepted format
+SNIFF_BYTES = 12
+
+# Part content types accepted before sniffing (clients often send octet-stream)
+ALLOWED_PART_TYPES = ("image/", "application/octet-stream")
+
+
+class UploadRejected(Exception):
+    """The upload is invalid; carries the HTTP status to answer with"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class UploadedImage:
+    """One stored image from a streamed upload"""
+    url: str
+    # Hash the content-addressed writer stored the image under (None for raw writers)
+    sha256: Optional[str]
+    size: int
+    content_type: str
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Content type from an image's magic bytes, or None if not an accepted format"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+class _ImagePart:
+    """
+    One image: sniffs and counts bytes on their way to storage.
+    `open_writer(content_type)` opens the storage writer once the format is known.
+    """
+
+    def __init__(self, name: str, max_bytes: int, open_writer: Callable[[str], Awaitable]):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.open_writer = open_writer
+        self.size = 0
+        self.head = b""
+        self.content_type: Optional[str] = None
+        self.writer = None
+
+    async def write(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadRejected(413, f"Image '{self.name}' exceeds {self.max_bytes // (1024 * 1024)} MB")
+        if self.writer is None:
+            # Hold the first bytes until the format is known - nothing is stored before that
+            self.head += chunk
+            if len(self.head) < SNIFF_BYTES:
+                return
+            await self._open()
+            chunk, self.head = self.head, b""
+        await self.writer.write(chunk)
+
+    async def _open(self) -> None:
+        self.content_type = sniff_image_type(self.head)
+        if self.content_type is None:
+            raise UploadRejected(415, f"Image '{self.name}' must be a JPEG, PNG or WebP file")
+        self.writer = await self.open_writer(self.content_type)
+
+    async def finish(self) -> UploadedImage:
+        if self.writer is None:
+            if not self.head:
+                raise UploadRejected(400, f"Image '{self.name}' is empty")
+            await self._open()
+            await self.writer.write(self.head)
+        url = await self.writer.commit()
+        sha256 = getattr(self.writer, "sha256", None)
+        return UploadedImage(url=url, sha256=sha256, size=self.size, content_type=self.content_type)
+
+    async def abort(self) -> None:
+        if self.writer is not None:
+            await self.writer.abort()
+
+
+class _PartEvents:
+    """
+    MultipartParser callbacks. The parser is synchronous, so callbacks only
+    record events; the async side drains them after each chunk.
+    """
+
+    def __init__(self):
+        self.events: List[Tuple[str, object]] = []
+        self.header_field = b""
+        self.header_value = b""
+        self.headers: Dict[bytes, bytes] = {}
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": lambda: self.events.append(("headers", self.headers)),
+            "on_part_data": lambda data, start, end: self.events.append(("data", data[start:end])),
+            "on_part_end": lambda: self.events.append(("end", None)),
+        }
+
+    def on_part_begin(self) -> None:
+        self.headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self.header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self.header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        self.headers[self.header_field.lower()] = self.header_value
+        self.header_field = b""
+        self.header_value = b""
+
+
+def _check_request_headers(request: Request) -> bytes:
+    """Multipart boundary, after rejecting oversized or non-multipart requests up front"""
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise UploadRejected(415, "Expected a multipart/form-data upload")
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > settings.upload_max_request_mb * 1024 * 1024:
+        raise UploadRejected(413, f"Upload exceeds {settings.upload_max_request_mb} MB")
+    return options[b"boundary"]
+
+
+def _open_part(headers: Dict[bytes, bytes], fields: Sequence[str], parts: Dict[str, "_ImagePart"], user_id: str) -> Optional[_ImagePart]:
+    """Image part for these part headers, or None for fields that are not scan images"""
+    _, disposition = parse_options_header(headers.get(b"content-disposition", b""))
+    name = disposition.get(b"name", b"").decode("latin-1")
+    if name not in fields:
+        return None
+    if name in parts:
+        raise UploadRejected(400, f"Image '{name}' was sent more than once")
+    if b"filename" not in disposition:
+        raise UploadRejected(400, f"'{name}' must be a file")
+
+    declared = headers.get(b"content-type", b"application/octet-stream").decode("latin-1").lower()
+    if not declared.startswith(ALLOWED_PART_TYPES):
+        raise UploadRejected(415, f"Image '{name}' must be an image, got {declared}")
+
+    part = _ImagePart(
+        name,
+        settings.upload_max_image_mb * 1024 * 1024,
+        lambda content_type: storage_service.open_upload(user_id, name, content_type)
+    )
+    parts[name] = part
+    return part
+
+
+async def stream_scan_upload(request: Request, user_id: str, fields: Sequence[str] = SCAN_IMAGE_FIELDS) -> Dict[str, UploadedImage]:
+    """
+    Stream the request's image parts into storage.
+    Returns {field: UploadedImage} for every field, or raises UploadRejected
+    after removing anything already written.
+    """
+    boundary = _check_request_headers(request)
+    max_request_bytes = settings.upload_max_request_mb * 1024 * 1024
+
+    events = _PartEvents()
+    parser = MultipartParser(boundary, events.callbacks())
+    parts: Dict[str, _ImagePart] = {}
+    finishing: Dict[str, asyncio.Task] = {}
+    current: Optional[_ImagePart] = None
+    received = 0
+
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_request_bytes:
+                raise UploadRejected(413, f"Upload exceeds {settings.upload_max_request_mb} MB")
+            parser.write(chunk)
+
+            for kind, value in events.events:
+                if kind == "headers":
+                    current = _open_part(value, fields, parts, user_id)
+                elif kind == "data" and current is not None:
+                    await current.write(value)
+                elif kind == "end" and current is not None:
+                    # Commit in the background so the next part keeps streaming
+                    finishing[current.name] = asyncio.create_task(current.finish())
+                    current = None
+            events.events.clear()
+        parser.finalize()
+
+        missing = [name for name in fields if name not in finishing]
+        if missing:
+            raise UploadRejected(400, f"Missing images: {', '.join(missing)}")
+
+        results = await asyncio.gather(*finishing.values())
+        return dict(zip(finishing, results))
+
+    except BaseException as e:
+        await _discard(parts, finishing)
+        if isinstance(e, (UploadRejected, asyncio.CancelledError)):
+            raise
+        print(f"Streaming upload error: {e!r}")
+        raise UploadRejected(500, "Failed to upload images") from e
+
+
+async def stream_image_body(request: Request, name: str, max_bytes: int, open_writer: Callable[[str], Awaitable]) -> UploadedImage:
+    """Stream a raw (non-multipart) request body holding one image into storage"""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise UploadRejected(413, f"Image '{name}' exceeds {max_bytes // (1024 * 1024)} MB")
+
+    part = _ImagePart(name, max_bytes, open_writer)
+    try:
+        async for chunk in request.stream():
+            await part.write(chunk)
+        return await part.finish()
+    except BaseException as e:
+        try:
+            await part.abort()
+        except Exception as cleanup_error:
+            print(f"Upload cleanup error: {cleanup_error!r}")
+        if isinstance(e, (UploadRejected, asyncio.CancelledError)):
+            raise
+        print(f"Streaming upload error: {e!r}")
+        raise UploadRejected(500, "Failed to upload image") from e
+
+
+async def _discard(parts: Dict[str, _ImagePart], finishing: Dict[str, asyncio.Task]) -> None:
+    """Abort unfinished writers and delete images that were already committed"""
+    results = dict(zip(finishing, await asyncio.gather(*finishing.values(), return_exceptions=True)))
+    for name, part in parts.items():
+        try:
+            if isinstance(results.get(name), UploadedImage):
+                await storage_service.delete_image(results[name].url)
+            else:
+                await part.abort()
+        except Exception as e:
+            print(f"Upload cleanup error: {e!r}")
@@ -106,10 +106,29 @@ class ApiService {
     }
 
     async analyzeScan(scanId: string) {
-        const response = await this.client.post(`/scans/${scanId}/analyze`);
+        await this.client.post(`/scans/${scanId}/analyze`);
+        // Analysis runs in a background job - poll until it finishes
+        return await this.waitForScan(scanId);
+    }
+
+    async getScanStatus(scanId: string) {
+        const response = await this.client.get(`/scans/${scanId}/status`);
         return response.data;
     }
 
+    async waitForScan(scanId: string, intervalMs = 2000, timeoutMs = 180000) {
+        const deadline = Date.now() + timeoutMs;
+        while (Date.now() < deadline) {
+            const status = await this.getScanStatus(scanId);
+            if (status.processing_status === 'completed') return status;
+            if (status.processing_status === 'failed') {
+                throw new Error(status.error_message || 'Analysis failed');
+            }
+            await new Promise(resolve => setTimeout(resolve, intervalMs));
+        }
+        throw new Error('Analysis timed out');
+    }
+
     async getLatestScan() {
         const response = await this.client.get('/scans/latest');
         return response.data;